@@ -0,0 +1,126 @@
+"""
+Image webhook throughput with Firebase calls inline vs. on the Firebase executor.
+
+Each webhook is a distinct partner sending one image through the real
+``process_message`` path: partner lookup, hash check, streamed download and
+Storage upload, URL, metadata write and the album confirmation. Firestore and
+Storage are the load-test fakes, whose calls block with ``time.sleep`` like
+the firebase_admin SDK does.
+
+``inline`` replaces ``run_blocking`` with a direct call, so every SDK call
+blocks the event loop as it did before the executor was introduced;
+``executor`` runs them on FIREBASE_EXECUTOR_WORKERS threads. Each mode runs
+in its own process so caches and pools start cold.
+
+    python -m benchmarks.bench_blocking_io --webhooks 200
+    python -m benchmarks.bench_blocking_io --mode executor --workers 32
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.loadtest.payloads import image_message, partner_phone  # noqa: E402
+from benchmarks.loadtest.runner import configure_environment, install_fakes  # noqa: E402
+
+# Modules that imported run_blocking by name
+_RUN_BLOCKING_USERS = (
+    "whatsapp_bot.app.services.firestore_service",
+    "whatsapp_bot.app.services.media_pipeline",
+    "whatsapp_bot.app.services.write_buffer",
+    "whatsapp_bot.app.services.storage_urls",
+)
+
+
+def run_inline():
+    """Call blocking functions directly on the event loop, as before the executor."""
+    async def inline(func, *args, **kwargs):
+        return func(*args, **kwargs)
+
+    for name in _RUN_BLOCKING_USERS:
+        setattr(sys.modules[name], "run_blocking", inline)
+
+
+def fake_args(args) -> argparse.Namespace:
+    return argparse.Namespace(
+        async_ingestion=False,
+        agent_replies=False,
+        image_variants=False,
+        partners=args.webhooks,
+        media=args.webhooks,
+        media_size=args.media_size,
+        graph_latency=args.graph_latency,
+        graph_error_rate=0.0,
+        cdn_drop_rate=0.0,
+        download_latency=args.download_latency,
+        firestore_latency=args.latency,
+        storage_latency=args.latency,
+        gemini_latency=0.0,
+    )
+
+
+async def measure(args) -> dict:
+    from whatsapp_bot.app.main import app
+    from whatsapp_bot.app.routes.webhook import image_albums, process_message
+
+    if args.mode == "inline":
+        run_inline()
+    fakes = install_fakes(fake_args(args))
+    messages = [image_message(partner_phone(index), f"media-{index}") for index in range(args.webhooks)]
+
+    await app.router.startup()
+    try:
+        started = time.perf_counter()
+        await asyncio.gather(*(process_message(message) for message in messages))
+        # Uploads run in the album collector; wait for them and their confirmations
+        await image_albums.stop()
+        elapsed = time.perf_counter() - started
+    finally:
+        await app.router.shutdown()
+
+    return {"mode": args.mode, "elapsed": elapsed, "stored": fakes["storage"].stats()["objects"]}
+
+
+def run_mode(args) -> dict:
+    os.environ["FIREBASE_EXECUTOR_WORKERS"] = str(args.workers)
+    configure_environment(fake_args(args))
+    import whatsapp_bot.app.main  # noqa: F401
+    logging.getLogger().setLevel(logging.ERROR)
+    return asyncio.run(measure(args))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=("both", "inline", "executor"), default="both")
+    parser.add_argument("--webhooks", type=int, default=100, help="concurrent image webhooks, one per partner")
+    parser.add_argument("--workers", type=int, default=16, help="FIREBASE_EXECUTOR_WORKERS for the executor mode")
+    parser.add_argument("--latency", type=float, default=0.03, help="fake Firestore read / Storage call latency (s)")
+    parser.add_argument("--graph-latency", type=float, default=0.08, help="Graph API call latency (s)")
+    parser.add_argument("--download-latency", type=float, default=0.15, help="media CDN download latency (s)")
+    parser.add_argument("--media-size", type=int, default=256 * 1024, help="bytes per image")
+    args = parser.parse_args()
+
+    if args.mode != "both":
+        print(json.dumps(run_mode(args)))
+        return
+
+    for mode in ("inline", "executor"):
+        command = [sys.executable, "-m", "benchmarks.bench_blocking_io", "--mode", mode]
+        for name in ("webhooks", "workers", "latency", "graph_latency", "download_latency", "media_size"):
+            command += [f"--{name.replace('_', '-')}", str(getattr(args, name))]
+        output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(
+            f"{mode:>9}: {args.webhooks} image webhooks in {result['elapsed']:.2f}s "
+            f"-> {args.webhooks / result['elapsed']:.1f} webhooks/s ({result['stored']} stored)"
+        )
+
+
+if __name__ == "__main__":
+    main()
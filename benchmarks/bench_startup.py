@@ -0,0 +1,106 @@
+"""
+Cold-start cost: importing the app and initializing each service.
+
+Every run uses a fresh interpreter, as an autoscaled instance would. The
+import phase times ``import whatsapp_bot.app.main``; the init phase then runs
+the service container's startup (Firebase, Firestore, Storage, Gemini and the
+Graph API client) and reports each dependency's own init time. Firebase is
+initialized with a throwaway service account key generated for the run and
+Gemini with a dummy key; none of the init steps go over the network.
+
+    python -m benchmarks.bench_startup --runs 5
+"""
+import argparse
+import base64
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_CHILD = """
+import asyncio, json, time
+started = time.perf_counter()
+import whatsapp_bot.app.main
+imported = time.perf_counter() - started
+
+from whatsapp_bot.app.services.container import services
+
+started = time.perf_counter()
+readiness = asyncio.run(services.startup())
+total = time.perf_counter() - started
+print(json.dumps({"import": imported, "init": total, "services": readiness["services"]}))
+"""
+
+
+def fake_service_account() -> str:
+    """Base64 service account JSON with a freshly generated key, as FIREBASE_CREDENTIALS_BASE64 expects."""
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    pem = key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    ).decode("ascii")
+    account = {
+        "type": "service_account",
+        "project_id": "bench-project",
+        "private_key_id": "bench",
+        "private_key": pem,
+        "client_email": "bench@bench-project.iam.gserviceaccount.com",
+        "client_id": "1",
+        "token_uri": "https://oauth2.googleapis.com/token",
+    }
+    return base64.b64encode(json.dumps(account).encode("utf-8")).decode("ascii")
+
+
+def run_once(env) -> dict:
+    output = subprocess.run(
+        [sys.executable, "-c", _CHILD],
+        cwd=ROOT,
+        env=env,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters to start")
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    env.update({
+        "PYTHONPATH": ROOT,
+        "FIREBASE_CREDENTIALS_BASE64": fake_service_account(),
+        "FIREBASE_STORAGE_BUCKET": "bench-project.appspot.com",
+        "GEMINI_API_KEY": "bench",
+        # Makes the agent a required service, so startup initializes it too
+        "AGENT_REPLIES": "true",
+        "WHATSAPP_API_KEY": "bench",
+        "WHATSAPP_PHONE_NUMBER_ID": "bench",
+        "WHATSAPP_VERIFY_TOKEN": "bench",
+    })
+
+    results = [run_once(env) for _ in range(args.runs)]
+
+    def report(name, values):
+        print(f"{name:>12}: median {statistics.median(values) * 1000:8.1f} ms   min {min(values) * 1000:8.1f} ms")
+
+    report("import", [result["import"] for result in results])
+    report("init (all)", [result["init"] for result in results])
+    for service in results[0]["services"]:
+        statuses = {result["services"][service]["status"] for result in results}
+        report(service, [result["services"][service]["init_seconds"] or 0.0 for result in results])
+        if statuses != {"ready"}:
+            print(f"{'':>12}  status: {', '.join(sorted(statuses))} ({results[0]['services'][service]['error']})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Per-send CPU and allocation cost of building interactive payloads.
+
+Compares the previous approach (build the nested dict on every send and
+serialize it the way httpx does for ``json=``) against rendering a
+pre-serialized template from the registry.
+
+    python -m benchmarks.bench_templates --iterations 100000
+"""
+import argparse
+import os
+import sys
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from whatsapp_bot.app.services.templates import (  # noqa: E402
+    TemplateRegistry,
+    _serialize,
+    build_button_payload,
+    build_service_menu_payload,
+)
+
+RECIPIENT = "15550001111"
+HEADER = "AMD Partner Services"
+BUTTON_TEXT = "Is there anything else I can help you with?"
+BUTTONS = [
+    {"id": "need_more_help", "title": "Need More Help"},
+    {"id": "done_for_now", "title": "Done for Now"}
+]
+
+
+def peak_allocation(func, calls: int = 1000) -> int:
+    """Peak bytes allocated by ``func`` across ``calls`` runs, as traced by tracemalloc."""
+    func()
+    tracemalloc.start()
+    for _ in range(calls):
+        func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=50000)
+    args = parser.parse_args()
+
+    registry = TemplateRegistry()
+    cases = {
+        "service menu / dict + dumps": lambda: _serialize(build_service_menu_payload(RECIPIENT, HEADER)),
+        "service menu / template": lambda: registry.service_menu(HEADER).render(RECIPIENT),
+        "buttons / dict + dumps": lambda: _serialize(build_button_payload(RECIPIENT, BUTTON_TEXT, BUTTONS)),
+        "buttons / template": lambda: registry.buttons(BUTTON_TEXT, BUTTONS).render(RECIPIENT),
+    }
+
+    # Both approaches must produce identical bodies
+    assert cases["service menu / dict + dumps"]() == cases["service menu / template"]()
+    assert cases["buttons / dict + dumps"]() == cases["buttons / template"]()
+
+    print(f"{'case':<30} {'us/send':>10} {'peak KiB':>10}")
+    for name, func in cases.items():
+        seconds = timeit.timeit(func, number=args.iterations)
+        peak = peak_allocation(func)
+        print(f"{name:<30} {seconds / args.iterations * 1e6:>10.2f} {peak / 1024:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,9 @@
+"""
+Offline webhook load test.
+
+Replays realistic WhatsApp webhook deliveries against the FastAPI app with
+the Graph API, Firestore, Storage and Gemini replaced by local fakes, and
+reports latency percentiles, throughput and peak RSS.
+
+    python -m benchmarks.loadtest.runner --rps 200 --duration 20
+"""
@@ -0,0 +1,435 @@
+"""
+Local stand-ins for the bot's external services.
+
+``FakeGraph`` answers graph.facebook.com and the media CDN through an
+``httpx.MockTransport``, so requests never leave the process but still go
+through the real client, pool and scheduler code. The Firestore, Storage and
+Gemini fakes implement just the SDK surface the bot uses. Firebase fakes
+block with ``time.sleep`` like the real SDK calls do, so they exercise the
+executor the same way; Graph and Gemini fakes are async.
+"""
+import asyncio
+import hashlib
+import io
+import itertools
+import json
+import random
+import time
+from typing import Dict, Iterable, List, Optional
+
+import httpx
+
+from benchmarks.loadtest.payloads import partner_phone
+
+
+class Latency:
+    """Simulated service time: ``mean`` seconds with uniform +/- ``jitter`` (fraction)."""
+
+    def __init__(self, mean: float, jitter: float = 0.2):
+        self.mean = mean
+        self.jitter = jitter
+
+    def sample(self) -> float:
+        if self.mean <= 0:
+            return 0.0
+        return max(0.0, random.uniform(self.mean * (1 - self.jitter), self.mean * (1 + self.jitter)))
+
+
+def _photo(index: int, width: int = 1600, height: int = 1200) -> bytes:
+    """A decodable, camera-sized JPEG (needs Pillow), distinct per index."""
+    from PIL import Image
+
+    tint = Image.new("RGB", (width, height), ((index * 67) % 256, (index * 131) % 256, (index * 29) % 256))
+    noise = Image.effect_noise((width, height), 40 + index % 20).convert("RGB")
+    output = io.BytesIO()
+    Image.blend(tint, noise, 0.5).save(output, format="JPEG", quality=90)
+    return output.getvalue()
+
+
+class FakeGraph:
+    """
+    graph.facebook.com for message sends, media metadata and media downloads.
+
+    Media ids ``media-0`` .. ``media-{n-1}`` resolve to JPEG-like payloads of
+    ``media_size`` bytes served from a fake CDN host, or to real photos with
+    ``real_images`` (for the image variant stage).
+    """
+
+    CDN_URL = "https://lookaside.fbsbx.com/whatsapp_business/attachments/"
+
+    def __init__(
+        self,
+        api_latency: Latency,
+        download_latency: Latency,
+        media_count: int = 50,
+        media_size: int = 256 * 1024,
+        error_rate: float = 0.0,
+        real_images: bool = False,
+        drop_rate: float = 0.0,
+    ):
+        self.api_latency = api_latency
+        self.download_latency = download_latency
+        self.error_rate = error_rate
+        self.drop_rate = drop_rate
+        self.media = {}
+        for index in range(media_count):
+            if real_images:
+                self.media[f"media-{index}"] = _photo(index)
+                continue
+            # Distinct content per media id so hash dedup sees distinct photos
+            seed = f"media-{index}".encode("ascii")
+            content = (seed * (media_size // len(seed) + 1))[:media_size]
+            self.media[f"media-{index}"] = content
+        self.sent = 0
+        self.media_lookups = 0
+        self.downloads = 0
+        self.range_requests = 0
+        self.dropped = 0
+        self._message_ids = itertools.count(1)
+
+    @property
+    def media_ids(self) -> List[str]:
+        return list(self.media)
+
+    def transport(self) -> httpx.MockTransport:
+        return httpx.MockTransport(self.handle)
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        url = str(request.url)
+        if url.startswith(self.CDN_URL):
+            await asyncio.sleep(self.download_latency.sample())
+            content = self.media.get(url[len(self.CDN_URL):])
+            if content is None:
+                return httpx.Response(404)
+            self.downloads += 1
+            return self._download(request, content)
+
+        await asyncio.sleep(self.api_latency.sample())
+        if self.error_rate and random.random() < self.error_rate:
+            return httpx.Response(503, json={"error": {"message": "Service temporarily unavailable"}})
+
+        path = request.url.path.rstrip("/")
+        if request.method == "POST" and path.endswith("/messages"):
+            self.sent += 1
+            body = json.loads(request.content or b"{}")
+            return httpx.Response(200, json={
+                "messaging_product": "whatsapp",
+                "contacts": [{"input": body.get("to"), "wa_id": body.get("to")}],
+                "messages": [{"id": f"wamid.FAKE{next(self._message_ids):012d}"}],
+            })
+
+        media_id = path.rsplit("/", 1)[-1]
+        content = self.media.get(media_id)
+        if request.method == "GET" and content is not None:
+            self.media_lookups += 1
+            return httpx.Response(200, json={
+                "messaging_product": "whatsapp",
+                "url": f"{self.CDN_URL}{media_id}",
+                "mime_type": "image/jpeg",
+                "sha256": hashlib.sha256(content).hexdigest(),
+                "file_size": len(content),
+                "id": media_id,
+            })
+        return httpx.Response(404, json={"error": {"message": f"Unknown path {path}"}})
+
+    def _download(self, request: httpx.Request, content: bytes) -> httpx.Response:
+        """Serves ``Range: bytes=N-``; with ``drop_rate`` a share of bodies is cut off midway."""
+        status, start = 200, 0
+        headers = {"content-type": "image/jpeg"}
+        byte_range = request.headers.get("range")
+        if byte_range and byte_range.startswith("bytes=") and byte_range.endswith("-"):
+            self.range_requests += 1
+            start = int(byte_range[len("bytes="):-1])
+            if start >= len(content):
+                return httpx.Response(416, headers={"content-range": f"bytes */{len(content)}"})
+            status = 206
+            headers["content-range"] = f"bytes {start}-{len(content) - 1}/{len(content)}"
+        body = content[start:]
+
+        if not (self.drop_rate and random.random() < self.drop_rate):
+            return httpx.Response(status, content=body, headers=headers)
+
+        self.dropped += 1
+
+        async def truncated():
+            yield body[:len(body) // 2]
+            raise httpx.ReadError("Connection reset by peer", request=request)
+
+        headers["content-length"] = str(len(body))
+        return httpx.Response(status, content=truncated(), headers=headers)
+
+    def stats(self) -> Dict:
+        return {
+            "sent": self.sent,
+            "media_lookups": self.media_lookups,
+            "downloads": self.downloads,
+            "range_requests": self.range_requests,
+            "dropped": self.dropped,
+        }
+
+
+class FakeSnapshot:
+    def __init__(self, reference: "FakeDocument", data: Optional[Dict]):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+
+    @property
+    def exists(self) -> bool:
+        return self._data is not None
+
+    def to_dict(self) -> Optional[Dict]:
+        return dict(self._data) if self._data is not None else None
+
+
+class FakeDocument:
+    def __init__(self, db: "FakeFirestore", path: str):
+        self._db = db
+        self.path = path
+        self.id = path.rsplit("/", 1)[-1]
+
+    def collection(self, name: str) -> "FakeCollection":
+        return FakeCollection(self._db, f"{self.path}/{name}")
+
+    def get(self) -> FakeSnapshot:
+        self._db.read_pause()
+        return FakeSnapshot(self, self._db.documents.get(self.path))
+
+    def set(self, data: Dict, merge: bool = False):
+        self._db.write_pause()
+        self._db.write(self.path, data, merge)
+
+
+class FakeQuery:
+    def __init__(self, collection: "FakeCollection", filters: List = None, limit: Optional[int] = None):
+        self._collection = collection
+        self._filters = filters or []
+        self._limit = limit
+
+    def where(self, field: str, op: str, value) -> "FakeQuery":
+        if op != "==":
+            raise NotImplementedError(f"FakeFirestore only supports '==' filters, got {op!r}")
+        return FakeQuery(self._collection, self._filters + [(field, value)], self._limit)
+
+    def limit(self, count: int) -> "FakeQuery":
+        return FakeQuery(self._collection, self._filters, count)
+
+    def select(self, field_paths: List[str]) -> "FakeQuery":
+        # Projections only save bandwidth; the fake returns whole documents
+        return FakeQuery(self._collection, self._filters, self._limit)
+
+    def get(self) -> List[FakeSnapshot]:
+        db = self._collection._db
+        db.read_pause()
+        results = []
+        for path, data in db.children(self._collection.path):
+            if all(data.get(field) == value for field, value in self._filters):
+                results.append(FakeSnapshot(FakeDocument(db, path), data))
+                if self._limit is not None and len(results) >= self._limit:
+                    break
+        return results
+
+
+class FakeCollection(FakeQuery):
+    def __init__(self, db: "FakeFirestore", path: str):
+        self._db = db
+        self.path = path
+        super().__init__(self)
+
+    def document(self, document_id: Optional[str] = None) -> FakeDocument:
+        return FakeDocument(self._db, f"{self.path}/{document_id or self._db.new_id()}")
+
+
+class FakeBatch:
+    def __init__(self, db: "FakeFirestore"):
+        self._db = db
+        self._writes = []
+
+    def set(self, reference: FakeDocument, data: Dict, merge: bool = False):
+        self._writes.append((reference.path, data, merge))
+
+    def commit(self):
+        self._db.write_pause()
+        for path, data, merge in self._writes:
+            self._db.write(path, data, merge)
+        self._db.batches += 1
+        self._writes = []
+
+
+class FakeFirestore:
+    """In-memory Firestore client: documents keyed by their full path."""
+
+    def __init__(self, read_latency: Latency, write_latency: Latency, partners: int = 0):
+        self.read_latency = read_latency
+        self.write_latency = write_latency
+        self.documents: Dict[str, Dict] = {}
+        self._ids = itertools.count(1)
+        self.reads = 0
+        self.writes = 0
+        self.batches = 0
+        for index in range(partners):
+            self.documents[f"partners/partner-{index}"] = {
+                "partnerName": f"Partner {index}",
+                "contactNumber": partner_phone(index),
+            }
+
+    def read_pause(self):
+        self.reads += 1
+        time.sleep(self.read_latency.sample())
+
+    def write_pause(self):
+        time.sleep(self.write_latency.sample())
+
+    def new_id(self) -> str:
+        return f"doc{next(self._ids):010d}"
+
+    def write(self, path: str, data: Dict, merge: bool = False):
+        self.writes += 1
+        if merge and path in self.documents:
+            self.documents[path] = {**self.documents[path], **data}
+        else:
+            self.documents[path] = dict(data)
+
+    def children(self, collection_path: str) -> Iterable:
+        prefix = f"{collection_path}/"
+        for path, data in list(self.documents.items()):
+            if path.startswith(prefix) and "/" not in path[len(prefix):]:
+                yield path, data
+
+    def collection(self, name: str) -> FakeCollection:
+        return FakeCollection(self, name)
+
+    def batch(self) -> FakeBatch:
+        return FakeBatch(self)
+
+    def stats(self) -> Dict:
+        return {"documents": len(self.documents), "reads": self.reads, "writes": self.writes, "batches": self.batches}
+
+
+class FakeBlobWriter:
+    """Resumable upload: chunks are "sent" as they are written, the object appears on close."""
+
+    def __init__(self, blob: "FakeBlob", content_type: str):
+        self._blob = blob
+        self._content_type = content_type
+        self._size = 0
+
+    def write(self, data: bytes) -> int:
+        time.sleep(self._blob._bucket.chunk_latency.sample())
+        self._size += len(data)
+        return len(data)
+
+    def close(self):
+        time.sleep(self._blob._bucket.chunk_latency.sample())
+        self._blob.size = self._size
+        self._blob.content_type = self._content_type
+        self._blob._bucket.objects[self._blob.name] = self._size
+
+
+class FakeBlob:
+    def __init__(self, bucket: "FakeBucket", name: str):
+        self._bucket = bucket
+        self.name = name
+        self.size = None
+        self.content_type = None
+
+    def open(self, mode: str = "r", chunk_size: Optional[int] = None, content_type: str = None, **kwargs) -> FakeBlobWriter:
+        if mode != "wb":
+            raise NotImplementedError("FakeBlob only supports streaming writes")
+        return FakeBlobWriter(self, content_type or "application/octet-stream")
+
+    def upload_from_string(self, data: bytes, content_type: str = None):
+        time.sleep(self._bucket.chunk_latency.sample())
+        self.size = len(data)
+        self.content_type = content_type
+        self._bucket.objects[self.name] = self.size
+
+    def make_public(self):
+        time.sleep(self._bucket.acl_latency.sample())
+
+    @property
+    def public_url(self) -> str:
+        return f"https://storage.googleapis.com/{self._bucket.name}/{self.name}"
+
+    def generate_signed_url(self, version: str = "v2", expiration=None, method: str = "GET", **kwargs) -> str:
+        # Signed locally by the real client too; no simulated latency
+        return f"{self.public_url}?X-Goog-Algorithm=GOOG4-RSA-SHA256&X-Goog-Expires={int(expiration.total_seconds())}"
+
+
+class FakeBucket:
+    def __init__(self, chunk_latency: Latency, acl_latency: Latency, name: str = "loadtest.appspot.com"):
+        self.name = name
+        self.chunk_latency = chunk_latency
+        self.acl_latency = acl_latency
+        self.objects: Dict[str, int] = {}
+
+    def blob(self, name: str) -> FakeBlob:
+        return FakeBlob(self, name)
+
+    def list_blobs(self, max_results: Optional[int] = None):
+        return iter(FakeBlob(self, name) for name in list(self.objects)[:max_results])
+
+    def stats(self) -> Dict:
+        return {"objects": len(self.objects), "bytes": sum(self.objects.values())}
+
+
+REPLY = (
+    "Thanks for reaching out! I can help with AMD Ryzen processors, Radeon graphics cards, "
+    "motherboards, memory and storage. Could you tell me which product you are interested in, "
+    "and whether you need pricing, availability or technical details? If this is about an "
+    "existing order, please share the order number and I will look up its status for you."
+)
+
+
+class _FakeChunk:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class _FakeStream:
+    def __init__(self, model: "FakeGenerativeModel", text: str):
+        self._model = model
+        self._text = text
+
+    async def __aiter__(self):
+        await asyncio.sleep(self._model.first_token_latency.sample())
+        step = self._model.chunk_chars
+        for start in range(0, len(self._text), step):
+            if start:
+                await asyncio.sleep(self._model.chunk_latency.sample())
+            yield _FakeChunk(self._text[start:start + step])
+
+
+class _FakeChat:
+    def __init__(self, model: "FakeGenerativeModel", history: List[Dict]):
+        self._model = model
+        self.history = history
+
+    async def send_message_async(self, message: str, stream: bool = False):
+        self._model.calls += 1
+        if stream:
+            return _FakeStream(self._model, self._model.reply)
+        await asyncio.sleep(self._model.first_token_latency.sample())
+        return _FakeChunk(self._model.reply)
+
+
+class FakeGenerativeModel:
+    """Gemini model that streams a fixed reply in ``chunk_chars`` pieces."""
+
+    def __init__(self, first_token_latency: Latency, chunk_latency: Latency, reply: str = REPLY, chunk_chars: int = 60):
+        self.first_token_latency = first_token_latency
+        self.chunk_latency = chunk_latency
+        self.reply = reply
+        self.chunk_chars = chunk_chars
+        self.calls = 0
+
+    def start_chat(self, history: Optional[List[Dict]] = None) -> _FakeChat:
+        return _FakeChat(self, history or [])
+
+    async def generate_content_async(self, prompt: str):
+        self.calls += 1
+        await asyncio.sleep(self.first_token_latency.sample())
+        return _FakeChunk("Summary of the earlier conversation.")
+
+    def stats(self) -> Dict:
+        return {"calls": self.calls}
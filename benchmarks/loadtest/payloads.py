@@ -0,0 +1,166 @@
+"""
+WhatsApp Cloud API webhook deliveries, shaped like the ones Meta sends.
+"""
+import itertools
+import random
+import time
+from typing import Dict, Iterator, List, Optional
+
+PHONE_NUMBER_ID = "100000000000001"
+BUSINESS_ACCOUNT_ID = "200000000000001"
+
+_message_ids = itertools.count(1)
+
+
+def partner_phone(index: int) -> str:
+    return f"1555{index:07d}"
+
+
+def stranger_phone(index: int) -> str:
+    return f"1666{index:07d}"
+
+
+def _message(sender: str, type_: str, body: Dict) -> Dict:
+    return {
+        "from": sender,
+        "id": f"wamid.LOADTEST{next(_message_ids):012d}",
+        "timestamp": str(int(time.time())),
+        "type": type_,
+        type_: body,
+    }
+
+
+def text_message(sender: str, text: str) -> Dict:
+    return _message(sender, "text", {"body": text})
+
+
+def list_reply(sender: str, reply_id: str, title: str) -> Dict:
+    return _message(sender, "interactive", {
+        "type": "list_reply",
+        "list_reply": {"id": reply_id, "title": title},
+    })
+
+
+def button_reply(sender: str, button_id: str, title: str) -> Dict:
+    return _message(sender, "interactive", {
+        "type": "button_reply",
+        "button_reply": {"id": button_id, "title": title},
+    })
+
+
+def image_message(sender: str, media_id: str, caption: Optional[str] = None) -> Dict:
+    image = {"id": media_id, "mime_type": "image/jpeg", "sha256": ""}
+    if caption:
+        image["caption"] = caption
+    return _message(sender, "image", image)
+
+
+def delivery(messages: List[Dict]) -> Dict:
+    """One webhook POST body; messages from different senders go in separate entries, as Meta batches them."""
+    by_sender: Dict[str, List[Dict]] = {}
+    for message in messages:
+        by_sender.setdefault(message["from"], []).append(message)
+
+    entries = []
+    for sender, sender_messages in by_sender.items():
+        entries.append({
+            "id": BUSINESS_ACCOUNT_ID,
+            "changes": [{
+                "field": "messages",
+                "value": {
+                    "messaging_product": "whatsapp",
+                    "metadata": {
+                        "display_phone_number": "15550000000",
+                        "phone_number_id": PHONE_NUMBER_ID,
+                    },
+                    "contacts": [{"profile": {"name": f"Load {sender[-4:]}"}, "wa_id": sender}],
+                    "messages": sender_messages,
+                },
+            }],
+        })
+    return {"object": "whatsapp_business_account", "entry": entries}
+
+
+TEXTS = [
+    "hi",
+    "Hello, I need help",
+    "menu",
+    "What is the status of my order 4471?",
+    "Do you have Ryzen 7 7800X3D in stock?",
+    "thanks",
+]
+
+# Default mix of deliveries: (kind, weight)
+DEFAULT_MIX = {
+    "text": 45,
+    "list_reply": 15,
+    "button_reply": 15,
+    "image": 15,
+    "batch": 10,
+}
+
+
+class PayloadGenerator:
+    """
+    Endless stream of webhook bodies in a weighted mix.
+
+    Most traffic comes from registered partners; ``stranger_ratio`` of the
+    senders are unregistered numbers. Image media ids are drawn from
+    ``media_ids`` so they resolve against the fake Graph API.
+    """
+
+    def __init__(
+        self,
+        partners: int,
+        media_ids: List[str],
+        mix: Optional[Dict[str, int]] = None,
+        stranger_ratio: float = 0.1,
+        batch_size: int = 5,
+        seed: int = 7,
+    ):
+        self.partners = partners
+        self.media_ids = media_ids
+        self.mix = mix or DEFAULT_MIX
+        self.stranger_ratio = stranger_ratio
+        self.batch_size = batch_size
+        self.random = random.Random(seed)
+
+    def _sender(self) -> str:
+        if self.random.random() < self.stranger_ratio:
+            return stranger_phone(self.random.randrange(self.partners))
+        return partner_phone(self.random.randrange(self.partners))
+
+    def _single(self, kind: str, sender: str) -> Dict:
+        if kind == "text":
+            return text_message(sender, self.random.choice(TEXTS))
+        if kind == "list_reply":
+            reply_id, title = self.random.choice([
+                ("technical_support", "Technical Support"),
+                ("order_status", "Order Status"),
+                ("request_new_product", "Request a New Product"),
+                ("upload_product_images", "Upload Product Images"),
+            ])
+            return list_reply(sender, reply_id, title)
+        if kind == "button_reply":
+            button_id, title = self.random.choice([
+                ("hardware_support", "Hardware"),
+                ("need_more_help", "Need More Help"),
+                ("done_for_now", "Done for Now"),
+                ("back_to_menu", "Back to Menu"),
+            ])
+            return button_reply(sender, button_id, title)
+        return image_message(sender, self.random.choice(self.media_ids), caption="Shelf photo")
+
+    def __iter__(self) -> Iterator[Dict]:
+        kinds = list(self.mix)
+        weights = [self.mix[kind] for kind in kinds]
+        while True:
+            kind = self.random.choices(kinds, weights)[0]
+            if kind == "batch":
+                messages = [
+                    self._single(self.random.choice(["text", "button_reply"]), self._sender())
+                    for _ in range(self.batch_size)
+                ]
+            else:
+                messages = [self._single(kind, self._sender())]
+            yield delivery(messages)
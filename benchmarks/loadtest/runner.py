@@ -0,0 +1,237 @@
+"""
+Replay webhook deliveries against the app at a target rate.
+
+The FastAPI app runs in-process behind ``httpx.ASGITransport``. The Graph API
+client is swapped for one on a ``FakeGraph`` transport and the service
+container is pointed at the Firestore, Storage and Gemini fakes, so the run
+is fully offline. Requests are issued open-loop: each one is scheduled at
+``start + i / rps`` and its latency is measured from that scheduled time, so
+a slow server shows up as latency instead of a lower send rate.
+
+    python -m benchmarks.loadtest.runner --rps 200 --duration 20
+    python -m benchmarks.loadtest.runner --rps 500 --async-ingestion --agent-replies
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import resource
+import statistics
+import sys
+import time
+from typing import Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import httpx  # noqa: E402
+
+from benchmarks.loadtest.fakes import FakeBucket, FakeFirestore, FakeGenerativeModel, FakeGraph, Latency  # noqa: E402
+from benchmarks.loadtest.payloads import PHONE_NUMBER_ID, PayloadGenerator  # noqa: E402
+
+
+def configure_environment(args):
+    """Settings read at import time must be in place before the app is imported."""
+    os.environ.update({
+        "WHATSAPP_API_KEY": "loadtest",
+        "WHATSAPP_PHONE_NUMBER_ID": PHONE_NUMBER_ID,
+        "WHATSAPP_VERIFY_TOKEN": "loadtest",
+        "WEBHOOK_ASYNC_MODE": "true" if args.async_ingestion else "false",
+        "AGENT_REPLIES": "true" if args.agent_replies else "false",
+        "IMAGE_VARIANTS": "true" if args.image_variants else "false",
+    })
+
+
+def install_fakes(args) -> Dict:
+    from whatsapp_bot.app.services.container import services
+    from whatsapp_bot.app.services.http_client import GraphClient, set_http_client
+    from whatsapp_bot.app.services.nlp_service import DealerAgent
+
+    graph = FakeGraph(
+        api_latency=Latency(args.graph_latency),
+        download_latency=Latency(args.download_latency),
+        media_count=args.media,
+        media_size=args.media_size,
+        error_rate=args.graph_error_rate,
+        real_images=args.image_variants,
+        drop_rate=args.cdn_drop_rate,
+    )
+    firestore = FakeFirestore(
+        read_latency=Latency(args.firestore_latency),
+        write_latency=Latency(args.firestore_latency * 2),
+        partners=args.partners,
+    )
+    bucket = FakeBucket(chunk_latency=Latency(args.storage_latency), acl_latency=Latency(args.storage_latency))
+    model = FakeGenerativeModel(
+        first_token_latency=Latency(args.gemini_latency),
+        chunk_latency=Latency(args.gemini_latency / 10),
+    )
+
+    set_http_client(GraphClient(http2=False, transport=graph.transport()))
+    agent = DealerAgent(api_key="loadtest")
+    agent.model = model
+
+    services.override("firebase", object())
+    services.override("firestore", firestore)
+    services.override("storage", bucket)
+    services.override("agent", agent)
+    return {"graph": graph, "firestore": firestore, "storage": bucket, "gemini": model}
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+async def replay(app, payloads, rps: float, duration: float, max_in_flight: int) -> Dict:
+    total = int(rps * duration)
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+    slots = asyncio.Semaphore(max_in_flight)
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=None) as client:
+
+        async def fire(body: bytes, scheduled: float):
+            async with slots:
+                try:
+                    response = await client.post(
+                        "/api/v1/webhook", content=body, headers={"Content-Type": "application/json"}
+                    )
+                    outcome = response.json().get("status", str(response.status_code))
+                    if response.status_code >= 400:
+                        outcome = f"http_{response.status_code}"
+                except Exception as e:
+                    outcome = type(e).__name__
+            latencies.append(time.perf_counter() - scheduled)
+            statuses[outcome] = statuses.get(outcome, 0) + 1
+
+        tasks = []
+        started = time.perf_counter()
+        for index, payload in zip(range(total), payloads):
+            scheduled = started + index / rps
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(fire(json.dumps(payload).encode("utf-8"), scheduled)))
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": total,
+        "elapsed": elapsed,
+        "throughput": total / elapsed if elapsed else 0.0,
+        "p50": percentile(latencies, 0.50),
+        "p95": percentile(latencies, 0.95),
+        "p99": percentile(latencies, 0.99),
+        "max": latencies[-1] if latencies else 0.0,
+        "mean": statistics.fmean(latencies) if latencies else 0.0,
+        "statuses": statuses,
+    }
+
+
+def stage_summary() -> Dict:
+    """Mean time per instrumented stage over the whole run (warm-up included)."""
+    from whatsapp_bot.app.services.metrics import STAGE_ERRORS, STAGE_SECONDS
+
+    stages = {}
+    for (stage,) in sorted(STAGE_SECONDS.label_values()):
+        snapshot = STAGE_SECONDS.snapshot(stage)
+        stages[stage] = {
+            "count": snapshot["count"],
+            "mean": snapshot["sum"] / snapshot["count"] if snapshot["count"] else 0.0,
+            "errors": STAGE_ERRORS.value(stage),
+        }
+    return stages
+
+
+async def run(args) -> Dict:
+    from whatsapp_bot.app.main import app
+
+    fakes = install_fakes(args)
+    payloads = iter(PayloadGenerator(
+        partners=args.partners,
+        media_ids=fakes["graph"].media_ids,
+        stranger_ratio=args.stranger_ratio,
+        seed=args.seed,
+    ))
+
+    await app.router.startup()
+    try:
+        if args.warmup:
+            await replay(app, payloads, args.rps, args.warmup, args.max_in_flight)
+        result = await replay(app, payloads, args.rps, args.duration, args.max_in_flight)
+    finally:
+        # Drains the worker queue and the outbound scheduler in async mode
+        drain_started = time.perf_counter()
+        await app.router.shutdown()
+        result_drain = time.perf_counter() - drain_started
+
+    result["drain"] = result_drain
+    result["stages"] = stage_summary()
+    result["fakes"] = {name: fake.stats() for name, fake in fakes.items()}
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    result["peak_rss_mb"] = peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rps", type=float, default=100, help="target webhook deliveries per second")
+    parser.add_argument("--duration", type=float, default=10, help="measured run length (s)")
+    parser.add_argument("--warmup", type=float, default=2, help="unmeasured warm-up before the run (s)")
+    parser.add_argument("--max-in-flight", type=int, default=1000, help="cap on concurrent webhook requests")
+    parser.add_argument("--partners", type=int, default=1000, help="registered partners in the fake Firestore")
+    parser.add_argument("--stranger-ratio", type=float, default=0.1, help="share of senders that are not partners")
+    parser.add_argument("--media", type=int, default=50, help="distinct images the fake Graph API serves")
+    parser.add_argument("--media-size", type=int, default=256 * 1024, help="bytes per image")
+    parser.add_argument("--graph-latency", type=float, default=0.08, help="Graph API call latency (s)")
+    parser.add_argument("--graph-error-rate", type=float, default=0.0, help="share of Graph API calls answered 503")
+    parser.add_argument("--cdn-drop-rate", type=float, default=0.0, help="share of media downloads cut off midway")
+    parser.add_argument("--download-latency", type=float, default=0.15, help="media CDN download latency (s)")
+    parser.add_argument("--firestore-latency", type=float, default=0.03, help="Firestore read latency (s); writes take 2x")
+    parser.add_argument("--storage-latency", type=float, default=0.05, help="Storage chunk upload / ACL latency (s)")
+    parser.add_argument("--gemini-latency", type=float, default=0.6, help="Gemini time to first token (s)")
+    parser.add_argument("--async-ingestion", action="store_true", help="acknowledge webhooks before processing")
+    parser.add_argument("--agent-replies", action="store_true", help="answer free text with the (fake) Gemini agent")
+    parser.add_argument("--image-variants", action="store_true", help="serve real photos and render variants (needs Pillow)")
+    parser.add_argument("--seed", type=int, default=7, help="payload mix random seed")
+    parser.add_argument("--log-level", default="WARNING", help="app log level during the run")
+    parser.add_argument("--json", action="store_true", help="print the result as JSON")
+    args = parser.parse_args()
+
+    configure_environment(args)
+    # The app configures logging on import; quiet it before the run starts
+    import whatsapp_bot.app.main  # noqa: F401
+    logging.getLogger().setLevel(args.log_level.upper())
+
+    result = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return
+
+    print(f"requests:   {result['requests']} in {result['elapsed']:.2f}s (target {args.rps:g} rps)")
+    print(f"throughput: {result['throughput']:.1f} req/s")
+    print(
+        f"latency:    p50 {result['p50'] * 1000:.1f} ms   p95 {result['p95'] * 1000:.1f} ms   "
+        f"p99 {result['p99'] * 1000:.1f} ms   max {result['max'] * 1000:.1f} ms"
+    )
+    print(f"drain:      {result['drain']:.2f}s after the last response")
+    print(f"peak RSS:   {result['peak_rss_mb']:.1f} MB")
+    print(f"statuses:   {result['statuses']}")
+    for name, stats in result["fakes"].items():
+        print(f"{name + ':':<11} {stats}")
+    print("stages:")
+    for stage, summary in result["stages"].items():
+        print(
+            f"  {stage:<18} n={summary['count']:<6} mean {summary['mean'] * 1000:8.1f} ms"
+            f"   errors {summary['errors']:g}"
+        )
+
+
+if __name__ == "__main__":
+    main()
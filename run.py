@@ -1,13 +1,42 @@
+import os
+import importlib.util
 import uvicorn
 
+APP = "whatsapp_bot.app.main:app"
+
 def main():
     """Run the application using uvicorn."""
     uvicorn.run(
-        "whatsapp_bot.app.main:app",
+        APP,
         host="0.0.0.0",
         port=8000,
         reload=True
     )
 
+def serve():
+    """
+    Run the application for production.
+
+    WEB_CONCURRENCY worker processes each import the app themselves; services
+    are initialized lazily on startup, so nothing is shared across the fork.
+    uvloop and httptools are used when installed. Logging is set up by the
+    app (see LOG_FORMAT), so uvicorn's own handlers are left out and its
+    records go through the same pipeline.
+    """
+    uvicorn.run(
+        APP,
+        host=os.getenv("HOST", "0.0.0.0"),
+        port=int(os.getenv("PORT", "8000")),
+        workers=int(os.getenv("WEB_CONCURRENCY", "1")),
+        loop="uvloop" if importlib.util.find_spec("uvloop") else "asyncio",
+        http="httptools" if importlib.util.find_spec("httptools") else "h11",
+        log_config=None,
+        access_log=os.getenv("ACCESS_LOG", "false").lower() == "true",
+        backlog=int(os.getenv("BACKLOG", "2048")),
+        timeout_keep_alive=int(os.getenv("KEEP_ALIVE_TIMEOUT", "75")),
+        proxy_headers=True,
+        forwarded_allow_ips=os.getenv("FORWARDED_ALLOW_IPS", "*"),
+    )
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,156 @@
+import asyncio
+
+from benchmarks.loadtest.fakes import FakeGenerativeModel, Latency
+from whatsapp_bot.app.services.metrics import STAGE_ERRORS
+from whatsapp_bot.app.services.nlp_service import FALLBACK_REPLY, DealerAgent, create_agent
+from whatsapp_bot.app.services.reply_cache import ReplyCache
+
+
+def make_agent(**kwargs) -> DealerAgent:
+    agent = DealerAgent(api_key="test", reply_cache=ReplyCache(), **kwargs)
+    agent.model = FakeGenerativeModel(Latency(0), Latency(0), reply="Sure, happy to help.")
+    return agent
+
+
+def collect(agent: DealerAgent, phone: str, message: str) -> str:
+    async def run():
+        return "".join([text async for text in agent.stream_message(phone, message)])
+    return asyncio.run(run())
+
+
+def test_fresh_conversations_share_the_fingerprint():
+    agent = make_agent()
+    assert agent._fingerprint(agent._conversation("111")) == agent._fingerprint(agent._conversation("222"))
+
+
+def test_history_separates_fingerprints():
+    agent = make_agent()
+    collect(agent, "111", "my order is ORD-1")
+    collect(agent, "222", "my order is ORD-2")
+    # Same last reply, different history
+    assert agent._fingerprint(agent._conversation("111")) != agent._fingerprint(agent._conversation("222"))
+
+
+def test_only_recent_history_is_fingerprinted():
+    agent = make_agent()
+    collect(agent, "111", "my order is ORD-1")
+    collect(agent, "111", "What products do you have?")
+    collect(agent, "222", "hello")
+    collect(agent, "222", "what products do you have")
+    # The last exchange matches once normalized; what came before does not count
+    assert agent._fingerprint(agent._conversation("111")) == agent._fingerprint(agent._conversation("222"))
+
+    calls = agent.model.calls
+    collect(agent, "222", "which processors are in stock")
+    collect(agent, "111", "Which processors are in stock?")
+    assert agent.model.calls == calls + 1
+
+
+def test_cache_context_sets_the_window():
+    agent = make_agent(cache_context=2)
+    collect(agent, "111", "my order is ORD-1")
+    collect(agent, "111", "what products do you have")
+    collect(agent, "222", "hello")
+    collect(agent, "222", "what products do you have")
+    assert agent._fingerprint(agent._conversation("111")) != agent._fingerprint(agent._conversation("222"))
+
+
+def test_follow_up_is_not_served_from_another_partner():
+    agent = make_agent()
+    collect(agent, "111", "my order is ORD-1")
+    collect(agent, "111", "when will it arrive")
+    calls = agent.model.calls
+    collect(agent, "222", "my order is ORD-2")
+    collect(agent, "222", "when will it arrive")
+    assert agent.model.calls == calls + 2
+
+
+class _BrokenChat:
+    async def send_message_async(self, message, stream=False):
+        raise RuntimeError("429 Resource has been exhausted (api key AIza-secret)")
+
+
+class _BrokenModel:
+    def start_chat(self, history=None):
+        return _BrokenChat()
+
+
+def test_stream_failure_yields_fallback_and_counts_error():
+    agent = make_agent()
+    agent.model = _BrokenModel()
+    errors = STAGE_ERRORS.value("llm_stream")
+
+    reply = collect(agent, "111", "hello")
+
+    assert reply == FALLBACK_REPLY
+    assert "AIza" not in reply
+    assert STAGE_ERRORS.value("llm_stream") == errors + 1
+    # Nothing is remembered or cached from a failed exchange
+    assert agent._conversation("111")["turns"] == []
+    assert agent.reply_cache.get("hello", agent._fingerprint(agent._conversation("111"))) is None
+
+
+def test_window_keeps_the_latest_exchanges():
+    agent = make_agent(max_turns=2, max_history_tokens=10000)
+
+    async def run():
+        for n in range(4):
+            await agent.process_message("111", f"question {n}")
+
+    asyncio.run(run())
+    turns = agent._conversation("111")["turns"]
+    assert [turn["parts"][0] for turn in turns if turn["role"] == "user"] == ["question 2", "question 3"]
+
+
+def test_dropped_turns_are_summarized_in_the_background():
+    summaries = []
+    release = None
+
+    async def summarizer(summary, dropped):
+        await release.wait()
+        summaries.append([turn["parts"][0] for turn in dropped if turn["role"] == "user"])
+        return f"{summary} {len(summaries)}".strip()
+
+    agent = make_agent(max_turns=1, max_history_tokens=10000, summarizer=summarizer)
+
+    async def run():
+        nonlocal release
+        release = asyncio.Event()
+        for n in range(3):
+            # Replies are not held up by the summary
+            await asyncio.wait_for(agent.process_message("111", f"question {n}"), 1)
+        release.set()
+        await agent._conversation("111")["summarizing"]
+
+    asyncio.run(run())
+    conversation = agent._conversation("111")
+    # Turns dropped while a summary was running are folded in by one more call
+    assert summaries == [["question 0"], ["question 1"]]
+    assert conversation["summary"] == "1 2"
+    assert conversation["unsummarized"] == [] and conversation["summarizing"] is None
+
+
+def test_failed_summary_keeps_the_previous_one():
+    async def summarizer(summary, dropped):
+        raise RuntimeError("quota")
+
+    agent = make_agent(max_turns=1, max_history_tokens=10000, summarizer=summarizer)
+    agent._conversation("111")["summary"] = "earlier"
+
+    async def run():
+        for n in range(2):
+            await agent.process_message("111", f"question {n}")
+        await agent._conversation("111")["summarizing"]
+
+    asyncio.run(run())
+    assert agent._conversation("111")["summary"] == "earlier"
+
+
+def test_model_summarizer_is_installed_by_default(monkeypatch):
+    monkeypatch.setenv("GEMINI_API_KEY", "test")
+    monkeypatch.delenv("AGENT_SUMMARIZE", raising=False)
+    agent = asyncio.run(create_agent())
+    assert agent.summarizer == agent.summarize
+
+    monkeypatch.setenv("AGENT_SUMMARIZE", "false")
+    assert asyncio.run(create_agent()).summarizer is None
@@ -0,0 +1,120 @@
+import asyncio
+
+from whatsapp_bot.app.services.album_collector import AlbumCollector
+
+
+def job(value, delay: float = 0.0):
+    async def run():
+        await asyncio.sleep(delay)
+        if isinstance(value, Exception):
+            raise value
+        return value
+    return run
+
+
+def make_collector(
+    albums: list,
+    window: float = 0.05,
+    max_wait: float = 1.0,
+    max_size: int = 30,
+    max_concurrent: int = 16,
+    per_sender: int = 3,
+) -> AlbumCollector:
+    async def on_complete(key, results):
+        albums.append((key, results))
+    return AlbumCollector(
+        on_complete, window=window, max_wait=max_wait, max_size=max_size,
+        max_concurrent=max_concurrent, per_sender=per_sender
+    )
+
+
+def test_media_within_the_window_forms_one_album():
+    albums = []
+
+    async def scenario():
+        collector = make_collector(albums)
+        sizes = [collector.submit("alice", job(1)), collector.submit("alice", job(2, delay=0.03))]
+        await asyncio.sleep(0.03)
+        sizes.append(collector.submit("alice", job(3)))
+        collector.submit("bob", job(4))
+        await asyncio.sleep(0.15)
+        # After a quiet window, a new album starts
+        collector.submit("alice", job(5))
+        await collector.stop()
+        return sizes
+
+    assert asyncio.run(scenario()) == [1, 2, 3]
+    assert sorted(albums) == [("alice", [1, 2, 3]), ("alice", [5]), ("bob", [4])]
+
+
+def test_full_album_closes_without_waiting_for_the_window():
+    albums = []
+
+    async def scenario():
+        collector = make_collector(albums, window=5.0, max_wait=10.0, max_size=2)
+        collector.submit("alice", job(1))
+        collector.submit("alice", job(2))
+        await asyncio.sleep(0.05)
+        return list(albums)
+
+    assert asyncio.run(scenario()) == [("alice", [1, 2])]
+
+
+def test_max_wait_caps_an_album_that_keeps_growing():
+    albums = []
+
+    async def scenario():
+        collector = make_collector(albums, window=0.05, max_wait=0.12)
+        for index in range(8):
+            collector.submit("alice", job(index))
+            await asyncio.sleep(0.03)
+        await collector.stop()
+
+    asyncio.run(scenario())
+    assert len(albums) > 1
+    assert [value for _, results in albums for value in results] == list(range(8))
+
+
+def test_failures_are_reported_in_submission_order():
+    albums = []
+
+    async def scenario():
+        collector = make_collector(albums)
+        collector.submit("alice", job(1, delay=0.02))
+        collector.submit("alice", job(RuntimeError("upload failed")))
+        collector.submit("alice", job(3))
+        await collector.stop()
+        return collector.stats()
+
+    stats = asyncio.run(scenario())
+    results = albums[0][1]
+    assert results[0] == 1 and isinstance(results[1], RuntimeError) and results[2] == 3
+    assert (stats["jobs_completed"], stats["jobs_failed"], stats["albums_completed"]) == (2, 1, 1)
+
+
+def test_uploads_are_bounded_per_sender_and_overall():
+    peak = {"alice": 0, "all": 0}
+    running = {"alice": 0, "all": 0}
+
+    def tracked(key):
+        async def run():
+            running[key] = running.get(key, 0) + 1
+            running["all"] += 1
+            peak[key] = max(peak.get(key, 0), running[key])
+            peak["all"] = max(peak["all"], running["all"])
+            await asyncio.sleep(0.01)
+            running[key] -= 1
+            running["all"] -= 1
+        return run
+
+    async def scenario():
+        collector = make_collector([], max_concurrent=4, per_sender=2)
+        for _ in range(10):
+            collector.submit("alice", tracked("alice"))
+        for sender in ("bob", "carol", "dave"):
+            collector.submit(sender, tracked(sender))
+        await collector.stop()
+
+    asyncio.run(scenario())
+    assert peak["alice"] == 2
+    assert peak["all"] == 4
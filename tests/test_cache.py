@@ -0,0 +1,98 @@
+import asyncio
+import time
+
+import pytest
+
+from whatsapp_bot.app.services.cache import AsyncTTLCache, TTLCache
+
+
+def test_entries_expire_after_the_ttl():
+    cache = TTLCache(max_size=10, ttl=0.02)
+    cache.set("a", 1)
+    cache.set("b", 2, ttl=None)
+    assert cache.get("a") == 1
+    time.sleep(0.03)
+    assert cache.get("a") is None and cache.get("b") == 2
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = TTLCache(max_size=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert "b" not in cache and "a" in cache and "c" in cache
+    assert cache.stats()["evictions"] == 1
+
+
+class CountingLoader:
+    def __init__(self, delay: float = 0.02, results=None):
+        self.delay = delay
+        self.results = results
+        self.calls = 0
+
+    async def __call__(self, key):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.results is not None:
+            result = self.results[min(self.calls, len(self.results)) - 1]
+            if isinstance(result, Exception):
+                raise result
+            return result
+        return f"value-{key}-{self.calls}"
+
+
+def test_concurrent_misses_share_one_load():
+    loader = CountingLoader()
+
+    async def scenario():
+        cache = AsyncTTLCache(loader, ttl=60)
+        values = await asyncio.gather(*(cache.get("a") for _ in range(5)))
+        return values, await cache.get("a")
+
+    values, cached = asyncio.run(scenario())
+    assert values == ["value-a-1"] * 5 and cached == "value-a-1"
+    assert loader.calls == 1
+
+
+def test_none_is_cached_but_errors_are_not():
+    loader = CountingLoader(delay=0, results=[RuntimeError("down"), None, "late"])
+
+    async def scenario():
+        cache = AsyncTTLCache(loader, ttl=60, negative_ttl=60)
+        with pytest.raises(RuntimeError):
+            await cache.get("a")
+        return await cache.get("a"), await cache.get("a"), cache.stats()
+
+    first, second, stats = asyncio.run(scenario())
+    assert (first, second) == (None, None)
+    assert loader.calls == 2 and stats["load_errors"] == 1
+
+
+def test_cancelled_caller_does_not_cancel_the_others():
+    loader = CountingLoader(delay=0.05)
+
+    async def scenario():
+        cache = AsyncTTLCache(loader, ttl=60)
+        first = asyncio.ensure_future(cache.get("a"))
+        second = asyncio.ensure_future(cache.get("a"))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        return await second, first.cancelled()
+
+    assert asyncio.run(scenario()) == ("value-a-1", True)
+    assert loader.calls == 1
+
+
+def test_load_running_during_invalidate_is_not_stored():
+    loader = CountingLoader(delay=0.05)
+
+    async def scenario():
+        cache = AsyncTTLCache(loader, ttl=60)
+        stale = asyncio.ensure_future(cache.get("a"))
+        await asyncio.sleep(0.01)
+        cache.invalidate("a")
+        # The waiter still gets its answer, but later reads load again
+        return await stale, await cache.get("a")
+
+    assert asyncio.run(scenario()) == ("value-a-1", "value-a-2")
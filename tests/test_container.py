@@ -0,0 +1,120 @@
+import asyncio
+
+import pytest
+
+from whatsapp_bot.app.services.container import ServiceContainer
+
+
+def counting_factory(calls, name, delay=0.01, error=None):
+    async def factory():
+        calls.append(name)
+        await asyncio.sleep(delay)
+        if error is not None:
+            raise error
+        return f"{name} instance"
+    return factory
+
+
+def test_startup_initializes_only_required_services():
+    calls = []
+    container = ServiceContainer()
+    container.register("firestore", counting_factory(calls, "firestore"))
+    container.register("agent", counting_factory(calls, "agent"), required=False)
+
+    async def scenario():
+        readiness = await container.startup()
+        assert container.peek("agent") is None
+        assert await container.get("agent") == "agent instance"
+        return readiness
+
+    readiness = asyncio.run(scenario())
+    assert readiness["ready"]
+    assert readiness["services"]["agent"]["status"] == "pending"
+    assert calls == ["firestore", "agent"]
+
+
+def test_startup_with_names_initializes_optional_services():
+    calls = []
+    container = ServiceContainer()
+    container.register("firestore", counting_factory(calls, "firestore"))
+    container.register("agent", counting_factory(calls, "agent"), required=False)
+
+    readiness = asyncio.run(container.startup(["firestore", "agent"]))
+    assert readiness["services"]["agent"]["status"] == "ready"
+    assert sorted(calls) == ["agent", "firestore"]
+
+
+def test_concurrent_gets_share_one_initialization():
+    calls = []
+    container = ServiceContainer()
+    container.register("storage", counting_factory(calls, "storage"))
+
+    async def scenario():
+        return await asyncio.gather(*(container.get("storage") for _ in range(5)))
+
+    assert asyncio.run(scenario()) == ["storage instance"] * 5
+    assert calls == ["storage"]
+
+
+def test_failed_service_is_reported_and_retried():
+    calls = []
+    failures = [RuntimeError("no credentials")]
+
+    async def factory():
+        calls.append("firebase")
+        if failures:
+            raise failures.pop()
+        return "firebase app"
+
+    container = ServiceContainer()
+    container.register("firebase", factory)
+    container.register("agent", counting_factory([], "agent", error=RuntimeError("no key")), required=False)
+
+    async def scenario():
+        readiness = await container.startup()
+        assert await container.get("firebase") == "firebase app"
+        with pytest.raises(RuntimeError):
+            await container.get("agent")
+        return readiness, container.readiness()
+
+    before, after = asyncio.run(scenario())
+    assert not before["ready"]
+    assert before["services"]["firebase"]["status"] == "error"
+    assert before["services"]["firebase"]["error"] == "no credentials"
+    # An optional service that fails does not make the app unready
+    assert after["ready"]
+    assert after["services"]["agent"]["status"] == "error"
+    assert calls == ["firebase", "firebase"]
+
+
+def test_cancelled_caller_does_not_cancel_initialization():
+    container = ServiceContainer()
+    container.register("storage", counting_factory([], "storage", delay=0.05))
+
+    async def scenario():
+        caller = asyncio.create_task(container.get("storage"))
+        await asyncio.sleep(0.01)
+        caller.cancel()
+        return await container.get("storage")
+
+    assert asyncio.run(scenario()) == "storage instance"
+
+
+def test_shutdown_closes_owned_services_only():
+    closed = []
+
+    async def close(instance):
+        closed.append(instance)
+
+    container = ServiceContainer()
+    container.register("firebase", counting_factory([], "firebase", delay=0), closer=close)
+    container.override("http", "fake client")
+
+    async def scenario():
+        await container.startup()
+        await container.shutdown()
+
+    asyncio.run(scenario())
+    assert closed == ["firebase instance"]
+    assert container.readiness()["services"]["firebase"]["status"] == "pending"
+    assert container.peek("http") == "fake client"
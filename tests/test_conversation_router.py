@@ -0,0 +1,69 @@
+import pytest
+
+from whatsapp_bot.app.routes import webhook
+from whatsapp_bot.app.services.conversation_router import ConversationRouter, IntentMatcher
+
+
+@pytest.fixture
+def matcher() -> IntentMatcher:
+    matcher = IntentMatcher()
+    matcher.add("greeting", ["hi", "hello"])
+    matcher.add("orders", ["order", "order status"])
+    matcher.add("support", ["need help"])
+    return matcher
+
+
+@pytest.mark.parametrize("text, intent", [
+    ("hi", "greeting"),
+    ("Hi there!", "greeting"),
+    ("HELLO", "greeting"),
+    ("what is my order status?", "orders"),
+    ("I need help, please", "support"),
+    ("this is about shipping", None),
+    ("hierarchy", None),
+    ("reorder", None),
+    ("", None),
+])
+def test_keywords_match_whole_words_only(matcher, text, intent):
+    assert matcher.match(text) == intent
+
+
+def test_keywords_added_later_are_matched(matcher):
+    assert matcher.match("price list") is None
+    matcher.add("pricing", ["price"])
+    assert matcher.match("price list") == "pricing"
+
+
+def test_regex_characters_in_keywords_are_literal():
+    matcher = IntentMatcher()
+    matcher.add("faq", ["f.a.q"])
+    assert matcher.match("see the f.a.q") == "faq"
+    assert matcher.match("see the fxaxq") is None
+
+
+def test_button_ids_fall_back_to_the_longest_prefix():
+    router = ConversationRouter()
+
+    @router.button_prefix("category_")
+    async def category(*args):
+        return {}
+
+    @router.button_prefix("category_special_")
+    async def special(*args):
+        return {}
+
+    @router.button_reply("category_all")
+    async def all_categories(*args):
+        return {}
+
+    assert router.resolve_button_reply("category_all") is all_categories
+    assert router.resolve_button_reply("category_processor") is category
+    assert router.resolve_button_reply("category_special_gpu") is special
+    assert router.resolve_button_reply("unknown") is None
+    assert router.resolve_button_reply(None) is None
+
+
+def test_webhook_menu_intent_ignores_words_containing_hi():
+    assert webhook.conversation.resolve_intent("hi") is webhook.send_menu_for_intent
+    assert webhook.conversation.resolve_intent("which shipping options do you have") is webhook.send_menu_for_intent
+    assert webhook.conversation.resolve_intent("thinking about shipping") is None
@@ -0,0 +1,148 @@
+import asyncio
+import time
+
+from whatsapp_bot.app.routes import webhook
+from whatsapp_bot.app.services.album_collector import AlbumCollector
+from whatsapp_bot.app.services.cache import TTLCache
+from whatsapp_bot.app.services.dedup import InMemoryDedupBackend, MessageDeduplicator, SQLiteDedupBackend
+from whatsapp_bot.app.services.sessions import session_manager
+
+
+def test_second_delivery_is_a_duplicate():
+    async def scenario():
+        dedup = MessageDeduplicator(InMemoryDedupBackend(max_size=100, ttl=60))
+        return [await dedup.is_duplicate("wamid.1"), await dedup.is_duplicate("wamid.1"), await dedup.is_duplicate(None)]
+
+    assert asyncio.run(scenario()) == [False, True, False]
+
+
+def test_released_claim_is_processed_again():
+    async def scenario():
+        dedup = MessageDeduplicator(InMemoryDedupBackend(max_size=100, ttl=60))
+        await dedup.is_duplicate("wamid.1")
+        await dedup.release("wamid.1")
+        return await dedup.is_duplicate("wamid.1")
+
+    assert asyncio.run(scenario()) is False
+
+
+def test_sqlite_backend_is_shared_between_workers(tmp_path):
+    path = str(tmp_path / "dedup.sqlite3")
+
+    async def scenario():
+        first = MessageDeduplicator(SQLiteDedupBackend(path, ttl=60), local=TTLCache(ttl=60))
+        second = MessageDeduplicator(SQLiteDedupBackend(path, ttl=60), local=TTLCache(ttl=60))
+        results = [await first.is_duplicate("wamid.1"), await second.is_duplicate("wamid.1")]
+        # A release clears the shared row and the releasing worker's local cache
+        await first.release("wamid.2")
+        await second.is_duplicate("wamid.2")
+        await second.release("wamid.2")
+        results.append(await first.is_duplicate("wamid.2"))
+        await first.backend.close()
+        await second.backend.close()
+        return results
+
+    assert asyncio.run(scenario()) == [False, True, False]
+
+
+def test_sqlite_claim_takes_over_expired_entries(tmp_path):
+    backend = SQLiteDedupBackend(str(tmp_path / "dedup.sqlite3"), ttl=0.05)
+
+    async def scenario():
+        first = await backend.claim("wamid.1")
+        time.sleep(0.1)
+        return first, await backend.claim("wamid.1")
+
+    assert asyncio.run(scenario()) == (True, True)
+
+
+def test_failed_processing_releases_the_claim(monkeypatch):
+    attempts = []
+
+    async def flaky_handler(message, phone_number, session):
+        attempts.append(message["id"])
+        if len(attempts) == 1:
+            raise RuntimeError("Firestore unavailable")
+        return {"status": "success"}
+
+    monkeypatch.setattr(webhook, "handle_message", flaky_handler)
+    monkeypatch.setattr(webhook, "deduplicator", MessageDeduplicator(InMemoryDedupBackend(max_size=100, ttl=60)))
+    message = {"id": "wamid.retry", "from": "15550000001", "type": "text", "text": {"body": "hi"}}
+
+    async def scenario():
+        return [
+            (await webhook.process_message(message))["status"],
+            (await webhook.process_message(message))["status"],
+            (await webhook.process_message(message))["status"],
+        ]
+
+    assert asyncio.run(scenario()) == ["error", "success", "duplicate"]
+
+
+def test_handler_error_result_releases_the_claim(monkeypatch):
+    async def failing_handler(message, phone_number, session):
+        return {"status": "error", "message": "Unsupported interactive message type"}
+
+    monkeypatch.setattr(webhook, "handle_message", failing_handler)
+    monkeypatch.setattr(webhook, "deduplicator", MessageDeduplicator(InMemoryDedupBackend(max_size=100, ttl=60)))
+    message = {"id": "wamid.interactive", "from": "15550000002", "type": "interactive", "interactive": {}}
+
+    async def scenario():
+        return [(await webhook.process_message(message))["status"] for _ in range(2)]
+
+    assert asyncio.run(scenario()) == ["error", "error"]
+
+
+def install_image_fakes(monkeypatch, stored: list, partner_delay: float = 0.0):
+    async def get_partner(phone_number):
+        await asyncio.sleep(partner_delay)
+        return {"name": "Dealer", "doc_id": "partner-1"}
+
+    async def get_media_url(media_id):
+        return {"status": "success", "url": f"https://cdn.test/{media_id}", "file_size": 10}
+
+    async def store_image_in_firestore(phone_number, url, image_id, caption, **kwargs):
+        stored.append(image_id)
+        if len(stored) == 1:
+            return {"status": "error", "message": "Storage bucket unavailable"}
+        return {"status": "success", "data": {"photoId": image_id}}
+
+    async def send_whatsapp_message(*args, **kwargs):
+        return {}
+
+    monkeypatch.setattr(webhook, "get_partner", get_partner)
+    monkeypatch.setattr(webhook, "get_media_url", get_media_url)
+    monkeypatch.setattr(webhook, "store_image_in_firestore", store_image_in_firestore)
+    monkeypatch.setattr(webhook, "send_whatsapp_message", send_whatsapp_message)
+    monkeypatch.setattr(webhook, "deduplicator", MessageDeduplicator(InMemoryDedupBackend(max_size=100, ttl=60)))
+    monkeypatch.setattr(webhook, "image_albums", AlbumCollector(webhook.confirm_album, window=0.01, max_wait=1.0))
+
+
+def test_failed_album_upload_releases_the_claim(monkeypatch):
+    stored = []
+    install_image_fakes(monkeypatch, stored)
+    message = {"id": "wamid.image", "from": "15550000003", "type": "image", "image": {"id": "media-1"}}
+
+    async def scenario():
+        statuses = []
+        for _ in range(3):
+            statuses.append((await webhook.process_message(message))["status"])
+            # The upload runs after the webhook was acknowledged
+            await webhook.image_albums.stop()
+        return statuses
+
+    assert asyncio.run(scenario()) == ["accepted", "accepted", "duplicate"]
+    assert stored == ["media-1", "media-1"]
+
+
+def test_image_partner_lookup_is_saved_with_the_session(monkeypatch):
+    install_image_fakes(monkeypatch, [], partner_delay=0.05)
+    phone_number = "15550000004"
+    message = {"id": "wamid.slow-partner", "from": phone_number, "type": "image", "image": {"id": "media-2"}}
+
+    async def scenario():
+        await webhook.process_message(message)
+        await webhook.image_albums.stop()
+        return await session_manager.get_session(phone_number)
+
+    assert asyncio.run(scenario())["partner_info"] == {"name": "Dealer", "doc_id": "partner-1"}
@@ -0,0 +1,93 @@
+import asyncio
+
+import httpx
+import pytest
+
+from whatsapp_bot.app.services import http_client
+from whatsapp_bot.app.services.http_client import GraphClient, close_http_client, get_http_client, set_http_client
+
+
+@pytest.fixture(autouse=True)
+def no_shared_client():
+    set_http_client(None)
+    yield
+    set_http_client(None)
+
+
+def test_shared_client_is_reused_until_closed():
+    async def scenario():
+        client = get_http_client()
+        assert get_http_client() is client
+        await close_http_client()
+        assert http_client._client is None
+        replacement = get_http_client()
+        await close_http_client()
+        return client, replacement
+
+    client, replacement = asyncio.run(scenario())
+    assert client is not replacement
+    assert client.is_closed
+
+
+def test_counters_track_in_flight_waits_and_errors():
+    async def scenario():
+        gate = asyncio.Event()
+
+        async def handle(request):
+            if request.url.path == "/fail":
+                raise httpx.ConnectError("refused")
+            await gate.wait()
+            return httpx.Response(200)
+
+        client = GraphClient(http2=False, max_connections=2, transport=httpx.MockTransport(handle))
+        pending = [asyncio.create_task(client.get("https://graph.test/slow")) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        busy = client.pool_metrics()
+        gate.set()
+        await asyncio.gather(*pending)
+        with pytest.raises(httpx.ConnectError):
+            await client.get("https://graph.test/fail")
+        done = client.pool_metrics()
+        await client.aclose()
+        return busy, done
+
+    busy, done = asyncio.run(scenario())
+    assert busy["requests_in_flight"] == 3
+    # The third request started with both connections in use
+    assert busy["pool_waits_estimated"] == 1
+    assert done["requests_in_flight"] == 0
+    assert done["requests_total"] == 4
+    assert done["request_errors"] == 1
+
+
+def test_stream_releases_its_slot():
+    async def handle(request):
+        return httpx.Response(200, content=b"x" * 1000)
+
+    async def scenario():
+        client = GraphClient(http2=False, transport=httpx.MockTransport(handle))
+        async with client.stream("GET", "https://cdn.test/media") as response:
+            body = await response.aread()
+            during = client.pool_metrics()["requests_in_flight"]
+        after = client.pool_metrics()["requests_in_flight"]
+        await client.aclose()
+        return body, during, after
+
+    assert asyncio.run(scenario()) == (b"x" * 1000, 1, 0)
+
+
+def test_http2_falls_back_without_h2(monkeypatch):
+    monkeypatch.setattr(http_client, "_http2_available", lambda: False)
+    client = GraphClient(http2=True)
+    assert client.http2 is False
+    asyncio.run(client.aclose())
+
+
+def test_settings_come_from_the_environment(monkeypatch):
+    monkeypatch.setenv("GRAPH_MAX_CONNECTIONS", "7")
+    monkeypatch.setenv("GRAPH_MAX_KEEPALIVE", "3")
+    monkeypatch.setenv("GRAPH_HTTP2", "false")
+    client = GraphClient()
+    metrics = client.pool_metrics()
+    asyncio.run(client.aclose())
+    assert (metrics["http2"], metrics["max_connections"], metrics["max_keepalive_connections"]) == (False, 7, 3)
@@ -0,0 +1,76 @@
+import importlib.util
+import io
+
+import pytest
+
+from whatsapp_bot.app.services import image_variants
+from whatsapp_bot.app.services.photo_index import hamming
+
+Image = pytest.importorskip("PIL.Image")
+
+
+def photo(width=1200, height=900, exif_orientation=None, quality=90, mirrored=False) -> bytes:
+    # Diagonal gradient, so neighbouring pixels differ both across and down
+    image = Image.linear_gradient("L").rotate(45, expand=True).resize((width, height)).convert("RGB")
+    if mirrored:
+        image = image.transpose(Image.Transpose.FLIP_LEFT_RIGHT)
+    exif = Image.Exif()
+    if exif_orientation is not None:
+        exif[0x0112] = exif_orientation
+    output = io.BytesIO()
+    image.save(output, format="JPEG", quality=quality, exif=exif.tobytes())
+    return output.getvalue()
+
+
+@pytest.mark.parametrize("setting, expected", [("true", True), ("TRUE", True), ("false", False), ("", False)])
+def test_variants_are_opt_in(monkeypatch, setting, expected):
+    monkeypatch.setenv("IMAGE_VARIANTS", setting)
+    assert image_variants.variants_enabled() is expected
+
+
+@pytest.mark.parametrize("setting, expected", [("flag", "flag"), ("SKIP", "skip"), ("off", "off"), ("bogus", "off")])
+def test_near_duplicate_mode(monkeypatch, setting, expected):
+    monkeypatch.setenv("PHOTO_NEAR_DUPLICATES", setting)
+    assert image_variants.near_duplicate_mode() == expected
+
+
+def test_features_are_off_without_pillow(monkeypatch):
+    find_spec = importlib.util.find_spec
+    monkeypatch.setattr(importlib.util, "find_spec", lambda name: None if name == "PIL" else find_spec(name))
+    monkeypatch.setenv("IMAGE_VARIANTS", "true")
+    monkeypatch.setenv("PHOTO_NEAR_DUPLICATES", "skip")
+    assert image_variants.variants_enabled() is False
+    assert image_variants.near_duplicate_mode() == "off"
+
+
+def test_render_variants_sizes():
+    result = image_variants.render_variants(photo(), [320, 800, 1600], 1000, "WEBP", 80)
+
+    assert (result["width"], result["height"]) == (1200, 900)
+    assert result["content_type"] == "image/webp"
+    # Thumbnails no smaller than the original are left out; the full size is capped
+    assert [(v["name"], v["width"], v["height"]) for v in result["variants"]] == [
+        ("w320", 320, 240), ("w800", 800, 600), ("full", 1000, 750),
+    ]
+    with Image.open(io.BytesIO(result["variants"][0]["data"])) as variant:
+        assert variant.format == "WEBP"
+        assert variant.size == (320, 240)
+
+
+def test_render_variants_applies_orientation_and_drops_exif():
+    # Orientation 6: stored landscape, displayed rotated to portrait
+    result = image_variants.render_variants(photo(exif_orientation=6), [], 4096, "JPEG", 80)
+
+    assert (result["width"], result["height"]) == (900, 1200)
+    with Image.open(io.BytesIO(result["variants"][0]["data"])) as variant:
+        assert variant.size == (900, 1200)
+        assert not variant.getexif()
+
+
+def test_difference_hash_survives_recompression_and_resizing():
+    original = image_variants.difference_hash(photo(quality=95))
+    recompressed = image_variants.difference_hash(photo(width=600, height=450, quality=40))
+    different = image_variants.difference_hash(photo(mirrored=True))
+
+    assert hamming(original, recompressed) <= 4
+    assert hamming(original, different) > 10
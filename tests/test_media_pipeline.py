@@ -0,0 +1,288 @@
+import asyncio
+import base64
+import hashlib
+import os
+
+import httpx
+import pytest
+
+from whatsapp_bot.app.services import media_pipeline
+from whatsapp_bot.app.services.http_client import GraphClient, set_http_client
+from whatsapp_bot.app.services.media_pipeline import (
+    EmptyMediaError, MediaIntegrityError, MediaUploadError, stream_media_to_blob
+)
+
+DATA = os.urandom(1024 * 1024 + 123)
+DROP_AT = 700_000
+CHUNK_SIZE = 256 * 1024
+DATA_SHA256 = hashlib.sha256(DATA).hexdigest()
+
+
+class FakeWriter:
+    def __init__(self):
+        self.data = bytearray()
+        self.closed = False
+
+    def write(self, chunk: bytes) -> int:
+        self.data += chunk
+        return len(chunk)
+
+    def close(self):
+        self.closed = True
+
+
+class FakeBlob:
+    def __init__(self):
+        self.writer = None
+
+    def open(self, mode, **kwargs):
+        self.writer = FakeWriter()
+        return self.writer
+
+
+class FakeCdn:
+    """Serves DATA; the first response is cut off after ``drop_at`` bytes."""
+
+    def __init__(self, ranges: str = "honour", drop_at: int = DROP_AT, resume_offset: int = 0, delay: float = 0.0):
+        self.ranges = ranges
+        self.drop_at = drop_at
+        self.resume_offset = resume_offset
+        self.delay = delay
+        self.requests = []
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request.headers.get("range"))
+        await asyncio.sleep(self.delay)
+        start, status, headers = 0, 200, {"content-type": "image/jpeg"}
+        requested = request.headers.get("range")
+        if requested and self.ranges == "honour":
+            start = int(requested[len("bytes="):-1]) + self.resume_offset
+            if start >= len(DATA):
+                return httpx.Response(416, headers={"content-range": f"bytes */{len(DATA)}"})
+            status = 206
+            headers["content-range"] = f"bytes {start}-{len(DATA) - 1}/{len(DATA)}"
+        body = DATA[start:]
+
+        if len(self.requests) == 1 and self.drop_at is not None:
+            async def dropped():
+                yield body[:self.drop_at // 2]
+                yield body[self.drop_at // 2:self.drop_at]
+                raise httpx.ReadError("connection reset", request=request)
+            return httpx.Response(status, content=dropped(), headers=headers)
+        return httpx.Response(status, content=body, headers=headers)
+
+
+@pytest.fixture
+def install(monkeypatch):
+    monkeypatch.setattr(media_pipeline, "backoff_delay", lambda attempt: 0.0)
+
+    def install_cdn(cdn: FakeCdn):
+        set_http_client(GraphClient(http2=False, transport=httpx.MockTransport(cdn.handle)))
+        return cdn
+
+    yield install_cdn
+    set_http_client(None)
+
+
+def stream(
+    blob,
+    chunk_size: int = CHUNK_SIZE,
+    expected_size=len(DATA),
+    expected_sha256=DATA_SHA256,
+    before_commit=None,
+    keep_content: bool = False,
+):
+    return asyncio.run(stream_media_to_blob(
+        "https://cdn.test/media", {}, blob,
+        chunk_size=chunk_size, before_commit=before_commit, keep_content=keep_content,
+        expected_size=expected_size, expected_sha256=expected_sha256,
+    ))
+
+
+def test_partial_content_resumes_after_the_drop(install):
+    cdn = install(FakeCdn())
+    blob = FakeBlob()
+    result = stream(blob)
+
+    assert cdn.requests == [None, f"bytes={DROP_AT}-"]
+    assert (result["resumes"], result["committed"]) == (1, True)
+    assert bytes(blob.writer.data) == DATA and blob.writer.closed
+
+
+def test_full_response_to_a_range_request_skips_what_was_received(install):
+    cdn = install(FakeCdn(ranges="ignore"))
+    blob = FakeBlob()
+    result = stream(blob, expected_sha256=base64.b64encode(hashlib.sha256(DATA).digest()).decode())
+
+    assert len(cdn.requests) == 2
+    assert result["size"] == len(DATA)
+    assert bytes(blob.writer.data) == DATA
+
+
+def test_unsatisfiable_range_after_a_complete_body_is_success(install):
+    cdn = install(FakeCdn(drop_at=len(DATA)))
+    blob = FakeBlob()
+    result = stream(blob)
+
+    assert cdn.requests == [None, f"bytes={len(DATA)}-"]
+    assert result["committed"] and bytes(blob.writer.data) == DATA
+
+
+def test_unsatisfiable_range_before_the_end_fails(install):
+    install(FakeCdn(resume_offset=len(DATA)))
+    with pytest.raises(httpx.HTTPStatusError):
+        stream(FakeBlob())
+
+
+def test_resume_past_the_received_bytes_is_an_integrity_error(install):
+    install(FakeCdn(resume_offset=10))
+    blob = FakeBlob()
+    with pytest.raises(MediaIntegrityError):
+        stream(blob)
+    assert not blob.writer.closed
+
+
+def test_hash_mismatch_is_not_committed(install):
+    install(FakeCdn(drop_at=None))
+    blob = FakeBlob()
+    with pytest.raises(MediaIntegrityError):
+        stream(blob, expected_sha256="00" * 32)
+    assert not blob.writer.closed
+
+
+def test_deadline_bounds_the_whole_download(install):
+    install(FakeCdn(drop_at=None, delay=1.0))
+
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        return await stream_media_to_blob("https://cdn.test/media", {}, FakeBlob(), deadline=loop.time() + 0.05)
+
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(scenario())
+
+
+def test_before_commit_can_abandon_the_upload(install):
+    install(FakeCdn(drop_at=None))
+    blob = FakeBlob()
+
+    async def reject(result):
+        return False
+
+    result = stream(blob, before_commit=reject, keep_content=True)
+    assert result["committed"] is False and result["content"] == DATA
+    assert not blob.writer.closed
+
+
+@pytest.mark.parametrize("reported", [str(len(DATA)), None, "", "unknown", 0])
+def test_reported_size_may_be_a_string_or_missing(install, reported):
+    install(FakeCdn(drop_at=None))
+    blob = FakeBlob()
+    result = stream(blob, expected_size=reported)
+    assert result["committed"] and result["size"] == len(DATA)
+
+
+def test_string_size_that_differs_still_fails(install):
+    install(FakeCdn(drop_at=None))
+    with pytest.raises(MediaIntegrityError):
+        stream(FakeBlob(), expected_size=str(len(DATA) + 1))
+
+
+class RecordingBlob(FakeBlob):
+    """Logs each write alongside the CDN's progress, to see how the two overlap."""
+
+    def __init__(self, events: list, fail_after: int = None):
+        super().__init__()
+        self.events = events
+        self.fail_after = fail_after
+        self.options = None
+
+    def open(self, mode, **kwargs):
+        self.options = kwargs
+        writer = super().open(mode, **kwargs)
+        write = writer.write
+
+        def record(chunk):
+            if self.fail_after is not None and len(writer.data) >= self.fail_after:
+                raise IOError("storage unavailable")
+            self.events.append(("write", len(chunk)))
+            return write(chunk)
+
+        writer.write = record
+        return writer
+
+
+def trickling_cdn(events: list, pieces: int = 8, content_type: str = None):
+    async def handle(request):
+        async def body():
+            step = -(-len(DATA) // pieces)
+            for start in range(0, len(DATA), step):
+                events.append(("served", start))
+                yield DATA[start:start + step]
+                await asyncio.sleep(0.005)
+        headers = {"content-type": content_type} if content_type else {}
+        return httpx.Response(200, content=body(), headers=headers)
+    return handle
+
+
+def test_upload_starts_before_the_download_ends(install):
+    events = []
+    set_http_client(GraphClient(http2=False, transport=httpx.MockTransport(trickling_cdn(events))))
+    blob = RecordingBlob(events)
+    result = stream(blob, chunk_size=100_000)
+
+    assert result["committed"] and bytes(blob.writer.data) == DATA
+    # The chunk size is rounded up to the resumable upload's 256 KiB granularity
+    assert blob.options["chunk_size"] == CHUNK_SIZE
+    writes = [size for kind, size in events if kind == "write"]
+    assert len(writes) > 1 and all(size >= CHUNK_SIZE for size in writes[:-1])
+    first_write = next(i for i, event in enumerate(events) if event[0] == "write")
+    last_served = max(i for i, event in enumerate(events) if event[0] == "served")
+    assert first_write < last_served
+
+
+def test_content_type_comes_from_the_cdn(install):
+    set_http_client(GraphClient(http2=False, transport=httpx.MockTransport(trickling_cdn([], content_type="image/png"))))
+    blob = RecordingBlob([])
+    assert stream(blob)["content_type"] == "image/png"
+    assert blob.options["content_type"] == "image/png"
+
+    set_http_client(GraphClient(http2=False, transport=httpx.MockTransport(trickling_cdn([]))))
+    assert stream(RecordingBlob([]))["content_type"] == "image/jpeg"
+
+
+def test_empty_media_is_rejected(install):
+    async def handle(request):
+        return httpx.Response(200, content=b"")
+
+    set_http_client(GraphClient(http2=False, transport=httpx.MockTransport(handle)))
+    blob = FakeBlob()
+    with pytest.raises(EmptyMediaError):
+        stream(blob, expected_size=None, expected_sha256=None)
+    assert blob.writer is None or not blob.writer.closed
+
+
+def test_storage_failure_stops_the_download(install):
+    events = []
+    set_http_client(GraphClient(http2=False, transport=httpx.MockTransport(trickling_cdn(events, pieces=16))))
+    blob = RecordingBlob(events, fail_after=CHUNK_SIZE)
+
+    with pytest.raises(MediaUploadError):
+        stream(blob)
+    assert not blob.writer.closed
+    # The download was given up well before the end of the file
+    assert len([event for event in events if event[0] == "served"]) < 16
+
+
+def test_blob_factory_is_awaited_while_the_download_runs(install):
+    cdn = install(FakeCdn(drop_at=None))
+    blob = FakeBlob()
+    requests_when_resolved = []
+
+    async def resolve_blob():
+        requests_when_resolved.append(len(cdn.requests))
+        return blob
+
+    result = stream(resolve_blob)
+    assert result["committed"] and bytes(blob.writer.data) == DATA
+    # The CDN request was already made when the blob was asked for
+    assert requests_when_resolved == [1]
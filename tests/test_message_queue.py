@@ -0,0 +1,103 @@
+import asyncio
+import contextvars
+
+from whatsapp_bot.app.services.message_queue import MessageWorkerPool
+
+request_id: contextvars.ContextVar = contextvars.ContextVar("request_id", default=None)
+
+
+def test_same_key_is_processed_in_order_while_keys_run_concurrently():
+    log = []
+
+    async def handler(item):
+        key, n = item
+        # Later items of a key must wait for this one, however long it takes
+        await asyncio.sleep(0.02 if item == ("A", 0) else 0)
+        log.append(item)
+
+    async def scenario():
+        pool = MessageWorkerPool(handler, workers=4, queue_size=10)
+        for n in range(3):
+            for key in ("A", "B"):
+                assert await pool.submit(key, (key, n))
+        await pool.stop(drain=True)
+        return pool.stats()
+
+    stats = asyncio.run(scenario())
+    assert [n for key, n in log if key == "A"] == [0, 1, 2]
+    assert [n for key, n in log if key == "B"] == [0, 1, 2]
+    # A and B land on different workers, so B is not held up by A's slow first message
+    assert log[:3] == [("B", 0), ("B", 1), ("B", 2)]
+    assert stats["processed"] == 6 and stats["failed"] == 0
+
+
+def test_full_shard_rejects_after_the_timeout():
+    release = None
+
+    async def handler(item):
+        await release.wait()
+
+    async def scenario():
+        nonlocal release
+        release = asyncio.Event()
+        pool = MessageWorkerPool(handler, workers=1, queue_size=1, enqueue_timeout=0.01)
+        results = [await pool.submit("A", n) for n in range(3)]
+        release.set()
+        await pool.stop(drain=True)
+        return results, pool.stats()
+
+    results, stats = asyncio.run(scenario())
+    # One item is being handled, one waits in the queue, the third does not fit
+    assert results == [True, True, False]
+    assert (stats["accepted"], stats["rejected"], stats["processed"]) == (2, 1, 2)
+
+
+def test_handler_errors_do_not_stop_the_worker():
+    async def handler(item):
+        if item == "bad":
+            raise ValueError(item)
+
+    async def scenario():
+        pool = MessageWorkerPool(handler, workers=1, queue_size=10)
+        for item in ("bad", "good", "good"):
+            await pool.submit("A", item)
+        await pool.stop(drain=True)
+        return pool.stats()
+
+    stats = asyncio.run(scenario())
+    assert (stats["processed"], stats["failed"]) == (2, 1)
+
+
+def test_handler_runs_in_the_submitters_context():
+    seen = []
+
+    async def handler(item):
+        seen.append(request_id.get())
+
+    async def scenario():
+        pool = MessageWorkerPool(handler, workers=2, queue_size=10)
+        for n in range(3):
+            request_id.set(f"request-{n}")
+            await pool.submit("A", n)
+        await pool.stop(drain=True)
+
+    asyncio.run(scenario())
+    assert seen == ["request-0", "request-1", "request-2"]
+
+
+def test_stop_without_drain_drops_queued_items():
+    processed = []
+
+    async def handler(item):
+        await asyncio.sleep(1)
+        processed.append(item)
+
+    async def scenario():
+        pool = MessageWorkerPool(handler, workers=1, queue_size=10)
+        for n in range(3):
+            await pool.submit("A", n)
+        await pool.stop(drain=False)
+        return pool.running
+
+    assert asyncio.run(scenario()) is False
+    assert processed == []
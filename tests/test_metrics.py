@@ -0,0 +1,100 @@
+import asyncio
+
+import pytest
+
+from whatsapp_bot.app.services import metrics
+from whatsapp_bot.app.services.metrics import STAGE_ERRORS, STAGE_SECONDS, MetricsRegistry, record_error, timed
+from whatsapp_bot.app.services.tracing import SpanExporter, Tracer
+
+
+class RecordingExporter(SpanExporter):
+    def __init__(self):
+        self.spans = []
+
+    def export(self, spans):
+        self.spans.extend(spans)
+
+
+def test_counter_and_callback_render_in_text_format():
+    registry = MetricsRegistry()
+    messages = registry.counter("messages_total", "Inbound messages", ("type",))
+    registry.callback("queue_depth", "Waiting messages", "gauge", (), lambda: {(): 3})
+    messages.inc("text")
+    messages.inc("text")
+    messages.inc('say "hi"\n', amount=0.5)
+
+    assert messages.value("text") == 2 and messages.value("image") == 0
+    assert registry.render().splitlines() == [
+        "# HELP messages_total Inbound messages",
+        "# TYPE messages_total counter",
+        'messages_total{type="text"} 2',
+        'messages_total{type="say \\"hi\\"\\n"} 0.5',
+        "# HELP queue_depth Waiting messages",
+        "# TYPE queue_depth gauge",
+        "queue_depth 3",
+    ]
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = MetricsRegistry()
+    stages = registry.histogram("stage_seconds", "Stage time", ("stage",), buckets=(1.0, 0.1))
+    for value in (0.05, 0.1, 0.5, 2.0):
+        stages.observe(value, "upload")
+
+    assert stages.buckets == (0.1, 1.0)
+    assert stages.snapshot("upload") == {"count": 4, "sum": 2.65}
+    assert stages.snapshot("download") == {"count": 0, "sum": 0.0}
+    assert stages.label_values() == [("upload",)]
+    # Bounds are inclusive, as Prometheus expects
+    assert list(stages.render()) == [
+        'stage_seconds_bucket{stage="upload",le="0.1"} 2',
+        'stage_seconds_bucket{stage="upload",le="1.0"} 3',
+        'stage_seconds_bucket{stage="upload",le="+Inf"} 4',
+        'stage_seconds_sum{stage="upload"} 2.65',
+        'stage_seconds_count{stage="upload"} 4',
+    ]
+
+
+def test_names_are_registered_once():
+    registry = MetricsRegistry()
+    registry.counter("messages_total", "Inbound messages")
+    with pytest.raises(ValueError):
+        registry.histogram("messages_total", "Inbound messages")
+
+
+def test_timed_records_duration_and_errors():
+    before = STAGE_SECONDS.snapshot("test_stage")["count"]
+    errors = STAGE_ERRORS.value("test_stage")
+
+    with timed("test_stage") as stage:
+        stage.set_attribute("ignored", True)
+
+    async def failing():
+        with timed("test_stage"):
+            await asyncio.sleep(0)
+            raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(failing())
+    record_error("test_stage")
+
+    assert STAGE_SECONDS.snapshot("test_stage")["count"] == before + 2
+    assert STAGE_ERRORS.value("test_stage") == errors + 2
+
+
+def test_timed_stages_nest_as_spans(monkeypatch):
+    exporter = RecordingExporter()
+    tracer = Tracer(exporter=exporter, batch_size=100)
+    monkeypatch.setattr(metrics, "tracer", tracer)
+
+    with timed("media_transfer", attempt=1) as outer:
+        outer.set_attribute("size", 10)
+        with timed("storage_upload"):
+            pass
+    tracer.flush()
+
+    inner_span, outer_span = exporter.spans
+    assert (outer_span.name, inner_span.name) == ("media_transfer", "storage_upload")
+    assert inner_span.parent_id == outer_span.context.span_id
+    assert outer_span.attributes == {"attempt": 1, "size": 10}
+    assert tracer.current_context() is None
@@ -0,0 +1,109 @@
+import asyncio
+import hashlib
+
+import pytest
+
+from benchmarks.loadtest.fakes import FakeBucket, FakeFirestore, FakeGraph, Latency
+from benchmarks.loadtest.payloads import partner_phone
+from whatsapp_bot.app.services import container, firestore_service
+from whatsapp_bot.app.services.container import ServiceContainer
+from whatsapp_bot.app.services.http_client import GraphClient, set_http_client
+from whatsapp_bot.app.services.write_buffer import WriteBehindBuffer
+
+
+class Backend:
+    def __init__(self):
+        self.graph = FakeGraph(Latency(0), Latency(0), media_count=2, media_size=4096)
+        self.db = FakeFirestore(Latency(0), Latency(0), partners=2)
+        self.bucket = FakeBucket(Latency(0), Latency(0))
+
+    def upload(self, media_id: str, partner: int = 0, report_hash: bool = True, known_partner: bool = True):
+        content = self.graph.media[media_id]
+
+        async def run():
+            # The webhook hands over the partner record once its lookup is done
+            record = await firestore_service.get_partner(partner_phone(partner)) if known_partner else None
+            return await firestore_service.store_image_in_firestore(
+                partner_phone(partner), f"{FakeGraph.CDN_URL}{media_id}", media_id,
+                sha256=hashlib.sha256(content).hexdigest() if report_hash else None,
+                partner=record, file_size=len(content),
+            )
+        return asyncio.run(run())
+
+    def photos(self, partner: int = 0):
+        return list(self.db.children(f"partners/partner-{partner}/photos"))
+
+
+@pytest.fixture
+def backend(monkeypatch):
+    backend = Backend()
+    services = ServiceContainer()
+    services.override("firestore", backend.db)
+    services.override("storage", backend.bucket)
+    monkeypatch.setattr(container, "services", services)
+    monkeypatch.setattr(firestore_service, "services", services)
+    monkeypatch.setattr(firestore_service, "metadata_writes", WriteBehindBuffer(lambda: services.get("firestore"), window=0))
+    monkeypatch.setenv("WHATSAPP_API_KEY", "test")
+    monkeypatch.setenv("STORAGE_URL_MODE", "public")
+    monkeypatch.delenv("IMAGE_VARIANTS", raising=False)
+    monkeypatch.delenv("PHOTO_NEAR_DUPLICATES", raising=False)
+    for cache in (firestore_service.partner_cache, firestore_service.photo_hash_cache):
+        cache.clear()
+    set_http_client(GraphClient(http2=False, transport=backend.graph.transport()))
+    yield backend
+    set_http_client(None)
+    for cache in (firestore_service.partner_cache, firestore_service.photo_hash_cache):
+        cache.clear()
+
+
+def test_resend_with_a_reported_hash_skips_the_download(backend):
+    first = backend.upload("media-0")
+    second = backend.upload("media-0")
+
+    assert first["status"] == "success" and "duplicate" not in first["data"]
+    assert second["data"]["duplicate"] is True
+    assert second["data"]["photoId"] == first["data"]["photoId"]
+    assert second["data"]["storageUrl"] == first["data"]["storageUrl"]
+    assert backend.graph.downloads == 1
+    assert len(backend.photos()) == 1 and len(backend.bucket.objects) == 1
+
+
+def test_hash_index_survives_a_cold_cache(backend):
+    first = backend.upload("media-0")
+    # Another worker, or this one after a restart: the index is read from Firestore
+    firestore_service.photo_hash_cache.clear()
+    second = backend.upload("media-0")
+
+    assert second["data"]["duplicate"] is True
+    assert second["data"]["photoId"] == first["data"]["photoId"]
+    assert backend.graph.downloads == 1
+
+
+def test_pending_partner_lookup_skips_the_upload(backend):
+    first = backend.upload("media-0")
+    second = backend.upload("media-0", known_partner=False)
+
+    assert second["data"]["duplicate"] is True
+    assert second["data"]["photoId"] == first["data"]["photoId"]
+    # The download had already started, but no blob was opened for it
+    assert len(backend.bucket.objects) == 1 and len(backend.photos()) == 1
+
+
+def test_without_a_reported_hash_the_duplicate_is_not_committed(backend):
+    backend.upload("media-0", report_hash=False)
+    second = backend.upload("media-0", report_hash=False)
+
+    assert second["data"]["duplicate"] is True
+    # Downloaded again to compute the hash, but the upload was abandoned
+    assert backend.graph.downloads == 2
+    assert len(backend.bucket.objects) == 1 and len(backend.photos()) == 1
+
+
+def test_hashes_are_per_partner_and_per_content(backend):
+    backend.upload("media-0", partner=0)
+    other_partner = backend.upload("media-0", partner=1)
+    other_photo = backend.upload("media-1", partner=0)
+
+    assert "duplicate" not in other_partner["data"]
+    assert "duplicate" not in other_photo["data"]
+    assert len(backend.photos(0)) == 2 and len(backend.photos(1)) == 1
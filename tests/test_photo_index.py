@@ -0,0 +1,103 @@
+import asyncio
+import random
+
+from whatsapp_bot.app.services import firestore_service
+from whatsapp_bot.app.services.cache import AsyncTTLCache
+from whatsapp_bot.app.services.photo_index import HASH_BITS, HammingIndex, hamming
+
+
+def flip_bits(value: int, count: int, rng: random.Random) -> int:
+    for bit in rng.sample(range(HASH_BITS), count):
+        value ^= 1 << bit
+    return value
+
+
+def test_search_matches_brute_force():
+    rng = random.Random(3)
+    for max_distance in (0, 3, 6, 10):
+        index = HammingIndex(max_distance)
+        hashes = [rng.getrandbits(HASH_BITS) for _ in range(500)]
+        for position, value in enumerate(hashes):
+            index.add(value, position)
+
+        queries = [rng.getrandbits(HASH_BITS) for _ in range(50)]
+        queries += [flip_bits(rng.choice(hashes), rng.randint(0, max_distance + 2), rng) for _ in range(200)]
+        for query in queries:
+            expected = sorted(
+                (hamming(query, value), position) for position, value in enumerate(hashes)
+                if hamming(query, value) <= max_distance
+            )
+            assert sorted(index.search(query)) == expected
+
+
+def test_nearest_returns_the_closest():
+    index = HammingIndex(6)
+    index.add(0b1111, "far")
+    index.add(0b0001, "near")
+    assert index.nearest(0) == (1, "near")
+    assert index.nearest((1 << 64) - 1) is None
+
+
+def test_stale_entry_is_served_while_reloading():
+    loads = []
+
+    async def loader(key):
+        loads.append(key)
+        await asyncio.sleep(0.05)
+        return len(loads)
+
+    async def scenario():
+        cache = AsyncTTLCache(loader, ttl=60, refresh_after=0.01)
+        first = await cache.get("partner")
+        await asyncio.sleep(0.02)
+        # Stale: answered at once, one reload for both reads
+        stale = [await cache.get("partner"), await cache.get("partner")]
+        await cache.pending("partner")
+        return first, stale, await cache.get("partner"), cache.stats()
+
+    first, stale, refreshed, stats = asyncio.run(scenario())
+    assert (first, stale, refreshed) == (1, [1, 1], 2)
+    assert stats["loads"] == 2 and stats["refreshes"] == 1
+
+
+def test_failed_reload_keeps_the_stale_entry():
+    calls = []
+
+    async def loader(key):
+        calls.append(key)
+        if len(calls) > 1:
+            raise RuntimeError("firestore unavailable")
+        return "index"
+
+    async def scenario():
+        cache = AsyncTTLCache(loader, ttl=60, refresh_after=0)
+        await cache.get("partner")
+        assert await cache.get("partner") == "index"
+        await asyncio.sleep(0)
+        return await cache.get("partner"), cache.stats()["load_errors"]
+
+    assert asyncio.run(scenario()) == ("index", 1)
+
+
+def test_cold_index_does_not_hold_up_the_upload(monkeypatch):
+    async def slow_load(partner_doc_id):
+        await asyncio.sleep(0.1)
+        index = HammingIndex(6)
+        index.add(0, "photo-1")
+        return index
+
+    monkeypatch.setattr(firestore_service.photo_index_cache, "loader", slow_load)
+    monkeypatch.setattr(firestore_service, "PHOTO_INDEX_COLD_WAIT", 0.01)
+    firestore_service.photo_index_cache.clear()
+
+    async def scenario():
+        cold = await firestore_service.find_near_duplicate("partner-1", 1)
+        # Written while the index is still loading; must end up in it
+        firestore_service._index_photo("partner-1", 0b11, "photo-2")
+        await firestore_service.photo_index_cache.pending("partner-1")
+        return cold, await firestore_service.find_near_duplicate("partner-1", 0b111)
+
+    try:
+        assert asyncio.run(scenario()) == (None, (1, "photo-2"))
+    finally:
+        firestore_service.photo_index_cache.clear()
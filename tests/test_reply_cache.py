@@ -0,0 +1,53 @@
+import os
+from unittest import mock
+
+from whatsapp_bot.app.services.reply_cache import NGramEmbedder, ReplyCache, create_reply_cache, identifiers
+
+
+def similar_cache(**kwargs) -> ReplyCache:
+    return ReplyCache(embedder=NGramEmbedder(), similarity_threshold=0.85, **kwargs)
+
+
+def test_exact_hit_ignores_case_and_punctuation():
+    cache = ReplyCache()
+    cache.put("What services do you offer?", "fp", "reply")
+    assert cache.get("what services do you offer", "fp") == "reply"
+    assert cache.get("what services do you offer", "other") is None
+
+
+def test_similarity_tier_is_off_by_default():
+    with mock.patch.dict(os.environ, {}, clear=False):
+        os.environ.pop("AGENT_REPLY_CACHE_SIMILARITY", None)
+        cache = create_reply_cache()
+    assert cache.embedder is None
+    cache.put("what are your store hours", "fp", "reply")
+    assert cache.get("what are your store hours please", "fp") is None
+
+
+def test_similar_hit_within_fingerprint():
+    cache = similar_cache()
+    cache.put("what are your store opening hours", "fp", "reply")
+    assert cache.get("what are your store opening hours today", "fp") == "reply"
+    assert cache.get("what are your store opening hours today", "other") is None
+
+
+def test_never_similar_across_identifiers():
+    cache = similar_cache()
+    cache.put("status of order ORD-12345", "fp", "ORD-12345 shipped")
+    assert cache.get("status of order ORD-12346", "fp") is None
+    assert cache.get("status of order ord 12345", "fp") == "ORD-12345 shipped"
+
+
+def test_identifiers_are_words_with_digits():
+    assert identifiers("need 20 units of ryzen 7 7800x3d") == {"20", "7", "7800x3d"}
+    assert identifiers("no numbers here") == frozenset()
+
+
+def test_candidate_scan_is_capped():
+    cache = similar_cache(max_candidates=3)
+    for n in ["alpha", "bravo", "charlie", "delta"]:
+        cache.put(f"tell me about {n} products", "fp", n)
+    # The oldest candidate was dropped from the scan, though still an exact hit
+    assert cache.get("tell me about alpha products please", "fp") is None
+    assert cache.get("tell me about alpha products", "fp") == "alpha"
+    assert cache.get("tell me about delta products please", "fp") == "delta"
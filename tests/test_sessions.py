@@ -0,0 +1,115 @@
+import asyncio
+import time
+
+from whatsapp_bot.app.services.sessions import (
+    InMemorySessionBackend, SessionManager, SQLiteSessionBackend, create_session_manager
+)
+
+
+def test_new_session_has_defaults():
+    manager = SessionManager(InMemorySessionBackend(max_size=10, ttl=60))
+    session = asyncio.run(manager.get_session("15550001"))
+    assert session["phone_number"] == "15550001"
+    assert session["context"] == [] and session["last_message"] is None
+
+
+def test_saved_session_is_compacted():
+    manager = SessionManager(InMemorySessionBackend(max_size=10, ttl=60), max_context=3)
+
+    async def scenario():
+        for index in range(5):
+            await manager.update_context("15550001", f"message {index}")
+        session = await manager.get_session("15550001")
+        session["current_flow"] = None
+        await manager.save_session("15550001", session)
+        return await manager.backend.load("15550001")
+
+    record = asyncio.run(scenario())
+    assert [entry["content"] for entry in record["context"]] == ["message 2", "message 3", "message 4"]
+    # Empty fields are not stored
+    assert "current_flow" not in record
+
+
+def test_compaction_leaves_the_live_session_alone():
+    manager = SessionManager(InMemorySessionBackend(max_size=10, ttl=60), max_context=1)
+    session = {"phone_number": "15550001", "context": [{"content": "a"}, {"content": "b"}], "last_message": None}
+    asyncio.run(manager.save_session("15550001", session))
+    assert len(session["context"]) == 2 and "last_message" in session
+
+
+def test_sqlite_sessions_survive_a_new_manager(tmp_path):
+    path = str(tmp_path / "sessions.sqlite3")
+
+    async def scenario():
+        first = SessionManager(SQLiteSessionBackend(path, ttl=60, max_size=10), max_context=2)
+        await first.update_context("15550001", "hello")
+        await first.update_context("15550001", "menu")
+        await first.update_context("15550001", "order")
+        await first.backend.close()
+
+        second = SessionManager(SQLiteSessionBackend(path, ttl=60, max_size=10), max_context=2)
+        session = await second.get_session("15550001")
+        await second.end_session("15550001")
+        ended = await second.backend.load("15550001")
+        await second.backend.close()
+        return session, ended
+
+    session, ended = asyncio.run(scenario())
+    assert [entry["content"] for entry in session["context"]] == ["menu", "order"]
+    assert ended is None
+
+
+def test_memory_backend_is_bounded():
+    manager = SessionManager(InMemorySessionBackend(max_size=2, ttl=60))
+
+    async def scenario():
+        for phone in ("15550001", "15550002", "15550003"):
+            await manager.update_context(phone, "hello")
+        return [await manager.backend.load(phone) is not None for phone in ("15550001", "15550002", "15550003")]
+
+    assert asyncio.run(scenario()) == [False, True, True]
+    assert manager.stats()["evictions"] == 1
+
+
+def test_idle_sessions_expire(tmp_path):
+    async def scenario(backend):
+        manager = SessionManager(backend)
+        await manager.update_context("15550001", "hello")
+        time.sleep(0.06)
+        session = await manager.get_session("15550001")
+        await backend.close()
+        return session
+
+    backends = [
+        InMemorySessionBackend(max_size=10, ttl=0.05),
+        SQLiteSessionBackend(str(tmp_path / "sessions.sqlite3"), ttl=0.05, max_size=10),
+    ]
+    for backend in backends:
+        assert asyncio.run(scenario(backend))["context"] == []
+
+
+def test_sqlite_eviction_keeps_the_most_recent_sessions(tmp_path):
+    backend = SQLiteSessionBackend(str(tmp_path / "sessions.sqlite3"), ttl=60, max_size=2)
+
+    async def scenario():
+        for phone in ("15550001", "15550002", "15550003"):
+            await backend.save(phone, {"phone_number": phone})
+        backend._evict(time.time())
+        loaded = [await backend.load(phone) is not None for phone in ("15550001", "15550002", "15550003")]
+        await backend.close()
+        return loaded
+
+    assert asyncio.run(scenario()) == [False, True, True]
+
+
+def test_backend_is_chosen_by_env(monkeypatch, tmp_path):
+    monkeypatch.setenv("SESSION_BACKEND", "sqlite")
+    monkeypatch.setenv("SESSION_SQLITE_PATH", str(tmp_path / "sessions.sqlite3"))
+    monkeypatch.setenv("SESSION_MAX_CONTEXT", "5")
+    manager = create_session_manager()
+    assert manager.stats()["backend"] == "SQLiteSessionBackend"
+    assert manager.max_context == 5
+    asyncio.run(manager.backend.close())
+
+    monkeypatch.setenv("SESSION_BACKEND", "memory")
+    assert create_session_manager().stats()["backend"] == "InMemorySessionBackend"
@@ -0,0 +1,96 @@
+import asyncio
+from datetime import timedelta
+
+import pytest
+
+from whatsapp_bot.app.services import storage_urls
+from whatsapp_bot.app.services.storage_urls import blob_url, refresh_url, signed_url, url_mode
+
+
+class RecordingBlob:
+    def __init__(self, name: str):
+        self.name = name
+        self.public_url = f"https://storage.googleapis.com/bucket/{name}"
+        self.made_public = 0
+        self.signed = []
+
+    def make_public(self):
+        self.made_public += 1
+
+    def generate_signed_url(self, version: str = "v2", expiration: timedelta = None, method: str = "GET"):
+        self.signed.append((version, expiration, method))
+        return f"{self.public_url}?signature={len(self.signed)}"
+
+
+class RecordingBucket:
+    def __init__(self):
+        self.blobs = {}
+
+    def blob(self, name: str) -> RecordingBlob:
+        return self.blobs.setdefault(name, RecordingBlob(name))
+
+
+@pytest.fixture(autouse=True)
+def no_cached_urls():
+    storage_urls._signed_urls.clear()
+    yield
+    storage_urls._signed_urls.clear()
+
+
+@pytest.mark.parametrize("value, expected", [
+    (None, "legacy"),
+    ("public", "public"),
+    ("SIGNED", "signed"),
+    ("presigned", "legacy"),
+])
+def test_url_mode(monkeypatch, value, expected):
+    if value is None:
+        monkeypatch.delenv("STORAGE_URL_MODE", raising=False)
+    else:
+        monkeypatch.setenv("STORAGE_URL_MODE", value)
+    assert url_mode() == expected
+
+
+def test_legacy_mode_makes_the_blob_public(monkeypatch):
+    monkeypatch.setenv("STORAGE_URL_MODE", "legacy")
+    blob = RecordingBlob("partners/p1/a.jpg")
+
+    assert asyncio.run(blob_url(blob)) == {"storageUrl": blob.public_url}
+    assert blob.made_public == 1
+
+
+def test_public_mode_derives_the_url_from_the_path(monkeypatch):
+    monkeypatch.setenv("STORAGE_URL_MODE", "public")
+    blob = RecordingBlob("partners/p1/a.jpg")
+
+    assert asyncio.run(blob_url(blob)) == {"storageUrl": blob.public_url}
+    assert blob.made_public == 0 and blob.signed == []
+
+
+def test_signed_urls_are_cached_per_object(monkeypatch):
+    monkeypatch.setenv("STORAGE_URL_MODE", "signed")
+    blob = RecordingBlob("partners/p1/a.jpg")
+
+    fields = asyncio.run(blob_url(blob))
+    again = signed_url(RecordingBlob("partners/p1/a.jpg"))
+
+    assert blob.made_public == 0
+    assert blob.signed == [("v4", timedelta(seconds=storage_urls.SIGNED_URL_TTL), "GET")]
+    assert fields["storageUrl"].endswith("?signature=1")
+    assert "storageUrlExpiresAt" in fields
+    # A second blob handle for the same object is not signed again
+    assert again is fields
+
+
+def test_refresh_url_reissues_signed_urls_only(monkeypatch):
+    bucket = RecordingBucket()
+    stored = "https://storage.googleapis.com/bucket/partners/p1/a.jpg?signature=old"
+
+    monkeypatch.setenv("STORAGE_URL_MODE", "public")
+    assert refresh_url(bucket, "partners/p1/a.jpg", stored) == stored
+    assert bucket.blobs == {}
+
+    monkeypatch.setenv("STORAGE_URL_MODE", "signed")
+    assert refresh_url(bucket, "partners/p1/a.jpg", stored).endswith("?signature=1")
+    # Photos stored before paths were recorded keep their URL
+    assert refresh_url(bucket, None, stored) == stored
@@ -0,0 +1,55 @@
+import json
+import logging
+
+from whatsapp_bot.app.services.structured_logging import (
+    JsonFormatter, SamplingFilter, mask_phone_numbers, parse_sample_rates, redact,
+)
+
+
+def record(level=logging.INFO, msg="hello %s", args=("world",), **extra) -> logging.LogRecord:
+    entry = logging.LogRecord("test", level, __file__, 1, msg, args, None)
+    entry.__dict__.update(extra)
+    return entry
+
+
+def test_phone_numbers_keep_their_last_four_digits():
+    assert mask_phone_numbers("from +15551234567 about wamid.HBgL12345678") == "from ********4567 about wamid.HBgL12345678"
+
+
+def test_sensitive_fields_are_redacted_and_long_strings_cut():
+    payload = {
+        "from": "15551234567",
+        "text": {"body": "my card is 4111"},
+        "Authorization": "Bearer secret",
+        "note": "x" * 20,
+        "items": [{"caption": "hello"}],
+    }
+    assert redact(payload, max_length=10) == {
+        "from": "*******4567",
+        "text": {"body": "[REDACTED]"},
+        "Authorization": "[REDACTED]",
+        "note": "xxxxxxxxxx...[10 more]",
+        "items": [{"caption": "[REDACTED]"}],
+    }
+
+
+def test_json_formatter_writes_event_and_redacted_extras():
+    entry = json.loads(JsonFormatter(max_field_length=64).format(
+        record(msg="Sent to %s", args=("15551234567",), event="graph.sent", phone="15551234567", payload={"url": "https://x"})
+    ))
+    assert entry["message"] == "Sent to *******4567"
+    assert entry["event"] == "graph.sent"
+    assert entry["phone"] == "*******4567" and entry["payload"] == {"url": "[REDACTED]"}
+
+
+def test_parse_sample_rates_clamps_and_skips_blanks():
+    assert parse_sample_rates("graph.sent=0.01, message.text=2,,bad=") == {"graph.sent": 0.01, "message.text": 1.0}
+
+
+def test_sampling_drops_only_sampled_events_below_warning():
+    sampler = SamplingFilter({"graph.sent": 0.0})
+    assert not sampler.filter(record(event="graph.sent"))
+    assert sampler.filter(record(level=logging.WARNING, event="graph.sent"))
+    assert sampler.filter(record(event="message.text"))
+    assert sampler.filter(record())
+    assert sampler.dropped == 1
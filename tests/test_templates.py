@@ -0,0 +1,57 @@
+import json
+
+import httpx
+import pytest
+
+from whatsapp_bot.app.services.templates import (
+    PayloadTemplate, TemplateRegistry, build_button_payload, build_service_menu_payload
+)
+
+BUTTONS = [{"id": "yes", "title": "Sí ✅"}, {"id": "no", "title": "No"}]
+
+
+def httpx_body(payload) -> bytes:
+    return httpx.Request("POST", "https://graph.test", json=payload).read()
+
+
+@pytest.mark.parametrize("to", ["15551234567", 'quote"and\\slash'])
+def test_render_matches_a_json_body(to):
+    registry = TemplateRegistry()
+
+    assert registry.service_menu("AMD Partner Services").render(to) == httpx_body(
+        build_service_menu_payload(to, "AMD Partner Services")
+    )
+    assert registry.buttons("Continue?", BUTTONS).render(to) == httpx_body(build_button_payload(to, "Continue?", BUTTONS))
+
+
+def test_templates_are_compiled_once_per_variant():
+    registry = TemplateRegistry()
+
+    menu = registry.service_menu("Services")
+    assert registry.service_menu("Services") is menu
+    assert registry.service_menu("Other header") is not menu
+    buttons = registry.buttons("Continue?", BUTTONS)
+    assert registry.buttons("Continue?", [dict(button) for button in BUTTONS]) is buttons
+    assert registry.buttons("Continue?", BUTTONS[:1]) is not buttons
+    assert registry.stats()["size"] == 4
+
+
+def test_compiled_templates_are_bounded():
+    registry = TemplateRegistry(max_size=2)
+    for n in range(5):
+        registry.service_menu(f"header {n}")
+    assert registry.stats()["size"] == 2
+
+
+def test_template_needs_exactly_one_recipient_placeholder():
+    with pytest.raises(ValueError):
+        PayloadTemplate("bad", build_service_menu_payload("15551234567", "Services"))
+
+    payload = build_button_payload("__recipient_placeholder__", "__recipient_placeholder__", BUTTONS)
+    with pytest.raises(ValueError):
+        PayloadTemplate("twice", payload)
+
+
+def test_rendered_payload_is_valid_json():
+    rendered = TemplateRegistry().buttons("Continue?", BUTTONS).render("15551234567")
+    assert json.loads(rendered)["interactive"]["action"]["buttons"][0]["reply"]["title"] == "Sí ✅"
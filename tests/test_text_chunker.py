@@ -0,0 +1,38 @@
+from whatsapp_bot.app.services.text_chunker import WHATSAPP_TEXT_LIMIT, StreamChunker
+
+
+def stream(chunker: StreamChunker, text: str, step: int = 37):
+    chunks = []
+    for start in range(0, len(text), step):
+        chunks += chunker.feed(text[start:start + step])
+    return chunks + chunker.flush()
+
+
+def test_first_sentence_goes_out_alone():
+    chunker = StreamChunker()
+    assert chunker.feed("Hello there. How") == ["Hello there."]
+    assert chunker.flush() == ["How"]
+
+
+def test_long_paragraph_is_cut_under_the_limit():
+    sentence = "This sentence is part of a very long paragraph. "
+    text = "Intro. " + sentence * 300
+    chunks = stream(StreamChunker(), text)
+
+    assert all(len(chunk) <= WHATSAPP_TEXT_LIMIT for chunk in chunks)
+    assert all(chunk.endswith(".") for chunk in chunks)
+    assert " ".join(chunks).split() == text.split()
+
+
+def test_text_without_boundaries_is_hard_split_at_the_limit():
+    text = "x" * (WHATSAPP_TEXT_LIMIT * 2 + 10)
+    chunks = stream(StreamChunker(), text, step=1000)
+
+    assert [len(chunk) for chunk in chunks] == [WHATSAPP_TEXT_LIMIT, WHATSAPP_TEXT_LIMIT, 10]
+
+
+def test_paragraph_breaks_split_after_min_length():
+    paragraph = "word " * 80
+    chunks = stream(StreamChunker(min_length=300), f"Hi. {paragraph}\n\n{paragraph}\n\nEnd")
+
+    assert chunks == ["Hi.", paragraph.strip(), paragraph.strip(), "End"]
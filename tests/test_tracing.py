@@ -0,0 +1,116 @@
+import asyncio
+
+import httpx
+import pytest
+
+from whatsapp_bot.app.services.http_client import GraphClient
+from whatsapp_bot.app.services.tracing import SpanExporter, TraceIdRatioSampler, Tracer, parse_traceparent
+
+TRACE_ID = "4bf92f3577b34da6a3ce929d0e0e4736"
+PARENT_ID = "00f067aa0ba902b7"
+
+
+class RecordingExporter(SpanExporter):
+    def __init__(self):
+        self.spans = []
+
+    def export(self, spans):
+        self.spans.extend(spans)
+
+
+@pytest.mark.parametrize("header, expected", [
+    (f"00-{TRACE_ID}-{PARENT_ID}-01", (TRACE_ID, PARENT_ID, True)),
+    (f" 00-{TRACE_ID.upper()}-{PARENT_ID}-00 ", (TRACE_ID, PARENT_ID, False)),
+    (f"ff-{TRACE_ID}-{PARENT_ID}-01", None),
+    (f"00-{'0' * 32}-{PARENT_ID}-01", None),
+    (f"00-{TRACE_ID}-{'0' * 16}-01", None),
+    ("00-abc-def-01", None),
+    (None, None),
+])
+def test_parse_traceparent(header, expected):
+    context = parse_traceparent(header)
+    if expected is None:
+        assert context is None
+    else:
+        assert (context.trace_id, context.span_id, context.sampled) == expected
+        assert context.remote
+
+
+def test_children_join_the_current_trace():
+    exporter = RecordingExporter()
+    tracer = Tracer(exporter=exporter, batch_size=100)
+
+    with tracer.use_context(parse_traceparent(f"00-{TRACE_ID}-{PARENT_ID}-01")):
+        with tracer.span("webhook") as root:
+            with tracer.span("send") as child:
+                pass
+    tracer.flush()
+
+    assert [span.name for span in exporter.spans] == ["send", "webhook"]
+    assert root.context.trace_id == child.context.trace_id == TRACE_ID
+    assert root.parent_id == PARENT_ID
+    assert child.parent_id == root.context.span_id
+    assert tracer.current_context() is None
+
+
+def test_unsampled_traces_are_not_exported():
+    exporter = RecordingExporter()
+    tracer = Tracer(exporter=exporter, sampler=TraceIdRatioSampler(0.0), batch_size=1)
+
+    with tracer.span("webhook") as span:
+        span.set_attribute("phone", "x")
+    with tracer.use_context(parse_traceparent(f"00-{TRACE_ID}-{PARENT_ID}-01")):
+        # The remote parent decided to sample, and the local ratio does not overrule it
+        with tracer.span("continued"):
+            pass
+
+    assert span.attributes == {}
+    assert [span.name for span in exporter.spans] == ["continued"]
+
+
+def test_failed_span_records_the_error():
+    exporter = RecordingExporter()
+    tracer = Tracer(exporter=exporter, batch_size=1)
+
+    with pytest.raises(ValueError):
+        with tracer.span("store"):
+            raise ValueError("boom")
+
+    assert exporter.spans[0].status == "ERROR"
+    assert exporter.spans[0].error == "ValueError: boom"
+
+
+def test_inject():
+    tracer = Tracer(exporter=RecordingExporter())
+    headers = {"Authorization": "Bearer x"}
+
+    assert tracer.inject(headers) is headers
+    with tracer.span("send") as span:
+        injected = tracer.inject(headers)
+        assert tracer.inject({"traceparent": "kept"}) == {"traceparent": "kept"}
+    assert injected == {"Authorization": "Bearer x", "traceparent": span.context.traceparent}
+    assert headers == {"Authorization": "Bearer x"}
+
+
+def test_graph_client_propagates_the_current_span(monkeypatch):
+    from whatsapp_bot.app.services import http_client
+
+    tracer = Tracer(exporter=RecordingExporter())
+    monkeypatch.setattr(http_client, "tracer", tracer)
+    seen = []
+
+    def handle(request):
+        seen.append(request.headers.get("traceparent"))
+        return httpx.Response(200, content=b"ok")
+
+    async def scenario():
+        client = GraphClient(http2=False, transport=httpx.MockTransport(handle))
+        await client.post("https://graph.test/messages", headers={"Authorization": "Bearer x"}, json={})
+        with tracer.span("download") as span:
+            async with client.stream("GET", "https://cdn.test/media") as response:
+                await response.aread()
+        await client.aclose()
+        return span
+
+    span = asyncio.run(scenario())
+    assert seen == [None, span.context.traceparent]
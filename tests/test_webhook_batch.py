@@ -0,0 +1,99 @@
+import asyncio
+import json
+
+import pytest
+
+from whatsapp_bot.app.routes import webhook
+from whatsapp_bot.app.services.message_queue import MessageWorkerPool
+
+
+class FakeRequest:
+    def __init__(self, payload):
+        self._body = json.dumps(payload).encode("utf-8")
+
+    async def body(self):
+        return self._body
+
+
+def message(sender, n):
+    return {"id": f"wamid.{sender}.{n}", "from": sender, "type": "text", "text": {"body": f"message {n}"}}
+
+
+def delivery(*changes):
+    return {"entry": [{"changes": [{"value": {"messages": messages}} for messages in changes]}]}
+
+
+def test_extract_messages_keeps_delivery_order():
+    data = {"entry": [
+        {"changes": [{"value": {"messages": [message("A", 0), {"id": "wamid.nosender"}]}}, {"value": {"statuses": []}}]},
+        {"changes": [{"value": {"messages": [message("B", 0), message("A", 1)]}}]},
+    ]}
+    assert [m["id"] for m in webhook.extract_messages(data)] == ["wamid.A.0", "wamid.B.0", "wamid.A.1"]
+
+    with pytest.raises(ValueError):
+        webhook.extract_messages({"object": "whatsapp_business_account"})
+
+
+def test_batch_runs_senders_concurrently_and_each_sender_in_order(monkeypatch):
+    log = []
+
+    async def process_message(msg):
+        # A's first message is slow; B must not wait for it, A's second message must
+        await asyncio.sleep(0.05 if msg["id"] == "wamid.A.0" else 0)
+        log.append(msg["id"])
+        return {"status": "success"}
+
+    monkeypatch.setattr(webhook, "process_message", process_message)
+    messages = [message("A", 0), message("B", 0), message("A", 1), message("B", 1)]
+
+    results = asyncio.run(webhook.dispatch_messages(messages))
+
+    assert log == ["wamid.B.0", "wamid.B.1", "wamid.A.0", "wamid.A.1"]
+    # Outcomes come back in delivery order, tagged with their message
+    assert [(r["message_id"], r["from"], r["status"]) for r in results] == [
+        ("wamid.A.0", "A", "success"), ("wamid.B.0", "B", "success"),
+        ("wamid.A.1", "A", "success"), ("wamid.B.1", "B", "success"),
+    ]
+
+
+def test_every_message_in_a_delivery_is_processed(monkeypatch):
+    seen = []
+
+    async def process_message(msg):
+        seen.append(msg["id"])
+        return {"status": "success"}
+
+    monkeypatch.setattr(webhook, "process_message", process_message)
+    monkeypatch.setattr(webhook, "ASYNC_INGESTION", False)
+
+    response = asyncio.run(webhook.receive_webhook(FakeRequest(delivery([message("A", 0)], [message("B", 0)]))))
+
+    assert response["status"] == "processed"
+    assert sorted(seen) == ["wamid.A.0", "wamid.B.0"]
+    assert asyncio.run(webhook.receive_webhook(FakeRequest(delivery([]))))["status"] == "no_messages"
+
+
+def test_async_mode_rejects_the_delivery_when_the_queue_is_full(monkeypatch):
+    release = None
+
+    async def handler(msg):
+        await release.wait()
+
+    async def scenario():
+        nonlocal release
+        release = asyncio.Event()
+        pool = MessageWorkerPool(handler, workers=1, queue_size=1, enqueue_timeout=0)
+        monkeypatch.setattr(webhook, "message_workers", pool)
+        response = await webhook.receive_webhook(FakeRequest(delivery([message("A", n) for n in range(3)])))
+        release.set()
+        await pool.stop(drain=True)
+        return response
+
+    monkeypatch.setattr(webhook, "ASYNC_INGESTION", True)
+    response = asyncio.run(scenario())
+
+    # Meta redelivers on 503; the per-message results say which ones were queued.
+    # Without an enqueue timeout nothing yields, so only the queue's one slot is used
+    assert response.status_code == 503
+    body = json.loads(response.body)
+    assert [r["status"] for r in body["results"]] == ["accepted", "rejected", "rejected"]
@@ -0,0 +1,47 @@
+import asyncio
+import logging
+
+import httpx
+import pytest
+
+from whatsapp_bot.app.services.http_client import GraphClient, set_http_client
+from whatsapp_bot.app.services.whatsapp_service import get_media_url, send_whatsapp_message
+
+
+@pytest.fixture
+def graph(monkeypatch):
+    monkeypatch.setenv("WHATSAPP_API_KEY", "test-key")
+    monkeypatch.setenv("WHATSAPP_PHONE_NUMBER_ID", "123")
+
+    def install(handler):
+        set_http_client(GraphClient(http2=False, transport=httpx.MockTransport(handler)))
+
+    yield install
+    set_http_client(None)
+
+
+@pytest.mark.parametrize("reported, expected", [(2048, 2048), ("2048", 2048), (None, None), ("n/a", None)])
+def test_media_file_size_is_normalized(graph, reported, expected):
+    def handle(request):
+        media = {"url": "https://cdn.test/media-1", "mime_type": "image/jpeg", "sha256": "ab"}
+        if reported is not None:
+            media["file_size"] = reported
+        return httpx.Response(200, json=media)
+
+    graph(handle)
+    result = asyncio.run(get_media_url("media-1"))
+    assert result["status"] == "success" and result["file_size"] == expected
+
+
+def test_successful_send_logs_only_the_message_id_at_debug(graph, caplog):
+    graph(lambda request: httpx.Response(200, json={"messages": [{"id": "wamid.1"}], "contacts": [{"wa_id": "15551234567"}]}))
+
+    caplog.set_level(logging.INFO, logger="whatsapp_bot.app.services.whatsapp_service")
+    asyncio.run(send_whatsapp_message("15551234567", "hello"))
+    assert not [entry for entry in caplog.records if getattr(entry, "event", None) == "graph.sent"]
+
+    caplog.set_level(logging.DEBUG, logger="whatsapp_bot.app.services.whatsapp_service")
+    asyncio.run(send_whatsapp_message("15551234567", "hello"))
+    [sent] = [entry for entry in caplog.records if getattr(entry, "event", None) == "graph.sent"]
+    assert sent.levelno == logging.DEBUG and sent.message_id == "wamid.1"
+    assert not hasattr(sent, "response")
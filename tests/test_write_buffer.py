@@ -0,0 +1,147 @@
+import asyncio
+import threading
+
+import pytest
+
+from whatsapp_bot.app.services.write_buffer import WriteBehindBuffer
+
+
+class FakeBatch:
+    def __init__(self, db: "FakeDb"):
+        self._db = db
+        self.writes = []
+
+    def set(self, reference, data, merge=False):
+        self.writes.append((reference, data, merge))
+
+    def commit(self):
+        self._db.gate.wait(5)
+        if self._db.fail:
+            raise RuntimeError("commit rejected")
+        self._db.commits.append(self.writes)
+
+
+class FakeDb:
+    def __init__(self):
+        self.commits = []
+        self.fail = False
+        self.gate = threading.Event()
+        self.gate.set()
+
+    def batch(self) -> FakeBatch:
+        return FakeBatch(self)
+
+
+def make_buffer(
+    db: FakeDb,
+    max_writes: int = 4,
+    window: float = 0.02,
+    max_pending: int = 100,
+    concurrency: int = 2,
+) -> WriteBehindBuffer:
+    async def client():
+        return db
+    return WriteBehindBuffer(
+        client, max_writes=max_writes, window=window, max_pending=max_pending, concurrency=concurrency
+    )
+
+
+def write(name: str):
+    return (name, {"name": name}, False)
+
+
+def test_writes_within_the_window_share_a_batch():
+    db = FakeDb()
+
+    async def scenario():
+        buffer = make_buffer(db)
+        futures = [await buffer.submit(write("a")), await buffer.submit(write("b"), write("c"))]
+        await asyncio.gather(*futures)
+        await buffer.close()
+        return buffer.stats()
+
+    stats = asyncio.run(scenario())
+    assert [[reference for reference, _, _ in batch] for batch in db.commits] == [["a", "b", "c"]]
+    assert (stats["batches"], stats["committed"]) == (1, 3)
+
+
+def test_groups_are_never_split_across_batches():
+    db = FakeDb()
+
+    async def scenario():
+        buffer = make_buffer(db, max_writes=4)
+        futures = [
+            await buffer.submit(write("a1"), write("a2"), write("a3")),
+            await buffer.submit(write("b1"), write("b2")),
+            await buffer.submit(write("c1")),
+        ]
+        await asyncio.gather(*futures)
+        await buffer.close()
+
+    asyncio.run(scenario())
+    batches = [[reference for reference, _, _ in batch] for batch in db.commits]
+    assert sorted(batches) == [["a1", "a2", "a3"], ["b1", "b2", "c1"]]
+
+
+def test_oversized_groups_are_rejected():
+    async def scenario():
+        buffer = make_buffer(FakeDb(), max_writes=2)
+        with pytest.raises(ValueError):
+            await buffer.submit(write("a"), write("b"), write("c"))
+        with pytest.raises(ValueError):
+            await buffer.submit()
+
+    asyncio.run(scenario())
+
+
+def test_failed_commit_fails_every_group_in_the_batch():
+    db = FakeDb()
+    db.fail = True
+
+    async def scenario():
+        buffer = make_buffer(db)
+        first, second = await buffer.submit(write("a")), await buffer.submit(write("b"))
+        results = await asyncio.gather(first, second, return_exceptions=True)
+        await buffer.close()
+        return results, buffer.stats()
+
+    results, stats = asyncio.run(scenario())
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert (stats["failed"], stats["pending"]) == (2, 0)
+
+
+def test_submit_waits_for_room_when_commits_are_slow():
+    db = FakeDb()
+    db.gate.clear()
+
+    async def scenario():
+        buffer = make_buffer(db, max_writes=2, max_pending=4, concurrency=1, window=0)
+        await buffer.submit(write("a"), write("b"))
+        await buffer.submit(write("c"), write("d"))
+        blocked = asyncio.create_task(buffer.submit(write("e")))
+        await asyncio.sleep(0.05)
+        waited = not blocked.done()
+        pending = buffer.stats()["pending"]
+
+        db.gate.set()
+        await blocked
+        await buffer.close()
+        return waited, pending
+
+    waited, pending = asyncio.run(scenario())
+    assert waited and pending == 4
+    assert sum(len(batch) for batch in db.commits) == 5
+
+
+def test_flush_skips_the_window():
+    db = FakeDb()
+
+    async def scenario():
+        buffer = make_buffer(db, window=10.0)
+        future = await buffer.submit(write("a"))
+        await asyncio.wait_for(buffer.flush(), 1.0)
+        done = future.done()
+        await buffer.close()
+        return done
+
+    assert asyncio.run(scenario())
@@ -1,15 +1,77 @@
 from fastapi import FastAPI
-from whatsapp_bot.app.routes.webhook import router as webhook_router
+from whatsapp_bot.app.services.structured_logging import configure_logging, shutdown_logging
+from whatsapp_bot.app.routes.webhook import router as webhook_router, message_workers, image_albums, ASYNC_INGESTION
+from whatsapp_bot.app.routes.monitoring import router as monitoring_router
+from whatsapp_bot.app.services.http_client import start_http_client, close_http_client
+from whatsapp_bot.app.services.dedup import deduplicator
+from whatsapp_bot.app.services.sessions import session_manager
+from whatsapp_bot.app.services.executor import shutdown_executor
+from whatsapp_bot.app.services.image_variants import shutdown_image_executor
+from whatsapp_bot.app.services.firestore_service import metadata_writes
+from whatsapp_bot.app.services.send_scheduler import outbound_scheduler
+from whatsapp_bot.app.services.container import services
+from whatsapp_bot.app.services.tracing import tracer
+import asyncio
+import logging
 import os
 import base64
 import json
-from firebase_admin import credentials
-import firebase_admin
+
+configure_logging()
+logger = logging.getLogger(__name__)
 
 app = FastAPI()
 
 # Include webhook router
 app.include_router(webhook_router, prefix="/api/v1")
+app.include_router(monitoring_router, prefix="/api/v1")
+
+
+async def warm_up_services():
+    readiness = await services.startup()
+    if readiness["ready"]:
+        logger.info("Required services initialized")
+    else:
+        failed = [
+            name for name, service in readiness["services"].items()
+            if service["required"] and service["status"] != "ready"
+        ]
+        logger.warning("Services not ready after startup: %s", ', '.join(failed))
+
+
+@app.on_event("startup")
+async def startup():
+    await start_http_client()
+    await outbound_scheduler.start()
+    if ASYNC_INGESTION:
+        await message_workers.start()
+    # Initialize Firebase, Storage (and Gemini, when agent replies are on) in the
+    # background so the server accepts connections immediately; /ready reports when they are up
+    app.state.warm_up = asyncio.create_task(warm_up_services())
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    warm_up = getattr(app.state, "warm_up", None)
+    if warm_up is not None and not warm_up.done():
+        warm_up.cancel()
+        await asyncio.gather(warm_up, return_exceptions=True)
+    # Drain queued messages while the HTTP client is still open
+    await message_workers.stop(drain=True)
+    # Finish open albums; their confirmations still go through the scheduler
+    await image_albums.stop()
+    await outbound_scheduler.stop(drain=True)
+    await close_http_client()
+    # Commit buffered Firestore writes while the client is still open
+    await metadata_writes.close()
+    await services.shutdown()
+    tracer.shutdown()
+    await deduplicator.backend.close()
+    await session_manager.backend.close()
+    shutdown_executor(wait=True)
+    shutdown_image_executor(wait=True)
+    shutdown_logging()
+
 # firebase_creds = os.getenv("FIREBASE_CREDENTIALS_BASE64")
 
 # if firebase_creds:
@@ -0,0 +1,110 @@
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse, PlainTextResponse
+from whatsapp_bot.app.services.http_client import get_pool_metrics
+from whatsapp_bot.app.routes.webhook import message_workers, image_albums
+from whatsapp_bot.app.services.dedup import deduplicator
+from whatsapp_bot.app.services.sessions import session_manager
+from whatsapp_bot.app.services.firestore_service import partner_cache, photo_hash_cache, photo_index_cache, metadata_writes
+from whatsapp_bot.app.services.send_scheduler import outbound_scheduler
+from whatsapp_bot.app.services.container import services
+from whatsapp_bot.app.services.metrics import registry
+from whatsapp_bot.app.services.tracing import tracer
+from whatsapp_bot.app.services.structured_logging import logging_stats
+from whatsapp_bot.app.services.storage_urls import signed_url_stats
+
+router = APIRouter()
+
+# Starlette appends the utf-8 charset to text/ media types
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4"
+
+
+def _cache_counts(field: str):
+    counts = {
+        ("partner",): partner_cache.stats()[field],
+        ("photo_hash",): photo_hash_cache.stats()[field],
+        ("photo_index",): photo_index_cache.stats()[field],
+        ("signed_url",): signed_url_stats()[field],
+        ("dedup",): deduplicator.stats()[field],
+    }
+    agent = services.peek("agent")
+    if agent and agent.reply_cache:
+        reply_stats = agent.reply_cache.stats()
+        counts[("reply",)] = (
+            reply_stats["exact_hits"] + reply_stats["similar_hits"] if field == "hits" else reply_stats["misses"]
+        )
+    return counts
+
+
+def _outbound_sends():
+    outbound = outbound_scheduler.stats()
+    return {("sent",): outbound["sent"], ("failed",): outbound["failed"], ("retried",): outbound["retries"]}
+
+
+def _http_connections():
+    pool = get_pool_metrics()
+    if not pool:
+        return {}
+    return {("in_use",): pool["connections_in_use"], ("idle",): pool["connections_idle"]}
+
+
+# Subsystems already keep these counts; they are read when /metrics is scraped
+registry.callback("whatsapp_cache_hits_total", "Cache hits by cache", "counter", ("cache",), lambda: _cache_counts("hits"))
+registry.callback("whatsapp_cache_misses_total", "Cache misses by cache", "counter", ("cache",), lambda: _cache_counts("misses"))
+registry.callback(
+    "whatsapp_webhook_queue_depth", "Messages waiting for a worker", "gauge", (),
+    lambda: {(): message_workers.depth()}
+)
+registry.callback(
+    "whatsapp_outbound_queue_depth", "Graph API sends waiting in the scheduler", "gauge", (),
+    lambda: {(): outbound_scheduler.stats()["queue_depth"]}
+)
+registry.callback("whatsapp_outbound_sends_total", "Graph API sends by result", "counter", ("result",), _outbound_sends)
+registry.callback("whatsapp_http_connections", "Pooled Graph API connections", "gauge", ("state",), _http_connections)
+registry.callback(
+    "whatsapp_media_uploads", "Album image uploads running or waiting for a slot", "gauge", ("state",),
+    lambda: {("active",): image_albums.stats()["active"], ("waiting",): image_albums.stats()["waiting"]}
+)
+registry.callback(
+    "whatsapp_firestore_writes_total", "Buffered Firestore writes by outcome", "counter", ("result",),
+    lambda: {("committed",): metadata_writes.committed, ("failed",): metadata_writes.failed}
+)
+registry.callback(
+    "whatsapp_firestore_writes_pending", "Firestore writes buffered or being committed", "gauge", (),
+    lambda: {(): metadata_writes.stats()["pending"]}
+)
+registry.callback(
+    "whatsapp_log_records_dropped_total", "Log records not written, by reason", "counter", ("reason",),
+    lambda: {("queue_full",): logging_stats()["dropped_full"], ("sampled_out",): logging_stats()["sampled_out"]}
+)
+
+
+@router.get("/stats")
+async def stats():
+    """Runtime statistics for the bot's internal subsystems"""
+    agent = services.peek("agent")
+    return {
+        "http_pool": get_pool_metrics(),
+        "webhook_queue": message_workers.stats(),
+        "image_albums": image_albums.stats(),
+        "firestore_writes": metadata_writes.stats(),
+        "dedup": deduplicator.stats(),
+        "sessions": session_manager.stats(),
+        "partner_cache": partner_cache.stats(),
+        "outbound": outbound_scheduler.stats(),
+        "reply_cache": agent.reply_cache.stats() if agent and agent.reply_cache else {},
+        "tracing": tracer.stats(),
+        "logging": logging_stats(),
+    }
+
+
+@router.get("/ready")
+async def ready():
+    """Readiness of each external dependency; 503 until every required one is initialized"""
+    readiness = services.readiness()
+    return JSONResponse(status_code=200 if readiness["ready"] else 503, content=readiness)
+
+
+@router.get("/metrics")
+async def metrics():
+    """Stage timings, message and error counters in the Prometheus text format"""
+    return PlainTextResponse(registry.render(), media_type=PROMETHEUS_CONTENT_TYPE)
@@ -1,22 +1,42 @@
 from fastapi import APIRouter, Request, Response, HTTPException
-from whatsapp_bot.  app.services.firestore_service import get_partner_greeting, store_image_in_firestore, is_partner_registered
-from whatsapp_bot.app.services.nlp_service import DealerAgent
-from whatsapp_bot. app.services.whatsapp_service import send_whatsapp_message, send_service_menu, send_button_message
+from fastapi.responses import JSONResponse
+from whatsapp_bot.app.services.firestore_service import get_partner, store_image_in_firestore, save_product_request, record_conversation_event
+from whatsapp_bot.app.services.nlp_service import FallbackReply, create_agent
+from whatsapp_bot.app.services.whatsapp_service import send_whatsapp_message, send_service_menu, send_button_message, mark_as_read, get_media_url
+import asyncio
 import json
 import os
 import logging
 import hmac
 import hashlib
 from datetime import datetime
-from typing import Dict
-from whatsapp_bot.app.services.sessions import SessionManager
+from typing import Dict, List
+from whatsapp_bot.app.services.sessions import session_manager
+from whatsapp_bot.app.services.message_queue import MessageWorkerPool
+from whatsapp_bot.app.services.send_scheduler import PRIORITY_BULK
+from whatsapp_bot.app.services.dedup import deduplicator
+from whatsapp_bot.app.services.conversation_router import ConversationRouter
+from whatsapp_bot.app.services.text_chunker import StreamChunker
+from whatsapp_bot.app.services.album_collector import AlbumCollector
+from whatsapp_bot.app.services.container import services
+from whatsapp_bot.app.services.metrics import MESSAGES, WEBHOOKS, record_error, timed
+from whatsapp_bot.app.services.tracing import parse_traceparent, tracer
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
-agent = DealerAgent(api_key=os.getenv("GEMINI_API_KEY"))
+
+# Answer free-form partner questions with the streaming assistant instead of the canned reply
+AGENT_REPLIES = os.getenv("AGENT_REPLIES", "false").lower() in ("1", "true", "yes")
+
+# The agent is built on first use; it only gates readiness when it answers partners
+services.register("agent", create_agent, required=AGENT_REPLIES)
+
+# Dispatch table for list/button replies, flow steps and text intents
+conversation = ConversationRouter()
+
+# When enabled, POST /webhook only validates and enqueues; messages are processed by background workers
+ASYNC_INGESTION = os.getenv("WEBHOOK_ASYNC_MODE", "false").lower() in ("1", "true", "yes")
 
 # Session management
 
@@ -28,7 +48,7 @@ async def verify_webhook(request: Request):
     token = request.query_params.get("hub.verify_token")
     challenge = request.query_params.get("hub.challenge")
 
-    logger.info(f"Received webhook verification request: mode={mode}, token={token}")
+    logger.info("Received webhook verification request: mode=%s", mode, extra={"event": "webhook.verify"})
 
     if mode == "subscribe" and token == os.getenv("WHATSAPP_VERIFY_TOKEN"):
         if not challenge:
@@ -45,395 +65,640 @@ async def verify_webhook(request: Request):
 @router.post("/webhook")
 async def webhook_handler(request: Request):
     """Handle incoming WhatsApp messages"""
+    # Continue the caller's trace when the delivery carries a W3C traceparent
+    with tracer.use_context(parse_traceparent(request.headers.get("traceparent"))):
+        with timed("webhook") as stage:
+            response = await receive_webhook(request)
+            status = response["status"] if isinstance(response, dict) else "busy"
+            stage.set_attribute("status", status)
+    WEBHOOKS.inc(status)
+    return response
+
+async def receive_webhook(request: Request):
+    """Parse a webhook delivery and process (or enqueue) its messages"""
     try:
         body = await request.body()
         data = json.loads(body)
-        logger.info(f"Received webhook data: {data}")
+        logger.debug("Received webhook delivery", extra={"event": "webhook.received", "payload": data})
 
-        entry = data.get("entry", [])
-        if not entry:
-            raise ValueError("Missing 'entry' in webhook data")
+        messages = extract_messages(data)
+        if not messages:
+            return {"status": "no_messages"}  # No messages in this webhook
 
-        changes = entry[0].get("changes", [])
-        if not changes:
-            raise ValueError("Missing 'changes' in webhook data")
+        if ASYNC_INGESTION:
+            # Acknowledge right away; workers process each sender's messages in order
+            results = []
+            for message in messages:
+                accepted = await message_workers.submit(message["from"], message)
+                results.append(_outcome(message, {"status": "accepted" if accepted else "rejected"}))
+
+            if any(result["status"] == "rejected" for result in results):
+                return JSONResponse(
+                    status_code=503,
+                    content={"status": "busy", "message": "Message queue is full", "results": results}
+                )
+            return {"status": "accepted", "results": results}
 
-        value = changes[0].get("value", {})
-        messages = value.get("messages", [])
+        results = await dispatch_messages(messages)
+        return {"status": "processed", "results": results}
 
-        if not messages:
-            return {"status": "no_messages"}  # No messages in this webhook
+    except Exception as e:
+        logger.error("Error processing webhook: %s", e, extra={"event": "webhook.error"})
+        record_error("webhook")
+        return {"status": "error", "message": str(e)}
 
-        message = messages[0]
+def extract_messages(data: Dict) -> List[Dict]:
+    """Collect every message from every entry and change of a webhook delivery, in delivery order"""
+    entries = data.get("entry", [])
+    if not entries:
+        raise ValueError("Missing 'entry' in webhook data")
+
+    messages = []
+    for entry in entries:
+        for change in entry.get("changes", []):
+            for message in change.get("value", {}).get("messages", []):
+                if "from" not in message:
+                    logger.warning("Skipping message without sender: %s", message.get("id"))
+                    continue
+                messages.append(message)
+    return messages
+
+def _outcome(message: Dict, result: Dict) -> Dict:
+    """Tag a handler result with the message it belongs to"""
+    return {"message_id": message.get("id"), "from": message.get("from"), **result}
+
+async def dispatch_messages(messages: List[Dict]) -> List[Dict]:
+    """
+    Process a batch of messages.
+
+    Messages from different senders run concurrently; messages from the same
+    sender run one after another in delivery order. Returns one outcome per
+    message, in the order the messages were given.
+    """
+    by_sender: Dict[str, List[int]] = {}
+    for index, message in enumerate(messages):
+        by_sender.setdefault(message["from"], []).append(index)
+
+    results: List[Dict] = [None] * len(messages)
+
+    async def run_sender(indexes: List[int]):
+        for index in indexes:
+            results[index] = _outcome(messages[index], await process_message(messages[index]))
+
+    await asyncio.gather(*(run_sender(indexes) for indexes in by_sender.values()))
+    return results
+
+async def process_message(message: Dict):
+    """Process a single inbound WhatsApp message"""
+    MESSAGES.inc(message.get("type", "unknown"))
+    try:
         phone_number = message["from"]
-        message_type = message.get("type", "text")
-
-        # Fetch session data
-        session = SessionManager().get_session(phone_number)
-
-        # Check if partner_info is not in session, verify partner status
-        if "partner_info" not in session:
-            logger.info(f"Checking partner status for phone_number: {phone_number}")
-            is_partner = is_partner_registered(phone_number)
-
-            if is_partner:
-                # Get partner greeting to extract name
-                greeting_message = get_partner_greeting(phone_number)
-                partner_name = greeting_message[3:-1]  # Remove "Hi " and "!"
-                session["partner_info"] = {"name": partner_name}
-                logger.info(f"Partner verified: {partner_name} for phone_number: {phone_number}")
-            else:
-                session["partner_info"] = None
-                logger.info(f"Not a registered partner: {phone_number}")
-
-        # Check if this is an image message
-        if message_type == "image":
-            return await handle_image_message(message, phone_number, session)
-
-        # Check if this is an interactive message response
-        if message_type == "interactive":
-            return await handle_interactive_response(message, phone_number)
-
-        # Handle text messages
-        message_text = message["text"]["body"].lower()
-        logger.info(f"Processing message from {phone_number}: {message_text}")
-
-        # Check if the user is in a specific flow (like product request)
-        if session.get("current_flow") == "product_request":
-            return await handle_product_request_flow(message_text, phone_number, session)
-
-        # Generate response
-        if session["partner_info"]:
-            partner_name = session["partner_info"]["name"]
-
-            # Check if the message is asking for assistance or services
-            if any(keyword in message_text for keyword in ["help", "assist", "service", "menu", "options", "hi", "hello"]):
-                # Send a greeting message first
-                greeting = f"Hello {partner_name}! Here are the services I can help you with:"
-                await send_whatsapp_message(phone_number, greeting)
-
-                # Then send the interactive service menu
-                await send_service_menu(phone_number, "AMD Partner Services")
-                return {"status": "success", "message": "Service menu sent"}
-            else:
-                # For other messages, send a standard response
-                response = f"Hello {partner_name}! How can I assist you today? Type 'menu' to see available services."
-                await send_whatsapp_message(phone_number, response)
-                return {"status": "success", "message": response}
-        else:
-            response = "Please contact our sales team to register as a partner."
-            await send_whatsapp_message(phone_number, response)
-            return {"status": "success", "message": response}
+
+        # Meta redelivers on timeouts; skip messages we have already handled
+        if await deduplicator.is_duplicate(message.get("id")):
+            logger.info("Skipping duplicate message %s", message.get("id"), extra={"event": "message.duplicate", "phone": phone_number})
+            return {"status": "duplicate"}
+
+        handled = False
+        try:
+            # Fetch session data and persist any changes the handlers make to it
+            session = await session_manager.get_session(phone_number)
+            result = None
+            try:
+                with timed("process_message", message_type=message.get("type", "unknown"), message_id=message.get("id")):
+                    result = await handle_message(message, phone_number, session)
+            finally:
+                await session_manager.save_session(phone_number, session)
+                # Written behind; nobody waits for it
+                await record_conversation_event(phone_number, {
+                    "messageId": message.get("id"),
+                    "type": message.get("type", "unknown"),
+                    "flow": session.get("current_flow"),
+                    "status": result.get("status") if isinstance(result, dict) else "error",
+                })
+            handled = not (isinstance(result, dict) and result.get("status") == "error")
+            return result
+        finally:
+            if not handled:
+                # Not handled; let Meta's redelivery through instead of dropping it as a duplicate
+                await deduplicator.release(message.get("id"))
 
     except Exception as e:
-        logger.error(f"Error processing webhook: {e}")
+        logger.error("Error processing message %s: %s", message.get("id"), e, extra={"event": "message.error", "phone": message.get("from")})
         return {"status": "error", "message": str(e)}
 
-async def handle_image_message(message, phone_number, session):
-    """Handle incoming image messages"""
+async def resolve_partner(phone_number: str, session: Dict):
+    """Look up the sender's partner record and keep it in the session"""
+    with timed("partner_lookup") as stage:
+        partner = await get_partner(phone_number)
+        stage.set_attribute("registered", partner is not None)
+    if partner:
+        session["partner_info"] = {"name": partner["name"], "doc_id": partner["doc_id"]}
+    else:
+        session["partner_info"] = None
+        logger.info("Not a registered partner", extra={"event": "partner.unknown", "phone": phone_number})
+    return partner
+
+async def handle_message(message: Dict, phone_number: str, session: Dict):
+    """Route a message to the right handler using the sender's session"""
+    message_type = message.get("type", "text")
+
+    # Resolve the partner once per message; served from the partner cache after the first lookup.
+    # Images start their own Graph API work while the lookup is still running.
+    if message_type == "image":
+        partner_lookup = asyncio.ensure_future(resolve_partner(phone_number, session))
+        return await handle_image_message(message, phone_number, session, partner_lookup)
+    await resolve_partner(phone_number, session)
+
+    # Check if this is an interactive message response
+    if message_type == "interactive":
+        return await handle_interactive_response(message, phone_number, session)
+
+    # Handle text messages
+    message_text = message["text"]["body"].lower()
+    logger.info("Processing text message %s", message.get("id"), extra={"event": "message.text", "phone": phone_number, "text": message_text})
+
+    # Check if the user is in a specific flow (like product request)
+    current_flow = session.get("current_flow")
+    if current_flow:
+        return await handle_flow_step(current_flow, message_text, phone_number, session)
+
+    # Generate response
+    if session["partner_info"]:
+        # Check if the message is asking for assistance or services
+        intent_handler = conversation.resolve_intent(message_text)
+        if intent_handler:
+            return await intent_handler(phone_number, session, message_text)
+
+        # Free-form questions go to the assistant when it is enabled
+        if AGENT_REPLIES:
+            return await reply_with_agent(message, phone_number)
+
+        # For other messages, send a standard response
+        partner_name = session["partner_info"]["name"]
+        response = f"Hello {partner_name}! How can I assist you today? Type 'menu' to see available services."
+        await send_whatsapp_message(phone_number, response)
+        return {"status": "success", "message": response}
+    else:
+        response = "Please contact our sales team to register as a partner."
+        await send_whatsapp_message(phone_number, response)
+        return {"status": "success", "message": response}
+
+# Background workers used when WEBHOOK_ASYNC_MODE is enabled
+message_workers = MessageWorkerPool(process_message)
+
+async def handle_image_message(message, phone_number, session, partner_lookup=None):
+    """
+    Handle incoming image messages.
+
+    The media URL lookup runs alongside the partner lookup, then the upload
+    is queued as part of the sender's current album and confirmed together
+    with the rest of it (see ``confirm_album``). Nothing is written to
+    Storage before the sender is known to be a partner.
+    """
+    if partner_lookup is None:
+        partner_lookup = asyncio.ensure_future(resolve_partner(phone_number, session))
+    try:
+        return await _handle_image_message(message, phone_number, partner_lookup)
+    finally:
+        # The lookup writes the session; let it land before process_message saves it
+        await asyncio.wait({partner_lookup})
+
+async def _handle_image_message(message, phone_number, partner_lookup):
+    media_lookup = None
     try:
         # Extract image data
         image_data = message.get("image", {})
         image_id = image_data.get("id")
         image_caption = message.get("caption", "")
 
-        logger.info(f"Processing image from phone_number: {phone_number}, image_id: {image_id}")
-
-        # Check if the user is a registered partner - we should already have this info from the main handler
-        if not session.get("partner_info"):
-            logger.info(f"Not a registered partner: {phone_number}")
-            await send_whatsapp_message(
-                phone_number,
-                "I noticed you sent an image, but you're not registered as a partner. Please contact our sales team to register."
-            )
-            return {"status": "success", "message": "Non-partner image notification sent"}
+        logger.info("Processing image %s", image_id, extra={"event": "image.received", "phone": phone_number})
 
-        # User is a registered partner, proceed with saving the image
-        logger.info(f"Partner info found in session for phone_number: {phone_number}, proceeding to save image")
+        # Get the media URL while the partner lookup is in flight
+        media_lookup = asyncio.ensure_future(get_media_url(image_id))
+        await asyncio.wait({partner_lookup, media_lookup}, return_when=asyncio.FIRST_COMPLETED)
 
-        # Get image URL from WhatsApp
-        from whatsapp_bot.app.services.whatsapp_service import get_media_url
+        if partner_lookup.done() and not partner_lookup.result():
+            media_lookup.cancel()
+            return await send_non_partner_image_notice(phone_number)
 
-        # Get the media URL
-        media_url_result = await get_media_url(image_id)
-
-        if media_url_result.get("status") == "error":
-            error_message = media_url_result.get('message')
-            logger.error(f"Error getting media URL: {error_message}")
-            await send_whatsapp_message(
-                phone_number,
-                "Sorry, I couldn't process your image. Please try again."
-            )
-            return {"status": "error", "message": error_message}
-
-        # Log media information for debugging
-        logger.info(f"Media information: mime_type={media_url_result.get('mime_type')}, file_size={media_url_result.get('file_size')}")
-
-        # Store the image in Firestore
-        result = await store_image_in_firestore(
+        album_size = image_albums.submit(
             phone_number,
-            media_url_result.get("url"),
-            image_id,
-            image_caption
+            lambda: upload_image(phone_number, image_id, image_caption, media_lookup, partner_lookup, message.get("id"))
         )
-
-        if result.get("status") == "success":
-            # Send success message with storage details
-            storage_path = result.get("data", {}).get("storagePath", "")
-            logger.info(f"Image successfully stored at path: {storage_path}")
-
-            await send_whatsapp_message(
-                phone_number,
-                "Your image has been uploaded successfully! You can send more images or type 'menu' to see other services."
-            )
-            return {"status": "success", "message": "Image uploaded successfully", "storage_path": storage_path}
-        else:
-            # Send error message with more details
-            error_message = result.get('message')
-            logger.error(f"Error storing image: {error_message}")
-
-            # Send a more user-friendly message based on the error type
-            user_message = "Sorry, there was an error uploading your image. Please try again later."
-
-            if "download" in error_message.lower():
-                user_message = "Sorry, I had trouble downloading your image. Please try sending it again with a smaller file size."
-            elif "storage" in error_message.lower() or "bucket" in error_message.lower() or "404" in error_message:
-                user_message = "Sorry, I had trouble saving your image to our storage system. Our team has been notified of this issue."
-                # Log additional details for storage errors
-                logger.error(f"Storage error details: {error_message}")
-            elif "metadata" in error_message.lower() or "firestore" in error_message.lower():
-                user_message = "Your image was uploaded but we couldn't save the information about it. Please try again."
-
-            await send_whatsapp_message(
-                phone_number,
-                user_message
-            )
-            return {"status": "error", "message": error_message}
+        return {"status": "accepted", "message": "Image queued for upload", "album_size": album_size}
 
     except Exception as e:
-        logger.error(f"Error handling image message: {e}")
+        logger.error("Error handling image message: %s", e, extra={"event": "image.error", "phone": phone_number})
+        if media_lookup is not None:
+            media_lookup.cancel()
+        partner_lookup.cancel()
         await send_whatsapp_message(
             phone_number,
             "Sorry, I encountered an error processing your image. Please try again later."
         )
         return {"status": "error", "message": str(e)}
 
-async def handle_interactive_response(message, phone_number):
+async def upload_image(phone_number: str, image_id: str, caption: str, media_lookup, partner_lookup, message_id: str = None) -> Dict:
+    """
+    Store one image of an album; runs once the album collector grants it an upload slot.
+
+    The webhook was acknowledged before the upload ran, so a failed upload
+    gives back its dedup claim here; a redelivery of the message is then
+    processed again instead of being dropped as a duplicate.
+    """
+    try:
+        result = await _upload_image(phone_number, image_id, caption, media_lookup, partner_lookup)
+    except BaseException:
+        await deduplicator.release(message_id)
+        raise
+    if result.get("status") == "error":
+        await deduplicator.release(message_id)
+    return result
+
+async def _upload_image(phone_number: str, image_id: str, caption: str, media_lookup, partner_lookup) -> Dict:
+    media_url_result = await media_lookup
+
+    if media_url_result.get("status") == "error":
+        if not await partner_lookup:
+            return {"status": "not_partner"}
+        error_message = media_url_result.get('message')
+        logger.error("Error getting media URL: %s", error_message)
+        return {
+            "status": "error",
+            "message": error_message,
+            "reply": "Sorry, I couldn't process your image. Please try again."
+        }
+
+    logger.debug(
+        "Media information for %s", image_id,
+        extra={"mime_type": media_url_result.get("mime_type"), "file_size": media_url_result.get("file_size")}
+    )
+
+    # Store the image; the upload itself waits for the partner lookup
+    result = await store_image_in_firestore(
+        phone_number,
+        media_url_result.get("url"),
+        image_id,
+        caption,
+        sha256=media_url_result.get("sha256"),
+        partner=partner_lookup,
+        file_size=media_url_result.get("file_size")
+    )
+
+    if result.get("status") == "success":
+        return result
+    if not await partner_lookup:
+        return {"status": "not_partner"}
+
+    error_message = result.get('message')
+    logger.error("Error storing image: %s", error_message, extra={"event": "image.error", "phone": phone_number})
+
+    # Send a more user-friendly message based on the error type
+    user_message = "Sorry, there was an error uploading your image. Please try again later."
+
+    if "download" in error_message.lower():
+        user_message = "Sorry, I had trouble downloading your image. Please try sending it again with a smaller file size."
+    elif "storage" in error_message.lower() or "bucket" in error_message.lower() or "404" in error_message:
+        user_message = "Sorry, I had trouble saving your image to our storage system. Our team has been notified of this issue."
+        # Log additional details for storage errors
+        logger.error("Storage error details: %s", error_message, extra={"event": "image.storage_error"})
+    elif "metadata" in error_message.lower() or "firestore" in error_message.lower():
+        user_message = "Your image was uploaded but we couldn't save the information about it. Please try again."
+
+    return {"status": "error", "message": error_message, "reply": user_message}
+
+async def confirm_album(phone_number: str, results: List):
+    """Send one reply for all the images a sender just uploaded"""
+    if any(isinstance(result, dict) and result.get("status") == "not_partner" for result in results):
+        await send_non_partner_image_notice(phone_number)
+        return
+
+    uploaded = duplicates = 0
+    failures = []
+    for result in results:
+        if isinstance(result, dict) and result.get("status") == "success":
+            if result.get("data", {}).get("duplicate"):
+                duplicates += 1
+            else:
+                uploaded += 1
+        else:
+            failures.append(result)
+
+    if len(results) == 1:
+        if failures:
+            failure = failures[0]
+            reply = failure.get("reply") if isinstance(failure, dict) else None
+            confirmation = reply or "Sorry, I encountered an error processing your image. Please try again later."
+        elif duplicates:
+            confirmation = "This image is already in your account, so it wasn't uploaded again. You can send more images or type 'menu' to see other services."
+        else:
+            confirmation = "Your image has been uploaded successfully! You can send more images or type 'menu' to see other services."
+        await send_whatsapp_message(phone_number, confirmation, priority=PRIORITY_BULK)
+        return
+
+    parts = []
+    if uploaded:
+        parts.append(f"{uploaded} image{'s' if uploaded != 1 else ''} uploaded successfully")
+    if duplicates:
+        parts.append(f"{duplicates} already in your account, so not uploaded again")
+    if failures:
+        parts.append(f"{len(failures)} could not be saved, please send {'them' if len(failures) != 1 else 'it'} again")
+    confirmation = "; ".join(parts) + ". You can send more images or type 'menu' to see other services."
+    await send_whatsapp_message(phone_number, confirmation[0].upper() + confirmation[1:], priority=PRIORITY_BULK)
+
+# Images a sender sends in quick succession are uploaded through a bounded pool and confirmed together
+image_albums = AlbumCollector(confirm_album)
+
+async def send_non_partner_image_notice(phone_number: str):
+    """Tell an unregistered sender their image was not stored"""
+    await send_whatsapp_message(
+        phone_number,
+        "I noticed you sent an image, but you're not registered as a partner. Please contact our sales team to register.",
+        priority=PRIORITY_BULK
+    )
+    return {"status": "success", "message": "Non-partner image notification sent"}
+
+async def reply_with_agent(message: Dict, phone_number: str):
+    """Stream the assistant's reply to the partner, sending each chunk as soon as it is ready"""
+    # Read receipt and typing indicator go out right away, without waiting for the model
+    read_receipt = None
+    if message.get("id"):
+        read_receipt = asyncio.create_task(mark_as_read(phone_number, message["id"]))
+
+    agent = await services.get("agent")
+    chunker = StreamChunker()
+    sent = 0
+    failed = False
+    async for text in agent.stream_message(phone_number, message["text"]["body"]):
+        failed = failed or isinstance(text, FallbackReply)
+        for chunk in chunker.feed(text):
+            await send_whatsapp_message(phone_number, chunk)
+            sent += 1
+    for chunk in chunker.flush():
+        await send_whatsapp_message(phone_number, chunk)
+        sent += 1
+
+    if read_receipt:
+        await read_receipt
+    if failed:
+        return {"status": "error", "message": "Assistant reply failed; fallback sent", "chunks": sent}
+    return {"status": "success", "message": "Assistant reply sent", "chunks": sent}
+
+async def handle_interactive_response(message, phone_number, session):
     """Handle responses from interactive messages"""
     try:
         interactive_data = message.get("interactive", {})
         interactive_type = interactive_data.get("type")
 
-        # Fetch session data
-        session = SessionManager().get_session(phone_number)
-
         if interactive_type == "list_reply":
-            selected_id = interactive_data.get("list_reply", {}).get("id")
-            selected_title = interactive_data.get("list_reply", {}).get("title")
-
-            logger.info(f"User {phone_number} selected: {selected_id} - {selected_title}")
-
-            # Handle different service selections
-            if selected_id == "upload_product_images":
-                # Directly instruct the user to send images
-                response = "Please send your product images as attachments. You can also add a caption to describe each image. I'll automatically save them to your partner account."
-                await send_whatsapp_message(phone_number, response)
-                return {"status": "success", "message": "Upload instructions sent"}
-
-            elif selected_id == "request_new_product":
-                response = "To request a new product, please provide the following details:\n\n1. Product name\n2. Product category\n3. Specifications\n4. Quantity needed"
-                await send_whatsapp_message(phone_number, response)
-
-                # Ask if they want to proceed with a form
-                buttons = [
-                    {"id": "start_product_request", "title": "Start Request"},
-                    {"id": "back_to_menu", "title": "Back to Menu"}
-                ]
-                await send_button_message(
-                    phone_number,
-                    "Would you like to start a new product request now?",
-                    buttons
-                )
-                return {"status": "success", "message": "Product request info sent"}
-
-            elif selected_id == "technical_support":
-                response = "For technical support, please describe your issue in detail. Our support team will get back to you within 24 hours."
-                await send_whatsapp_message(phone_number, response)
-
-                # Offer common support categories
-                buttons = [
-                    {"id": "hardware_support", "title": "Hardware Issue"},
-                    {"id": "software_support", "title": "Software Issue"},
-                    {"id": "other_support", "title": "Other Issue"}
-                ]
-                await send_button_message(
-                    phone_number,
-                    "What type of technical support do you need?",
-                    buttons
-                )
-                return {"status": "success", "message": "Support options sent"}
-
-            elif selected_id == "order_status":
-                response = "To check your order status, please provide your order number. Format: ORD-XXXXX"
-                await send_whatsapp_message(phone_number, response)
-                return {"status": "success", "message": response}
-
-            else:
-                response = "I'm not sure how to process that selection. Please try again or type 'menu' to see available services."
-                await send_whatsapp_message(phone_number, response)
-                return {"status": "success", "message": response}
+            reply = interactive_data.get("list_reply", {})
+            logger.info("List reply %s", reply.get("id"), extra={"event": "message.list_reply", "phone": phone_number})
+            handler = conversation.resolve_list_reply(reply.get("id"))
 
         elif interactive_type == "button_reply":
-            button_id = interactive_data.get("button_reply", {}).get("id")
-            button_title = interactive_data.get("button_reply", {}).get("title")
-
-            logger.info(f"User {phone_number} clicked button: {button_id} - {button_title}")
-
-            # Handle different button responses
-            if button_id == "no_cancel" or button_id == "back_to_menu":
-                response = "No problem. Is there anything else I can help you with?"
-                await send_whatsapp_message(phone_number, response)
-
-                # Send the main menu again
-                await send_service_menu(phone_number, "AMD Partner Services")
-                return {"status": "success", "message": "Service menu sent"}
-
-            elif button_id == "start_product_request":
-                response = "Let's start your product request. Please send the product name."
-                await send_whatsapp_message(phone_number, response)
-
-                # Update session to track product request state
-                session["current_flow"] = "product_request"
-                session["product_request_step"] = "name"
-
-                return {"status": "success", "message": response}
-
-            elif button_id.startswith("category_"):
-                # Handle category selection for product request
-                category = button_id.replace("category_", "")
-                category_title = button_title
-
-                # Save the category in the session
-                session["product_category"] = category_title
-                session["product_request_step"] = "specs"
-
-                # Ask for specifications
-                response = f"You've selected the category: {category_title}. Please provide the specifications for this product:"
-                await send_whatsapp_message(phone_number, response)
-                return {"status": "success", "message": response}
-
-            elif button_id in ["hardware_support", "software_support", "other_support"]:
-                support_type = button_id.split("_")[0].capitalize()
-                response = f"You've selected {support_type} Support. Please describe your issue in detail, and our support team will assist you."
-                await send_whatsapp_message(phone_number, response)
-                return {"status": "success", "message": response}
-
-            elif button_id == "need_more_help":
-                response = "What else can I help you with today?"
-                await send_whatsapp_message(phone_number, response)
-                # Send the main menu again
-                await send_service_menu(phone_number, "AMD Partner Services")
-                return {"status": "success", "message": "Service menu sent"}
-
-            elif button_id == "done_for_now":
-                response = "Thank you for using AMD Partner Services. Have a great day! Feel free to message us anytime you need assistance."
-                await send_whatsapp_message(phone_number, response)
-                return {"status": "success", "message": response}
+            reply = interactive_data.get("button_reply", {})
+            logger.info("Button reply %s", reply.get("id"), extra={"event": "message.button_reply", "phone": phone_number})
+            handler = conversation.resolve_button_reply(reply.get("id"))
 
-            else:
-                response = "I'm not sure how to process that selection. Please try again or type 'menu' to see available services."
-                await send_whatsapp_message(phone_number, response)
-                return {"status": "success", "message": response}
+        else:
+            return {"status": "error", "message": "Unsupported interactive message type"}
+
+        if handler is None:
+            response = "I'm not sure how to process that selection. Please try again or type 'menu' to see available services."
+            await send_whatsapp_message(phone_number, response)
+            return {"status": "success", "message": response}
 
-        return {"status": "error", "message": "Unsupported interactive message type"}
+        return await handler(phone_number, session, reply.get("id"), reply.get("title"))
 
     except Exception as e:
-        logger.error(f"Error handling interactive response: {e}")
+        logger.error("Error handling interactive response: %s", e, extra={"event": "message.interactive_error", "phone": phone_number})
         return {"status": "error", "message": str(e)}
 
-async def handle_product_request_flow(message_text: str, phone_number: str, session: dict):
-    """Handle the product request flow based on the current step"""
-    current_step = session.get("product_request_step", "name")
+async def handle_flow_step(flow: str, message_text: str, phone_number: str, session: dict):
+    """Handle a text message sent while the user is inside a multi-step flow"""
+    step = session.get(f"{flow}_step", "name")
+    handler = conversation.resolve_flow_step(flow, step)
+    if handler:
+        result = await handler(message_text, phone_number, session)
+        if result is not None:
+            return result
 
-    if current_step == "name":
-        # Save the product name
-        session["product_name"] = message_text
-        session["product_request_step"] = "category"
+    # Default response if something goes wrong
+    response = "I'm not sure what information you're providing. Let's start over. Type 'menu' to see available services."
+    await send_whatsapp_message(phone_number, response)
 
-        # Ask for category
-        response = f"Great! You're requesting the product: {message_text}\n\nNow, please select the product category:"
-        await send_whatsapp_message(phone_number, response)
+    # Reset the flow
+    session.pop("current_flow", None)
+    session.pop(f"{flow}_step", None)
 
-        # Send category options as buttons
-        buttons = [
-            {"id": "category_processor", "title": "Processor"},
-            {"id": "category_graphics", "title": "Graphics Card"},
-            {"id": "category_motherboard", "title": "Motherboard"}
-        ]
-        await send_button_message(phone_number, "Select a category:", buttons)
-        return {"status": "success", "message": "Category options sent"}
-
-    elif current_step == "category" and not message_text.startswith("category_"):
-        # If they typed the category instead of using buttons
-        session["product_category"] = message_text
-        session["product_request_step"] = "specs"
-
-        # Ask for specifications
-        response = "Please provide the specifications for this product:"
-        await send_whatsapp_message(phone_number, response)
-        return {"status": "success", "message": response}
+    return {"status": "success", "message": response}
 
-    elif current_step == "specs":
-        # Save the specifications
-        session["product_specs"] = message_text
-        session["product_request_step"] = "quantity"
+# Conversation routes
 
-        # Ask for quantity
-        response = "How many units would you like to order?"
-        await send_whatsapp_message(phone_number, response)
-        return {"status": "success", "message": response}
+@conversation.intent("service_menu", ["help", "assist", "assistance", "service", "services", "menu", "options", "hi", "hello"])
+async def send_menu_for_intent(phone_number: str, session: dict, message_text: str):
+    partner_name = session["partner_info"]["name"]
 
-    elif current_step == "quantity":
-        # Save the quantity
-        session["product_quantity"] = message_text
-
-        # Complete the product request
-        product_name = session.get("product_name", "Unknown")
-        product_category = session.get("product_category", "Unknown")
-        product_specs = session.get("product_specs", "Not provided")
-        product_quantity = session.get("product_quantity", "Not specified")
-
-        # Format the confirmation message
-        confirmation = f"Thank you for your product request. Here's a summary:\n\n" \
-                      f"Product: {product_name}\n" \
-                      f"Category: {product_category}\n" \
-                      f"Specifications: {product_specs}\n" \
-                      f"Quantity: {product_quantity}\n\n" \
-                      f"Your request has been submitted. Our team will review it and get back to you within 48 hours."
-
-        await send_whatsapp_message(phone_number, confirmation)
-
-        # Reset the flow
-        session.pop("current_flow", None)
-        session.pop("product_request_step", None)
-
-        # Ask if they need anything else
-        buttons = [
-            {"id": "need_more_help", "title": "Need More Help"},
-            {"id": "done_for_now", "title": "Done for Now"}
-        ]
-        await send_button_message(phone_number, "Is there anything else I can help you with?", buttons)
-        return {"status": "success", "message": "Product request completed"}
+    # Send a greeting message first
+    greeting = f"Hello {partner_name}! Here are the services I can help you with:"
+    await send_whatsapp_message(phone_number, greeting)
 
-    # Default response if something goes wrong
-    response = "I'm not sure what information you're providing. Let's start over. Type 'menu' to see available services."
+    # Then send the interactive service menu
+    await send_service_menu(phone_number, "AMD Partner Services")
+    return {"status": "success", "message": "Service menu sent"}
+
+@conversation.list_reply("upload_product_images")
+async def select_upload_product_images(phone_number: str, session: dict, reply_id: str, title: str):
+    # Directly instruct the user to send images
+    response = "Please send your product images as attachments. You can also add a caption to describe each image. I'll automatically save them to your partner account."
+    await send_whatsapp_message(phone_number, response)
+    return {"status": "success", "message": "Upload instructions sent"}
+
+@conversation.list_reply("request_new_product")
+async def select_request_new_product(phone_number: str, session: dict, reply_id: str, title: str):
+    response = "To request a new product, please provide the following details:\n\n1. Product name\n2. Product category\n3. Specifications\n4. Quantity needed"
+    await send_whatsapp_message(phone_number, response)
+
+    # Ask if they want to proceed with a form
+    buttons = [
+        {"id": "start_product_request", "title": "Start Request"},
+        {"id": "back_to_menu", "title": "Back to Menu"}
+    ]
+    await send_button_message(
+        phone_number,
+        "Would you like to start a new product request now?",
+        buttons
+    )
+    return {"status": "success", "message": "Product request info sent"}
+
+@conversation.list_reply("technical_support")
+async def select_technical_support(phone_number: str, session: dict, reply_id: str, title: str):
+    response = "For technical support, please describe your issue in detail. Our support team will get back to you within 24 hours."
+    await send_whatsapp_message(phone_number, response)
+
+    # Offer common support categories
+    buttons = [
+        {"id": "hardware_support", "title": "Hardware Issue"},
+        {"id": "software_support", "title": "Software Issue"},
+        {"id": "other_support", "title": "Other Issue"}
+    ]
+    await send_button_message(
+        phone_number,
+        "What type of technical support do you need?",
+        buttons
+    )
+    return {"status": "success", "message": "Support options sent"}
+
+@conversation.list_reply("order_status")
+async def select_order_status(phone_number: str, session: dict, reply_id: str, title: str):
+    response = "To check your order status, please provide your order number. Format: ORD-XXXXX"
     await send_whatsapp_message(phone_number, response)
+    return {"status": "success", "message": response}
+
+@conversation.button_reply("no_cancel", "back_to_menu")
+async def click_back_to_menu(phone_number: str, session: dict, button_id: str, title: str):
+    response = "No problem. Is there anything else I can help you with?"
+    await send_whatsapp_message(phone_number, response)
+
+    # Send the main menu again
+    await send_service_menu(phone_number, "AMD Partner Services", priority=PRIORITY_BULK)
+    return {"status": "success", "message": "Service menu sent"}
+
+@conversation.button_reply("start_product_request")
+async def click_start_product_request(phone_number: str, session: dict, button_id: str, title: str):
+    response = "Let's start your product request. Please send the product name."
+    await send_whatsapp_message(phone_number, response)
+
+    # Update session to track product request state
+    session["current_flow"] = "product_request"
+    session["product_request_step"] = "name"
+
+    return {"status": "success", "message": response}
+
+@conversation.button_prefix("category_")
+async def click_product_category(phone_number: str, session: dict, button_id: str, title: str):
+    # Handle category selection for product request
+    category_title = title
+
+    # Save the category in the session
+    session["product_category"] = category_title
+    session["product_request_step"] = "specs"
+
+    # Ask for specifications
+    response = f"You've selected the category: {category_title}. Please provide the specifications for this product:"
+    await send_whatsapp_message(phone_number, response)
+    return {"status": "success", "message": response}
+
+@conversation.button_reply("hardware_support", "software_support", "other_support")
+async def click_support_type(phone_number: str, session: dict, button_id: str, title: str):
+    support_type = button_id.split("_")[0].capitalize()
+    response = f"You've selected {support_type} Support. Please describe your issue in detail, and our support team will assist you."
+    await send_whatsapp_message(phone_number, response)
+    return {"status": "success", "message": response}
+
+@conversation.button_reply("need_more_help")
+async def click_need_more_help(phone_number: str, session: dict, button_id: str, title: str):
+    response = "What else can I help you with today?"
+    await send_whatsapp_message(phone_number, response)
+    # Send the main menu again
+    await send_service_menu(phone_number, "AMD Partner Services", priority=PRIORITY_BULK)
+    return {"status": "success", "message": "Service menu sent"}
+
+@conversation.button_reply("done_for_now")
+async def click_done_for_now(phone_number: str, session: dict, button_id: str, title: str):
+    response = "Thank you for using AMD Partner Services. Have a great day! Feel free to message us anytime you need assistance."
+    await send_whatsapp_message(phone_number, response)
+    return {"status": "success", "message": response}
+
+# Product request flow
+
+@conversation.flow_step("product_request", "name")
+async def product_request_name(message_text: str, phone_number: str, session: dict):
+    # Save the product name
+    session["product_name"] = message_text
+    session["product_request_step"] = "category"
+
+    # Ask for category
+    response = f"Great! You're requesting the product: {message_text}\n\nNow, please select the product category:"
+    await send_whatsapp_message(phone_number, response)
+
+    # Send category options as buttons
+    buttons = [
+        {"id": "category_processor", "title": "Processor"},
+        {"id": "category_graphics", "title": "Graphics Card"},
+        {"id": "category_motherboard", "title": "Motherboard"}
+    ]
+    await send_button_message(phone_number, "Select a category:", buttons)
+    return {"status": "success", "message": "Category options sent"}
+
+@conversation.flow_step("product_request", "category")
+async def product_request_category(message_text: str, phone_number: str, session: dict):
+    if message_text.startswith("category_"):
+        return None
+
+    # If they typed the category instead of using buttons
+    session["product_category"] = message_text
+    session["product_request_step"] = "specs"
+
+    # Ask for specifications
+    response = "Please provide the specifications for this product:"
+    await send_whatsapp_message(phone_number, response)
+    return {"status": "success", "message": response}
+
+@conversation.flow_step("product_request", "specs")
+async def product_request_specs(message_text: str, phone_number: str, session: dict):
+    # Save the specifications
+    session["product_specs"] = message_text
+    session["product_request_step"] = "quantity"
+
+    # Ask for quantity
+    response = "How many units would you like to order?"
+    await send_whatsapp_message(phone_number, response)
+    return {"status": "success", "message": response}
+
+@conversation.flow_step("product_request", "quantity")
+async def product_request_quantity(message_text: str, phone_number: str, session: dict):
+    # Save the quantity
+    session["product_quantity"] = message_text
+
+    # Complete the product request
+    product_name = session.get("product_name", "Unknown")
+    product_category = session.get("product_category", "Unknown")
+    product_specs = session.get("product_specs", "Not provided")
+    product_quantity = session.get("product_quantity", "Not specified")
+
+    # Wait for the commit; the confirmation below tells them it is submitted
+    request = {"product": product_name, "category": product_category, "specifications": product_specs, "quantity": product_quantity}
+    try:
+        with timed("product_request_write"):
+            await (await save_product_request(phone_number, request, (session.get("partner_info") or {}).get("doc_id")))
+    except Exception as e:
+        logger.error("Failed to save product request: %s", e, extra={"event": "product_request.error", "phone": phone_number})
+        await send_whatsapp_message(phone_number, "Sorry, we couldn't submit your product request. Please try again later.")
+        return {"status": "error", "message": "Failed to save product request"}
+
+    # Format the confirmation message
+    confirmation = f"Thank you for your product request. Here's a summary:\n\n" \
+                  f"Product: {product_name}\n" \
+                  f"Category: {product_category}\n" \
+                  f"Specifications: {product_specs}\n" \
+                  f"Quantity: {product_quantity}\n\n" \
+                  f"Your request has been submitted. Our team will review it and get back to you within 48 hours."
+
+    await send_whatsapp_message(phone_number, confirmation)
 
     # Reset the flow
     session.pop("current_flow", None)
     session.pop("product_request_step", None)
 
-    return {"status": "success", "message": response}
+    # Ask if they need anything else
+    buttons = [
+        {"id": "need_more_help", "title": "Need More Help"},
+        {"id": "done_for_now", "title": "Done for Now"}
+    ]
+    await send_button_message(phone_number, "Is there anything else I can help you with?", buttons, priority=PRIORITY_BULK)
+    return {"status": "success", "message": "Product request completed"}
 
 # @router.post("/webhook")
 # async def webhook_handler(request: Request):
@@ -0,0 +1,153 @@
+import os
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class _Album:
+    __slots__ = ("key", "jobs", "opened_at", "deadline", "closer")
+
+    def __init__(self, key: str):
+        self.key = key
+        self.jobs: List[asyncio.Task] = []
+        self.opened_at = time.monotonic()
+        self.deadline = self.opened_at
+        self.closer: Optional[asyncio.Task] = None
+
+
+class AlbumCollector:
+    """
+    Groups media a sender sends in quick succession and uploads it through
+    a bounded pool.
+
+    Every submitted job starts right away, but runs only once it holds a
+    slot from the global limit (``max_concurrent``) and one from its
+    sender's limit (``per_sender``), so a partner dropping 30 photos can
+    neither flood Storage nor starve other partners. An album stays open
+    while new media keeps arriving within ``window`` seconds, up to
+    ``max_wait`` seconds or ``max_size`` items; once it closes and all its
+    jobs have finished, ``on_complete`` is called once with every result,
+    in submission order.
+    """
+
+    def __init__(
+        self,
+        on_complete: Callable[[str, List[Any]], Awaitable[None]],
+        window: Optional[float] = None,
+        max_wait: Optional[float] = None,
+        max_size: Optional[int] = None,
+        max_concurrent: Optional[int] = None,
+        per_sender: Optional[int] = None,
+    ):
+        self.on_complete = on_complete
+        self.window = window if window is not None else float(os.getenv("ALBUM_WINDOW", "2.0"))
+        self.max_wait = max_wait if max_wait is not None else float(os.getenv("ALBUM_MAX_WAIT", "10.0"))
+        self.max_size = max_size or int(os.getenv("ALBUM_MAX_SIZE", "30"))
+        self.max_concurrent = max_concurrent or int(os.getenv("MEDIA_MAX_CONCURRENT", "16"))
+        self.per_sender = per_sender or int(os.getenv("MEDIA_MAX_PER_SENDER", "3"))
+
+        self._slots = asyncio.Semaphore(self.max_concurrent)
+        self._sender_slots: Dict[str, asyncio.Semaphore] = {}
+        self._sender_jobs: Dict[str, int] = {}
+        self._albums: Dict[str, _Album] = {}
+        self._closing: set = set()
+
+        self.active = 0
+        self.albums_completed = 0
+        self.jobs_completed = 0
+        self.jobs_failed = 0
+
+    def submit(self, key: str, job: Callable[[], Awaitable[Any]]) -> int:
+        """Start ``job`` under the concurrency limits and add it to ``key``'s open album. Returns the album size so far."""
+        album = self._albums.get(key)
+        if album is None:
+            album = self._albums[key] = _Album(key)
+        album.jobs.append(asyncio.create_task(self._run(key, job)))
+
+        now = time.monotonic()
+        album.deadline = min(now + self.window, album.opened_at + self.max_wait)
+        if len(album.jobs) >= self.max_size:
+            album.deadline = now
+        if album.closer is None:
+            album.closer = asyncio.create_task(self._close_when_quiet(album))
+        elif album.deadline <= now:
+            # Full: wake the closer now rather than after the window
+            album.closer.cancel()
+            album.closer = asyncio.create_task(self._close_when_quiet(album))
+        return len(album.jobs)
+
+    async def _run(self, key: str, job: Callable[[], Awaitable[Any]]):
+        self._sender_jobs[key] = self._sender_jobs.get(key, 0) + 1
+        sender_slots = self._sender_slots.get(key)
+        if sender_slots is None:
+            sender_slots = self._sender_slots[key] = asyncio.Semaphore(self.per_sender)
+        try:
+            async with sender_slots, self._slots:
+                self.active += 1
+                try:
+                    return await job()
+                finally:
+                    self.active -= 1
+        finally:
+            self._sender_jobs[key] -= 1
+            if not self._sender_jobs[key]:
+                del self._sender_jobs[key]
+                del self._sender_slots[key]
+
+    async def _close_when_quiet(self, album: _Album):
+        while True:
+            delay = album.deadline - time.monotonic()
+            if delay <= 0:
+                break
+            await asyncio.sleep(delay)
+
+        # Later media from the same sender starts a new album
+        if self._albums.get(album.key) is album:
+            del self._albums[album.key]
+        self._closing.add(album)
+        try:
+            results = await asyncio.gather(*album.jobs, return_exceptions=True)
+            for result in results:
+                if isinstance(result, BaseException):
+                    self.jobs_failed += 1
+                    logger.error("Album job failed: %s", result)
+                else:
+                    self.jobs_completed += 1
+            self.albums_completed += 1
+            await self.on_complete(album.key, results)
+        except Exception as e:
+            logger.error("Failed to complete album of %s items: %s", len(album.jobs), e)
+        finally:
+            self._closing.discard(album)
+
+    async def stop(self, timeout: float = 60.0):
+        """Close every open album now and wait for their uploads and summaries."""
+        for album in list(self._albums.values()):
+            album.deadline = time.monotonic()
+            if album.closer is not None:
+                album.closer.cancel()
+            album.closer = asyncio.create_task(self._close_when_quiet(album))
+        pending = [album.closer for album in list(self._albums.values()) + list(self._closing)]
+        if not pending:
+            return
+        done, not_done = await asyncio.wait(pending, timeout=timeout)
+        if not_done:
+            logger.warning("%s albums did not finish within %ss", len(not_done), timeout)
+            for task in not_done:
+                task.cancel()
+
+    def stats(self) -> Dict:
+        return {
+            "open_albums": len(self._albums),
+            "closing_albums": len(self._closing),
+            "active": self.active,
+            "waiting": sum(self._sender_jobs.values()) - self.active,
+            "max_concurrent": self.max_concurrent,
+            "per_sender": self.per_sender,
+            "albums_completed": self.albums_completed,
+            "jobs_completed": self.jobs_completed,
+            "jobs_failed": self.jobs_failed,
+        }
@@ -0,0 +1,208 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    Bounded in-process cache with per-entry TTL and LRU eviction.
+
+    Entries expire ``ttl`` seconds after they were written. When the cache is
+    full, the least recently used entry is evicted to make room.
+    """
+
+    def __init__(self, max_size: int = 10000, ttl: Optional[float] = 3600.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, _MISSING, count=False) is not _MISSING
+
+    def get(self, key: Hashable, default: Any = None, count: bool = True) -> Any:
+        item = self._data.get(key)
+        if item is not None:
+            value, expires_at = item
+            if expires_at is None or expires_at > time.monotonic():
+                self._data.move_to_end(key)
+                if count:
+                    self.hits += 1
+                return value
+            del self._data[key]
+        if count:
+            self.misses += 1
+        return default
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = _MISSING):
+        ttl = self.ttl if ttl is _MISSING else ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        self._data[key] = (value, expires_at)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def items(self):
+        """Live (key, value) pairs, oldest first. Does not touch LRU order or counters."""
+        now = time.monotonic()
+        return [
+            (key, value) for key, (value, expires_at) in self._data.items()
+            if expires_at is None or expires_at > now
+        ]
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        item = self._data.pop(key, None)
+        return item[0] if item is not None else default
+
+    def clear(self):
+        self._data.clear()
+
+    def purge_expired(self) -> int:
+        """Drop every expired entry. Returns how many were removed."""
+        now = time.monotonic()
+        expired = [
+            key for key, (_, expires_at) in self._data.items()
+            if expires_at is not None and expires_at <= now
+        ]
+        for key in expired:
+            del self._data[key]
+        return len(expired)
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._data),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+class AsyncTTLCache:
+    """
+    Read-through cache for an async ``loader``.
+
+    Concurrent misses for the same key share a single load. The load runs in
+    its own task, so a caller that is cancelled stops waiting without
+    cancelling it for the others. A loader result of ``None`` is cached as
+    well (negative caching), with its own, usually shorter, ``negative_ttl``.
+    Loader exceptions are never cached, and a load that was running when its
+    key was invalidated is not stored.
+
+    With ``refresh_after``, an entry older than that is still returned (until
+    ``ttl``), and a reload is started in the background to replace it.
+    """
+
+    def __init__(
+        self,
+        loader: Callable[[Hashable], Awaitable[Any]],
+        max_size: int = 10000,
+        ttl: Optional[float] = 300.0,
+        negative_ttl: Optional[float] = 60.0,
+        refresh_after: Optional[float] = None,
+    ):
+        self.loader = loader
+        self.negative_ttl = negative_ttl
+        self._cache = TTLCache(max_size=max_size, ttl=ttl)
+        # Keys whose entry is younger than refresh_after
+        self._fresh = TTLCache(max_size=max_size, ttl=refresh_after) if refresh_after is not None else None
+        self._pending: Dict[Hashable, asyncio.Task] = {}
+        self.loads = 0
+        self.refreshes = 0
+        self.load_errors = 0
+
+    async def get(self, key: Hashable) -> Any:
+        value = self._cache.get(key, _MISSING)
+        if value is not _MISSING:
+            if self._fresh is not None and key not in self._fresh and key not in self._pending:
+                self.refreshes += 1
+                self.load(key)
+            return value
+        return await asyncio.shield(self.load(key))
+
+    def load(self, key: Hashable) -> asyncio.Task:
+        """
+        Load ``key`` in a task of its own, or join the load already running.
+
+        The cached value is replaced once the task finishes. A failed load
+        leaves the current entry in place.
+        """
+        task = self._pending.get(key)
+        if task is None:
+            task = self._pending[key] = asyncio.create_task(self._load(key))
+            task.add_done_callback(_retrieve_exception)
+        return task
+
+    async def _load(self, key: Hashable) -> Any:
+        task = asyncio.current_task()
+        try:
+            self.loads += 1
+            value = await self.loader(key)
+        except Exception:
+            self.load_errors += 1
+            raise
+        finally:
+            if self._pending.get(key) is task:
+                del self._pending[key]
+                stored = True
+            else:
+                # Invalidated while loading; the value may predate the change
+                stored = False
+        if stored:
+            self._store(key, value)
+        return value
+
+    def _store(self, key: Hashable, value: Any):
+        if value is None:
+            self._cache.set(key, None, ttl=self.negative_ttl)
+        else:
+            self._cache.set(key, value)
+        if self._fresh is not None:
+            self._fresh.set(key, True)
+
+    def pending(self, key: Hashable) -> Optional[asyncio.Task]:
+        """The load running for ``key``, if any."""
+        return self._pending.get(key)
+
+    def set(self, key: Hashable, value: Any):
+        self._cache.set(key, value)
+        if self._fresh is not None:
+            self._fresh.set(key, True)
+
+    def peek(self, key: Hashable) -> Any:
+        """The cached value for ``key``, or None; never loads and is not counted as a hit or miss."""
+        return self._cache.get(key, None, count=False)
+
+    def invalidate(self, key: Hashable):
+        self._cache.pop(key)
+        self._pending.pop(key, None)
+        if self._fresh is not None:
+            self._fresh.pop(key)
+
+    def clear(self):
+        self._cache.clear()
+        self._pending.clear()
+        if self._fresh is not None:
+            self._fresh.clear()
+
+    def stats(self) -> dict:
+        stats = {**self._cache.stats(), "loads": self.loads, "load_errors": self.load_errors}
+        if self._fresh is not None:
+            stats["refreshes"] = self.refreshes
+        return stats
+
+
+def _retrieve_exception(task: asyncio.Task):
+    # Background loads may finish with nobody waiting on them
+    if not task.cancelled():
+        task.exception()
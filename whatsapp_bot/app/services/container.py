@@ -0,0 +1,124 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+Factory = Callable[[], Awaitable[Any]]
+Closer = Callable[[Any], Awaitable[None]]
+
+
+class _Dependency:
+    __slots__ = ("name", "factory", "closer", "required", "instance", "status", "error", "init_seconds", "task")
+
+    def __init__(self, name: str, factory: Factory, closer: Optional[Closer], required: bool):
+        self.name = name
+        self.factory = factory
+        self.closer = closer
+        self.required = required
+        self.instance = None
+        self.status = "pending"
+        self.error: Optional[str] = None
+        self.init_seconds: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None
+
+
+class ServiceContainer:
+    """
+    Lazily initialized application services (Firebase, Storage, Gemini, HTTP).
+
+    Nothing is created at import time. A service is built the first time it
+    is requested, or during ``startup`` which initializes the required
+    services concurrently; optional ones wait for their first request.
+    Concurrent requests for a service that is still initializing share the
+    same initialization, and failures are recorded per service for the
+    readiness endpoint; a failed service is retried on its next request.
+    """
+
+    def __init__(self):
+        self._dependencies: Dict[str, _Dependency] = {}
+
+    def register(self, name: str, factory: Factory, closer: Optional[Closer] = None, required: bool = True):
+        self._dependencies[name] = _Dependency(name, factory, closer, required)
+
+    def override(self, name: str, instance: Any):
+        """Use a ready-made instance (a fake in tests and benchmarks) instead of the factory."""
+        dependency = self._dependencies.get(name) or _Dependency(name, None, None, True)
+        # The caller owns the instance, so shutdown leaves it alone
+        dependency.closer = None
+        dependency.instance = instance
+        dependency.status = "ready"
+        dependency.error = None
+        dependency.init_seconds = 0.0
+        self._dependencies[name] = dependency
+
+    async def _initialize(self, dependency: _Dependency):
+        started = time.perf_counter()
+        try:
+            dependency.instance = await dependency.factory()
+        except Exception as e:
+            dependency.status = "error"
+            dependency.error = str(e)
+            logger.error("Failed to initialize %s: %s", dependency.name, e)
+            raise
+        else:
+            dependency.status = "ready"
+            dependency.error = None
+            logger.info("Initialized %s in %.3fs", dependency.name, time.perf_counter() - started)
+        finally:
+            dependency.init_seconds = time.perf_counter() - started
+            dependency.task = None
+
+    async def get(self, name: str) -> Any:
+        dependency = self._dependencies[name]
+        if dependency.status == "ready":
+            return dependency.instance
+        if dependency.task is None:
+            dependency.status = "initializing"
+            dependency.task = asyncio.create_task(self._initialize(dependency))
+        await asyncio.shield(dependency.task)
+        return dependency.instance
+
+    def peek(self, name: str) -> Any:
+        """The service if it is already initialized, else None. Never triggers initialization."""
+        dependency = self._dependencies.get(name)
+        return dependency.instance if dependency and dependency.status == "ready" else None
+
+    async def startup(self, names: Optional[Iterable[str]] = None) -> Dict:
+        """Initialize the given (default: all required) services concurrently and return readiness."""
+        if names is None:
+            names = [name for name, dependency in self._dependencies.items() if dependency.required]
+        await asyncio.gather(*(self.get(name) for name in names), return_exceptions=True)
+        return self.readiness()
+
+    async def shutdown(self):
+        for dependency in reversed(list(self._dependencies.values())):
+            if dependency.status == "ready" and dependency.closer is not None:
+                try:
+                    await dependency.closer(dependency.instance)
+                except Exception as e:
+                    logger.error("Error closing %s: %s", dependency.name, e)
+            if dependency.factory is not None:
+                dependency.instance = None
+                dependency.status = "pending"
+
+    def readiness(self) -> Dict:
+        services = {
+            name: {
+                "status": dependency.status,
+                "required": dependency.required,
+                "error": dependency.error,
+                "init_seconds": dependency.init_seconds,
+            }
+            for name, dependency in self._dependencies.items()
+        }
+        ready = all(
+            dependency.status == "ready"
+            for dependency in self._dependencies.values()
+            if dependency.required
+        )
+        return {"ready": ready, "services": services}
+
+
+services = ServiceContainer()
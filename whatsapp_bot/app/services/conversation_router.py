@@ -0,0 +1,110 @@
+import re
+from typing import Awaitable, Callable, Dict, Iterable, Optional, Pattern, Tuple
+
+Handler = Callable[..., Awaitable[Dict]]
+
+
+class IntentMatcher:
+    """
+    Matches free text against keyword lists with one compiled regex.
+
+    Keywords only match as whole words, so "hi" matches "hi there" but not
+    "this" or "shipping". All intents share a single alternation, so adding
+    keywords does not add passes over the text.
+    """
+
+    def __init__(self):
+        self._intents: Dict[str, str] = {}
+        self._pattern: Optional[Pattern] = None
+
+    def add(self, intent: str, keywords: Iterable[str]):
+        for keyword in keywords:
+            self._intents[keyword.lower()] = intent
+        self._pattern = None
+
+    def _compile(self) -> Pattern:
+        # Longest first so multi-word keywords win over their prefixes
+        alternation = "|".join(re.escape(keyword) for keyword in sorted(self._intents, key=len, reverse=True))
+        return re.compile(rf"\b(?:{alternation})\b", re.IGNORECASE)
+
+    def match(self, text: str) -> Optional[str]:
+        if not self._intents:
+            return None
+        if self._pattern is None:
+            self._pattern = self._compile()
+        found = self._pattern.search(text)
+        return self._intents[found.group(0).lower()] if found else None
+
+
+class ConversationRouter:
+    """
+    Declarative dispatch table for the conversation.
+
+    List and button replies are resolved by id with a dict lookup; button ids
+    like ``category_processor`` fall back to registered prefixes. Multi-step
+    flows are keyed by ``(flow, step)`` and free text is routed by intent.
+    """
+
+    def __init__(self):
+        self._list_replies: Dict[str, Handler] = {}
+        self._button_replies: Dict[str, Handler] = {}
+        self._button_prefixes: Dict[str, Handler] = {}
+        self._prefix_lengths: Tuple[int, ...] = ()
+        self._flow_steps: Dict[Tuple[str, str], Handler] = {}
+        self._intent_handlers: Dict[str, Handler] = {}
+        self.intents = IntentMatcher()
+
+    def list_reply(self, *reply_ids: str):
+        def register(handler: Handler) -> Handler:
+            for reply_id in reply_ids:
+                self._list_replies[reply_id] = handler
+            return handler
+        return register
+
+    def button_reply(self, *button_ids: str):
+        def register(handler: Handler) -> Handler:
+            for button_id in button_ids:
+                self._button_replies[button_id] = handler
+            return handler
+        return register
+
+    def button_prefix(self, prefix: str):
+        def register(handler: Handler) -> Handler:
+            self._button_prefixes[prefix] = handler
+            self._prefix_lengths = tuple(sorted({len(p) for p in self._button_prefixes}, reverse=True))
+            return handler
+        return register
+
+    def flow_step(self, flow: str, step: str):
+        def register(handler: Handler) -> Handler:
+            self._flow_steps[(flow, step)] = handler
+            return handler
+        return register
+
+    def intent(self, name: str, keywords: Iterable[str]):
+        def register(handler: Handler) -> Handler:
+            self.intents.add(name, keywords)
+            self._intent_handlers[name] = handler
+            return handler
+        return register
+
+    def resolve_list_reply(self, reply_id: Optional[str]) -> Optional[Handler]:
+        return self._list_replies.get(reply_id)
+
+    def resolve_button_reply(self, button_id: Optional[str]) -> Optional[Handler]:
+        if not button_id:
+            return None
+        handler = self._button_replies.get(button_id)
+        if handler is None:
+            for length in self._prefix_lengths:
+                handler = self._button_prefixes.get(button_id[:length])
+                if handler is not None:
+                    break
+        return handler
+
+    def resolve_flow_step(self, flow: str, step: str) -> Optional[Handler]:
+        return self._flow_steps.get((flow, step))
+
+    def resolve_intent(self, text: str) -> Optional[Handler]:
+        intent = self.intents.match(text)
+        return self._intent_handlers.get(intent) if intent else None
@@ -0,0 +1,174 @@
+import os
+import asyncio
+import logging
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+from whatsapp_bot.app.services.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+
+class DedupBackend:
+    """
+    Storage for seen WhatsApp message IDs.
+
+    ``claim`` must be atomic: it records the ID and returns True only for the
+    first caller within the TTL, so several workers sharing one backend agree
+    on which of them handles a redelivered message.
+    """
+
+    async def claim(self, message_id: str) -> bool:
+        raise NotImplementedError
+
+    async def release(self, message_id: str):
+        """Forget a claim, so a redelivery of the message is processed again."""
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+
+class InMemoryDedupBackend(DedupBackend):
+    """Per-process TTL/LRU store. Fast, but each worker keeps its own view."""
+
+    def __init__(self, max_size: int, ttl: float):
+        self._seen = TTLCache(max_size=max_size, ttl=ttl)
+
+    async def claim(self, message_id: str) -> bool:
+        if message_id in self._seen:
+            return False
+        self._seen.set(message_id, True)
+        return True
+
+    async def release(self, message_id: str):
+        self._seen.pop(message_id)
+
+
+class SQLiteDedupBackend(DedupBackend):
+    """SQLite-backed store shared by every worker process on the same host."""
+
+    def __init__(self, path: str, ttl: float):
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS seen_messages (message_id TEXT PRIMARY KEY, seen_at REAL NOT NULL)"
+        )
+        self._claims = 0
+
+    def _claim(self, message_id: str) -> bool:
+        now = time.time()
+        with self._lock:
+            # Insert, or take over an entry whose TTL has lapsed
+            cursor = self._conn.execute(
+                "INSERT INTO seen_messages (message_id, seen_at) VALUES (?, ?) "
+                "ON CONFLICT(message_id) DO UPDATE SET seen_at = excluded.seen_at "
+                "WHERE seen_messages.seen_at < ?",
+                (message_id, now, now - self.ttl)
+            )
+            claimed = cursor.rowcount == 1
+
+            self._claims += 1
+            if self._claims % 1000 == 0:
+                self._conn.execute("DELETE FROM seen_messages WHERE seen_at < ?", (now - self.ttl,))
+        return claimed
+
+    async def claim(self, message_id: str) -> bool:
+        return await asyncio.to_thread(self._claim, message_id)
+
+    def _release(self, message_id: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM seen_messages WHERE message_id = ?", (message_id,))
+
+    async def release(self, message_id: str):
+        await asyncio.to_thread(self._release, message_id)
+
+    async def close(self):
+        self._conn.close()
+
+
+class MessageDeduplicator:
+    """
+    Drops redelivered webhook messages before any I/O is done for them.
+
+    New IDs are claimed through the (possibly shared) backend. An optional
+    local TTL cache answers repeat lookups without a round trip to a shared
+    backend. A claim is released when processing fails, so Meta's
+    redelivery gets another try instead of being dropped.
+    """
+
+    def __init__(self, backend: DedupBackend, local: Optional[TTLCache] = None):
+        self.backend = backend
+        self._local = local
+        self.hits = 0
+        self.misses = 0
+        self.released = 0
+
+    async def is_duplicate(self, message_id: Optional[str]) -> bool:
+        if not message_id:
+            return False
+
+        if self._local is not None and message_id in self._local:
+            self.hits += 1
+            return True
+
+        try:
+            claimed = await self.backend.claim(message_id)
+        except Exception as e:
+            # Failing open: better to risk a duplicate reply than drop a message
+            logger.error("Dedup backend error for message %s: %s", message_id, e)
+            return False
+
+        if self._local is not None:
+            self._local.set(message_id, True)
+        if claimed:
+            self.misses += 1
+            return False
+
+        self.hits += 1
+        return True
+
+    async def release(self, message_id: Optional[str]):
+        if not message_id:
+            return
+        if self._local is not None:
+            self._local.pop(message_id)
+        try:
+            await self.backend.release(message_id)
+            self.released += 1
+        except Exception as e:
+            logger.error("Dedup backend error releasing message %s: %s", message_id, e)
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "backend": type(self.backend).__name__,
+            "hits": self.hits,
+            "misses": self.misses,
+            "released": self.released,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "local_size": len(self._local) if self._local is not None else 0,
+        }
+
+
+def create_deduplicator() -> MessageDeduplicator:
+    """Build the deduplicator configured by DEDUP_BACKEND (memory or sqlite)."""
+    ttl = float(os.getenv("DEDUP_TTL_SECONDS", "86400"))
+    max_size = int(os.getenv("DEDUP_MAX_SIZE", "100000"))
+    backend_name = os.getenv("DEDUP_BACKEND", "memory").lower()
+
+    if backend_name == "sqlite":
+        path = os.getenv("DEDUP_SQLITE_PATH", "whatsapp_dedup.sqlite3")
+        logger.info("Using SQLite message dedup store at %s", path)
+        # Repeat lookups are answered in-process, without a SQLite query
+        return MessageDeduplicator(SQLiteDedupBackend(path, ttl), local=TTLCache(max_size=max_size, ttl=ttl))
+
+    return MessageDeduplicator(InMemoryDedupBackend(max_size, ttl))
+
+
+deduplicator = create_deduplicator()
@@ -0,0 +1,39 @@
+import os
+import asyncio
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def get_firebase_executor() -> ThreadPoolExecutor:
+    """
+    Dedicated thread pool for the blocking firebase_admin / google-cloud SDK calls.
+
+    Kept separate from the loop's default executor so a burst of slow Storage
+    uploads cannot starve other ``to_thread`` users, and sized independently
+    with FIREBASE_EXECUTOR_WORKERS.
+    """
+    global _executor
+    if _executor is None:
+        workers = int(os.getenv("FIREBASE_EXECUTOR_WORKERS", "16"))
+        _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="firebase")
+        logger.info("Firebase executor started with %s threads", workers)
+    return _executor
+
+
+async def run_blocking(func: Callable, *args, **kwargs) -> Any:
+    """Run a blocking Firebase SDK call on the Firebase executor without stalling the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_firebase_executor(), functools.partial(func, *args, **kwargs))
+
+
+def shutdown_executor(wait: bool = True):
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=wait)
+        _executor = None
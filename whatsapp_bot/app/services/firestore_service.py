@@ -1,14 +1,26 @@
 import os
-from firebase_admin import credentials, firestore, initialize_app, storage
 import json
 import base64
 import uuid
 from datetime import datetime
-import requests
-from io import BytesIO
 import logging
-import time
+import asyncio
+import inspect
 import httpx
+from typing import Awaitable, Dict, Optional, Tuple, Union
+from whatsapp_bot.app.services.cache import AsyncTTLCache
+from whatsapp_bot.app.services.container import services
+from whatsapp_bot.app.services.metrics import timed
+from whatsapp_bot.app.services.executor import run_blocking
+from whatsapp_bot.app.services.media_pipeline import (
+    MEDIA_DOWNLOAD_DEADLINE, EmptyMediaError, MediaIntegrityError, MediaUploadError, backoff_delay, stream_media_to_blob
+)
+from whatsapp_bot.app.services.image_variants import (
+    IMAGE_VARIANT_TIMEOUT, create_variants, near_duplicate_mode, perceptual_hash, variants_enabled
+)
+from whatsapp_bot.app.services.photo_index import HammingIndex
+from whatsapp_bot.app.services.write_buffer import WriteBehindBuffer
+from whatsapp_bot.app.services.storage_urls import blob_url, refresh_url
 
 logger = logging.getLogger(__name__)
 
@@ -28,133 +40,383 @@ def check_environment_variables():
             missing_vars.append(var)
 
     if missing_vars:
-        logger.error(f"Missing required environment variables: {', '.join(missing_vars)}")
+        logger.error("Missing required environment variables: %s", ', '.join(missing_vars))
         return False
 
     # Check Firebase bucket
     firebase_bucket = 'leroc-retail-dev-0987.appspot.com'
-    logger.info(f"Using Firebase Storage bucket: {firebase_bucket}")
+    logger.info("Using Firebase Storage bucket: %s", firebase_bucket)
 
     return True
 
-# Check environment variables at startup
-env_check_result = check_environment_variables()
-if not env_check_result:
-    logger.warning("Environment variable check failed. Some functionality may not work correctly.")
+async def _init_firebase():
+    """Decode the service account and initialize the Firebase Admin SDK."""
+    if not check_environment_variables():
+        logger.warning("Environment variable check failed. Some functionality may not work correctly.")
 
-# Initialize Firebase
-firebase_creds_base64 = os.getenv("FIREBASE_CREDENTIALS_BASE64")
-if firebase_creds_base64:
-    try:
-        creds_json = json.loads(base64.b64decode(firebase_creds_base64).decode("utf-8"))
-        cred = credentials.Certificate(creds_json)
+    firebase_creds_base64 = os.getenv("FIREBASE_CREDENTIALS_BASE64")
+    if not firebase_creds_base64:
+        raise ValueError("Firebase credentials not found in environment variable.")
+
+    # Get bucket name from environment variable with fallback
+    firebase_bucket = os.getenv('FIREBASE_STORAGE_BUCKET', 'leroc-retail-dev-0987.appspot.com')
+    logger.info("Using Firebase Storage bucket: %s", firebase_bucket)
 
-        # Get bucket name from environment variable with fallback
-        firebase_bucket = os.getenv('FIREBASE_STORAGE_BUCKET', 'leroc-retail-dev-0987.appspot.com')
-        logger.info(f"Using Firebase Storage bucket: {firebase_bucket}")
+    def initialize():
+        # firebase_admin pulls in google-auth and grpc, so it is imported on first use
+        import firebase_admin
+        from firebase_admin import credentials
 
-        initialize_app(cred, {
+        creds_json = json.loads(base64.b64decode(firebase_creds_base64).decode("utf-8"))
+        cred = credentials.Certificate(creds_json)
+        return firebase_admin.initialize_app(cred, {
             'storageBucket': firebase_bucket
         })
-        logger.info("Firebase Admin SDK initialized successfully")
 
-        db = firestore.client()
-        bucket = storage.bucket()
+    try:
+        app = await run_blocking(initialize)
+    except Exception as e:
+        raise ValueError(f"Firebase initialization failed: {str(e)}")
+    logger.info("Firebase Admin SDK initialized successfully")
+    return app
+
+async def _close_firebase(app):
+    import firebase_admin
+
+    await run_blocking(firebase_admin.delete_app, app)
+
+def _firestore_client(app):
+    from firebase_admin import firestore
+
+    return firestore.client(app)
+
+def _storage_bucket(app):
+    from firebase_admin import storage
 
-        # Verify bucket access
+    return storage.bucket(app=app)
+
+async def _init_firestore():
+    # SDK imports happen in the executor too, so they don't stall the event loop
+    app = await services.get("firebase")
+    return await run_blocking(_firestore_client, app)
+
+async def _init_storage():
+    app = await services.get("firebase")
+    bucket = await run_blocking(_storage_bucket, app)
+
+    # Listing a blob costs a round trip, so the access check is opt-in
+    if os.getenv("STORAGE_STARTUP_PROBE", "false").lower() in ("1", "true", "yes"):
         try:
-            # Try to list a single blob to verify access
-            next(bucket.list_blobs(max_results=1), None)
-            logger.info(f"Successfully connected to Firebase Storage bucket: {bucket.name}")
+            await run_blocking(lambda: next(bucket.list_blobs(max_results=1), None))
+            logger.info("Successfully connected to Firebase Storage bucket: %s", bucket.name)
         except Exception as e:
-            logger.error(f"Failed to access Firebase Storage bucket: {str(e)}")
+            logger.error("Failed to access Firebase Storage bucket: %s", e)
             logger.warning("Will attempt to create files in the default bucket location")
-    except Exception as e:
-        logger.error(f"Failed to initialize Firebase: {str(e)}")
-        raise ValueError(f"Firebase initialization failed: {str(e)}")
-else:
-    raise ValueError("Firebase credentials not found in environment variable.")
+    return bucket
+
+services.register("firebase", _init_firebase, closer=_close_firebase)
+services.register("firestore", _init_firestore)
+services.register("storage", _init_storage)
+
+def _query_partner(db, phone_number: str) -> Optional[Dict]:
+    """Run the single partners query for a phone number."""
+    query = db.collection("partners").where("contactNumber", "==", phone_number).limit(1).get()
+    if not query:
+        return None
+
+    partner_doc = query[0]
+    return {
+        "name": partner_doc.to_dict().get("partnerName", "Partner"),
+        "doc_id": partner_doc.id,
+        "doc_ref": partner_doc.reference
+    }
+
+async def _load_partner(phone_number: str) -> Optional[Dict]:
+    db = await services.get("firestore")
+    with timed("partner_query"):
+        return await run_blocking(_query_partner, db, phone_number)
+
+# Partner records change rarely; unregistered numbers are cached for a shorter time
+partner_cache = AsyncTTLCache(
+    _load_partner,
+    max_size=int(os.getenv("PARTNER_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("PARTNER_CACHE_TTL", "600")),
+    negative_ttl=float(os.getenv("PARTNER_CACHE_NEGATIVE_TTL", "60"))
+)
+
+async def get_partner(phone_number: str) -> Optional[Dict]:
+    """
+    Fetch the partner registered for a phone number.
 
-def is_partner_registered(phone_number: str) -> bool:
-    """Check if a phone number exists as a registered partner."""
+    Returns:
+        dict: ``name``, ``doc_id`` and ``doc_ref`` of the partner, or None if
+        the number is not registered (or the lookup failed)
+    """
     try:
-        query = db.collection("partners").where("contactNumber", "==", phone_number).limit(1).get()
-        return len(query) > 0
+        return await partner_cache.get(phone_number)
     except Exception as e:
-        logger.error(f"Error checking partner registration: {e}")
-        return False
+        logger.error("Error looking up partner: %s", e)
+        return None
 
-def get_partner_greeting(phone_number: str) -> str:
+def invalidate_partner(phone_number: str):
+    """Drop a cached partner record, e.g. after the partner document changed."""
+    partner_cache.invalidate(phone_number)
+
+async def get_partner_greeting(phone_number: str) -> str:
     """Fetch partner's name by phone number and return a greeting message."""
+    partner = await get_partner(phone_number)
+    if partner:
+        return f"Hi {partner['name']}!"
+    return "Hi! Your number is not registered as a partner."
+
+def _photo_hash_ref(db, partner_doc_id: str, sha256: str):
+    """Per-partner content-hash index: partners/{id}/photoHashes/{sha256}"""
+    return db.collection("partners").document(partner_doc_id).collection("photoHashes").document(sha256)
+
+def _read_photo_hash(db, partner_doc_id: str, sha256: str) -> Optional[Dict]:
+    snapshot = _photo_hash_ref(db, partner_doc_id, sha256).get()
+    return snapshot.to_dict() if snapshot.exists else None
+
+async def _load_photo_hash(key) -> Optional[Dict]:
+    partner_doc_id, sha256 = key
+    db = await services.get("firestore")
+    with timed("photo_hash_query"):
+        return await run_blocking(_read_photo_hash, db, partner_doc_id, sha256)
+
+# Known photo hashes rarely change; misses are kept short so new uploads show up quickly
+photo_hash_cache = AsyncTTLCache(
+    _load_photo_hash,
+    max_size=int(os.getenv("PHOTO_HASH_CACHE_SIZE", "50000")),
+    ttl=float(os.getenv("PHOTO_HASH_CACHE_TTL", "3600")),
+    negative_ttl=float(os.getenv("PHOTO_HASH_CACHE_NEGATIVE_TTL", "30"))
+)
+
+async def find_photo_by_hash(partner_doc_id: str, sha256: str) -> Optional[Dict]:
+    """Look up a photo the partner already uploaded with the same SHA-256."""
+    if not sha256:
+        return None
     try:
-        query = db.collection("partners").where("contactNumber", "==", phone_number).limit(1).get()
+        return await photo_hash_cache.get((partner_doc_id, sha256))
+    except Exception as e:
+        logger.error("Error checking photo hash index: %s", e)
+        return None
 
-        if query:
-            partner_name = query[0].to_dict().get("partnerName", "Partner")
-            return f"Hi {partner_name}!"
+PHOTO_NEAR_DUPLICATE_DISTANCE = int(os.getenv("PHOTO_NEAR_DUPLICATE_DISTANCE", "6"))
+
+def _read_photo_index(db, partner_doc_id: str) -> HammingIndex:
+    photos = db.collection("partners").document(partner_doc_id).collection("photos")
+    index = HammingIndex(PHOTO_NEAR_DUPLICATE_DISTANCE)
+    for snapshot in photos.select(["dhash"]).get():
+        dhash = (snapshot.to_dict() or {}).get("dhash")
+        if dhash:
+            index.add(int(dhash, 16), snapshot.id)
+    return index
+
+async def _load_photo_index(partner_doc_id: str) -> HammingIndex:
+    db = await services.get("firestore")
+    with timed("photo_index_load"):
+        return await run_blocking(_read_photo_index, db, partner_doc_id)
+
+# One perceptual-hash index per partner, built from their photos on first use and
+# kept up to date with new uploads. After PHOTO_INDEX_REFRESH it is rebuilt in the
+# background to pick up other writers, while the old one keeps answering
+photo_index_cache = AsyncTTLCache(
+    _load_photo_index,
+    max_size=int(os.getenv("PHOTO_INDEX_PARTNERS", "1000")),
+    ttl=float(os.getenv("PHOTO_INDEX_TTL", "3600")),
+    refresh_after=float(os.getenv("PHOTO_INDEX_REFRESH", "900"))
+)
+
+# How long an upload waits for a partner's index that is not loaded yet
+PHOTO_INDEX_COLD_WAIT = float(os.getenv("PHOTO_INDEX_COLD_WAIT", "0.25"))
+
+async def find_near_duplicate(partner_doc_id: str, dhash: int) -> Optional[Tuple[int, str]]:
+    """
+    The closest ``(distance, photo_id)`` within PHOTO_NEAR_DUPLICATE_DISTANCE bits of ``dhash``, if any.
 
-        return "Hi! Your number is not registered as a partner."
+    A partner's first upload waits at most PHOTO_INDEX_COLD_WAIT for the index;
+    past that the photo is stored unchecked and the index finishes loading in
+    the background for the next one.
+    """
+    try:
+        if photo_index_cache.peek(partner_doc_id) is None:
+            index = await asyncio.wait_for(
+                asyncio.shield(photo_index_cache.load(partner_doc_id)), PHOTO_INDEX_COLD_WAIT
+            )
+        else:
+            index = await photo_index_cache.get(partner_doc_id)
+    except asyncio.TimeoutError:
+        logger.info("Photo index still loading, near-duplicate check skipped", extra={"event": "photo_index.cold"})
+        return None
     except Exception as e:
-        logger.error(f"Error getting partner greeting: {e}")
-        return "Hi! Your number is not registered as a partner."
+        logger.error("Error loading photo index: %s", e)
+        return None
+    with timed("near_duplicate_lookup"):
+        return index.nearest(dhash)
+
+def _index_photo(partner_doc_id: str, dhash: int, photo_id: str):
+    """Add a stored photo to the cached index, and to one being rebuilt."""
+    index = photo_index_cache.peek(partner_doc_id)
+    if index is not None:
+        index.add(dhash, photo_id)
+
+    pending = photo_index_cache.pending(partner_doc_id)
+    if pending is not None:
+        # The rebuild may have read the photos before this one was written
+        def add_to_rebuilt(future: asyncio.Future):
+            if future.cancelled() or future.exception() is not None:
+                return
+            rebuilt = future.result()
+            if all(item != photo_id for _, item in rebuilt.search(dhash)):
+                rebuilt.add(dhash, photo_id)
+        pending.add_done_callback(add_to_rebuilt)
+
+# Photo metadata, product requests and conversation events are committed
+# together in batches instead of one round trip each
+metadata_writes = WriteBehindBuffer(lambda: services.get("firestore"))
+
+async def save_product_request(phone_number: str, request: Dict, partner_doc_id: Optional[str] = None) -> asyncio.Future:
+    """
+    Queue a completed product request, under the partner when the sender is one.
 
-def get_partner_doc_ref(phone_number: str):
-    """Get the Firestore document reference for a partner by phone number."""
-    try:
-        query = db.collection("partners").where("contactNumber", "==", phone_number).limit(1).get()
+    Returns:
+        asyncio.Future: resolves once the request is committed
+    """
+    from firebase_admin.firestore import SERVER_TIMESTAMP
+    db = await services.get("firestore")
+    parent = db.collection("partners").document(partner_doc_id) if partner_doc_id else db
+    doc = parent.collection("productRequests").document()
+    data = dict(request, phoneNumber=phone_number, status="new", createdAt=SERVER_TIMESTAMP)
+    return await metadata_writes.submit((doc, data, False))
 
-        if query:
-            return query[0].reference
+def conversation_events_enabled() -> bool:
+    return os.getenv("CONVERSATION_EVENTS", "false").lower() == "true"
 
+async def record_conversation_event(phone_number: str, event: Dict) -> Optional[asyncio.Future]:
+    """
+    Queue a conversation event (CONVERSATION_EVENTS=true). Message text is
+    never stored, only what happened.
+
+    Returns:
+        Optional[asyncio.Future]: resolves once the event is committed, None when disabled
+    """
+    if not conversation_events_enabled():
+        return None
+    from firebase_admin.firestore import SERVER_TIMESTAMP
+    try:
+        db = await services.get("firestore")
+        doc = db.collection("conversations").document(phone_number).collection("events").document()
+        return await metadata_writes.submit((doc, dict(event, at=SERVER_TIMESTAMP), False))
+    except Exception as e:
+        logger.error("Error recording conversation event: %s", e)
         return None
+
+def _read_photo(db, partner_doc_id: str, photo_id: str) -> Optional[Dict]:
+    snapshot = db.collection("partners").document(partner_doc_id).collection("photos").document(photo_id).get()
+    return snapshot.to_dict() if snapshot.exists else None
+
+def _duplicate_result(bucket, existing: Dict) -> Dict:
+    return {
+        "status": "success",
+        "message": "Image already uploaded",
+        "data": {
+            "photoId": existing.get("photoId"),
+            "storageUrl": refresh_url(bucket, existing.get("storagePath"), existing.get("storageUrl")),
+            "storagePath": existing.get("storagePath"),
+            "duplicate": True
+        }
+    }
+
+async def _store_variants(bucket, partner_doc_id: str, filename: str, content: bytes) -> Optional[Dict]:
+    """
+    Render thumbnails and a compressed copy of an uploaded image and store them
+    under ``partners/{id}/variants/``. Variants are best effort: on failure the
+    original is kept without them.
+
+    Returns:
+        dict: ``width`` and ``height`` of the original and ``variants`` by
+        name, or None if they could not be created
+    """
+    try:
+        with timed("image_variants"):
+            rendered = await create_variants(content)
+
+        stem = filename.rsplit(".", 1)[0]
+        extension = rendered["format"].lower()
+
+        async def upload(variant: Dict):
+            path = f"partners/{partner_doc_id}/variants/{stem}_{variant['name']}.{extension}"
+            variant_blob = bucket.blob(path)
+            await run_blocking(variant_blob.upload_from_string, variant["data"], content_type=rendered["content_type"])
+            return variant["name"], {
+                "storagePath": path,
+                **(await blob_url(variant_blob)),
+                "width": variant["width"],
+                "height": variant["height"],
+                "contentType": rendered["content_type"],
+                "fileSize": len(variant["data"])
+            }
+
+        with timed("variant_upload", count=len(rendered["variants"])):
+            uploaded = await asyncio.gather(*(upload(variant) for variant in rendered["variants"]))
+        return {"width": rendered["width"], "height": rendered["height"], "variants": dict(uploaded)}
     except Exception as e:
-        logger.error(f"Error getting partner document reference: {e}")
+        logger.error("Failed to create image variants: %s", e)
         return None
 
-async def store_image_in_firestore(phone_number: str, image_url: str, image_id: str, caption: str = None):
+class _NotAPartner(Exception):
+    """The sender turned out not to be a registered partner."""
+
+class _AlreadyUploaded(Exception):
+    """The partner already has a photo with this content hash."""
+
+    def __init__(self, existing: Dict):
+        super().__init__(existing.get("photoId"))
+        self.existing = existing
+
+async def store_image_in_firestore(
+    phone_number: str,
+    image_url: str,
+    image_id: str,
+    caption: str = None,
+    sha256: str = None,
+    partner: Union[Dict, Awaitable[Optional[Dict]], None] = None,
+    file_size: int = None
+):
     """
     Store image metadata in Firestore and the actual image in Firebase Storage.
 
+    Images whose content hash is already in the partner's hash index are not
+    uploaded again; the existing photo is returned instead.
+
     Args:
         phone_number: The partner's phone number
         image_url: The URL of the image from WhatsApp
         image_id: The WhatsApp image ID
         caption: Optional caption for the image
+        sha256: Content hash reported by the WhatsApp media API, if known
+        partner: The partner record, or a still-running lookup for it. Only
+            the Storage upload waits for a pending lookup, so the download
+            overlaps with it. Looked up by phone number when omitted.
+        file_size: Size reported by the WhatsApp media API, if known; the
+            download is checked against it and ``sha256``
 
     Returns:
         dict: Status of the operation
     """
     try:
         if not image_url or not image_id:
-            logger.error(f"Missing image URL or ID: url={image_url}, id={image_id}")
+            logger.error("Missing image URL or ID: url=%s, id=%s", image_url, image_id)
             return {
                 "status": "error",
                 "message": "Missing image URL or ID"
             }
 
-        # First verify this is a registered partner
-        if not is_partner_registered(phone_number):
-            logger.error(f"Attempted to store image for non-partner: {phone_number}")
-            return {
-                "status": "error",
-                "message": "Phone number is not registered as a partner"
-            }
-
-        # Get partner document reference
-        partner_doc_ref = get_partner_doc_ref(phone_number)
-
-        if not partner_doc_ref:
-            logger.error(f"Partner document not found for phone_number: {phone_number}")
-            return {
-                "status": "error",
-                "message": "Partner not found in database"
-            }
-
-        # Get partner document ID for folder structure
-        partner_doc_id = partner_doc_ref.id
-        logger.info(f"Using partner document ID for storage: {partner_doc_id}")
-
-        logger.info(f"Downloading image from WhatsApp for phone_number: {phone_number}")
+        if partner is None:
+            partner = get_partner(phone_number)
+        if inspect.isawaitable(partner):
+            # A future can be awaited again by every download attempt
+            partner = asyncio.ensure_future(partner)
 
         # Get WhatsApp API key for authorization
         api_key = os.getenv("WHATSAPP_API_KEY")
@@ -170,62 +432,15 @@ async def store_image_in_firestore(phone_number: str, image_url: str, image_id:
             "Authorization": f"Bearer {api_key}"
         }
 
-        # Try to download the image with retries
-        max_retries = 3
-        retry_delay = 2  # seconds
-        image_content = None
-
-        for attempt in range(max_retries):
-            try:
-                logger.info(f"Download attempt {attempt + 1} for image_id: {image_id}")
-
-                # Try using httpx for async download
-                async with httpx.AsyncClient(timeout=60.0) as client:
-                    response = await client.get(
-                        image_url,
-                        headers=headers,
-                        follow_redirects=True  # Follow redirects automatically
-                    )
-                    response.raise_for_status()
-
-                    # Check content length
-                    content_length = response.headers.get('content-length')
-                    if content_length and int(content_length) == 0:
-                        logger.warning(f"Image has zero content length on attempt {attempt + 1}")
-                        if attempt < max_retries - 1:
-                            time.sleep(retry_delay)
-                            continue
-                        else:
-                            return {
-                                "status": "error",
-                                "message": "Image has zero content length after multiple attempts"
-                            }
-
-                    image_content = response.content
-                    if image_content and len(image_content) > 0:
-                        logger.info(f"Successfully downloaded image on attempt {attempt + 1}, size: {len(image_content)} bytes")
-                        break
-                    else:
-                        logger.warning(f"Empty image content on attempt {attempt + 1}")
-                        if attempt < max_retries - 1:
-                            time.sleep(retry_delay)
-
-            except (httpx.HTTPStatusError, httpx.RequestError) as e:
-                logger.error(f"Failed to download image on attempt {attempt + 1}: {str(e)}")
-                if attempt < max_retries - 1:
-                    logger.info(f"Retrying download in {retry_delay} seconds...")
-                    time.sleep(retry_delay)
-                else:
-                    return {
-                        "status": "error",
-                        "message": f"Failed to download image after {max_retries} attempts: {str(e)}"
-                    }
-
-        if not image_content or len(image_content) == 0:
-            logger.error("Downloaded image has no content after all attempts")
+        # Verify bucket exists and is accessible
+        try:
+            db = await services.get("firestore")
+            bucket = await services.get("storage")
+        except Exception as e:
+            logger.error("Firebase Storage bucket is not properly initialized: %s", e)
             return {
                 "status": "error",
-                "message": "Downloaded image has no content"
+                "message": "Storage system is not properly configured"
             }
 
         # Generate a unique filename
@@ -233,53 +448,187 @@ async def store_image_in_firestore(phone_number: str, image_url: str, image_id:
         file_extension = "jpg"  # Default to jpg for WhatsApp images
         filename = f"{phone_number}_{timestamp}_{uuid.uuid4().hex}.{file_extension}"
 
-        # Create the storage path using the partner document ID
-        storage_path = f"partners/{partner_doc_id}/{filename}"
-        logger.info(f"Uploading image to Firebase Storage: {storage_path}")
+        partner_record = None
+        storage_path = None
+        blob = None
+
+        async def resolve_partner() -> Dict:
+            nonlocal partner_record
+            if partner_record is None:
+                partner_record = await partner if isinstance(partner, asyncio.Future) else partner
+                if not partner_record:
+                    raise _NotAPartner(phone_number)
+            return partner_record
+
+        async def open_partner_blob():
+            # Awaited by the pipeline once the download is under way; the hash
+            # check is a cache hit when it already ran up front
+            nonlocal storage_path, blob
+            partner_doc_id = (await resolve_partner())["doc_id"]
+            existing = await find_photo_by_hash(partner_doc_id, sha256)
+            if existing:
+                raise _AlreadyUploaded(existing)
+            # Create the storage path using the partner document ID
+            storage_path = f"partners/{partner_doc_id}/{filename}"
+            blob = bucket.blob(storage_path)
+            return blob
+
+        duplicate = None
+        near_duplicate = None
+        dhash = None
+        near_mode = near_duplicate_mode()
+
+        async def commit_unless_duplicate(result: Dict) -> bool:
+            # Without a reported hash, check the one computed while streaming before finalizing;
+            # the perceptual hash is computed meanwhile
+            nonlocal duplicate, near_duplicate, dhash
+            partner_doc_id = partner_record["doc_id"]
+            if near_mode == "off":
+                duplicate = await find_photo_by_hash(partner_doc_id, result["sha256"])
+                return duplicate is None
+
+            duplicate, dhash = await asyncio.gather(
+                find_photo_by_hash(partner_doc_id, result["sha256"]),
+                perceptual_hash(result["content"]),
+                return_exceptions=True
+            )
+            if isinstance(duplicate, Exception):
+                raise duplicate
+            if duplicate is not None:
+                return False
+            if isinstance(dhash, Exception):
+                logger.error("Failed to compute perceptual hash: %s", dhash)
+                dhash = None
+                return True
+            near_duplicate = await find_near_duplicate(partner_doc_id, dhash)
+            return near_duplicate is None or near_mode != "skip"
+
+        # Stream the image from WhatsApp straight into Storage; dropped connections
+        # resume inside the pipeline, all within one deadline
+        media = None
+        make_variants = variants_enabled()
+        keep_content = make_variants or near_mode != "off"
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + MEDIA_DOWNLOAD_DEADLINE
 
-        # Upload to Firebase Storage
         try:
-            # Verify bucket exists and is accessible
-            if not bucket or not hasattr(bucket, 'blob'):
-                logger.error("Firebase Storage bucket is not properly initialized")
-                return {
-                    "status": "error",
-                    "message": "Storage system is not properly configured"
-                }
-
-            # Create the blob and upload
-            blob = bucket.blob(storage_path)
-            content_type = response.headers.get('content-type', 'image/jpeg')
+            # WhatsApp reports the media hash up front; when the partner is already
+            # known, resends skip the download entirely
+            if not isinstance(partner, asyncio.Future) or partner.done():
+                existing = await find_photo_by_hash((await resolve_partner())["doc_id"], sha256)
+                if existing:
+                    raise _AlreadyUploaded(existing)
+
+            attempt = 0
+            while True:
+                attempt += 1
+                try:
+                    logger.debug("Download attempt %d for image_id %s", attempt, image_id)
+                    # A failed attempt abandons its resumable session, so each one opens a fresh blob
+                    with timed("media_transfer", attempt=attempt, image_id=image_id) as stage:
+                        media = await stream_media_to_blob(
+                            image_url, headers, open_partner_blob,
+                            before_commit=commit_unless_duplicate, keep_content=keep_content,
+                            expected_size=file_size, expected_sha256=sha256, deadline=deadline
+                        )
+                        stage.set_attribute("size", media["size"])
+                        stage.set_attribute("resumes", media["resumes"])
+                        stage.set_attribute("committed", media["committed"])
+                    logger.info(
+                        "Streamed image %s on attempt %d, size %d bytes",
+                        image_id, attempt, media["size"], extra={"event": "image.streamed"}
+                    )
+                    break
+
+                except (MediaIntegrityError, EmptyMediaError) as e:
+                    # Bad bytes can't be resumed; start over while there is time
+                    delay = backoff_delay(attempt - 1)
+                    if loop.time() + delay >= deadline:
+                        return {
+                            "status": "error",
+                            "message": f"Failed to download image after {attempt} attempts: {str(e)}"
+                        }
+                    logger.warning("Downloaded image %s is invalid (%s), downloading again in %.2fs", image_id, e, delay)
+                    await asyncio.sleep(delay)
+
+                except (httpx.HTTPStatusError, httpx.RequestError, asyncio.TimeoutError) as e:
+                    logger.error("Failed to download image %s: %s", image_id, e)
+                    return {
+                        "status": "error",
+                        "message": f"Failed to download image: {str(e) or 'deadline exceeded'}"
+                    }
+
+                except MediaUploadError as e:
+                    logger.error("Failed to upload image to Firebase Storage: %s", e)
+
+                    # Try to provide more specific error information
+                    error_message = str(e)
+                    if "404" in error_message and "bucket" in error_message.lower():
+                        error_message = f"The specified bucket does not exist or is not accessible. Please check your Firebase configuration. Details: {error_message}"
+                    elif "403" in error_message:
+                        error_message = f"Permission denied when accessing Firebase Storage. Please check your credentials. Details: {error_message}"
+
+                    return {
+                        "status": "error",
+                        "message": f"Failed to upload image to storage: {error_message}"
+                    }
 
-            logger.info(f"Uploading image with content type: {content_type}")
-            blob.upload_from_string(
-                image_content,
-                content_type=content_type
+        except _NotAPartner:
+            logger.error("Attempted to store image for non-partner")
+            return {
+                "status": "error",
+                "message": "Phone number is not registered as a partner"
+            }
+        except _AlreadyUploaded as e:
+            logger.info(
+                "Image %s matches existing photo %s, skipping upload",
+                image_id, e.existing.get("photoId"), extra={"event": "image.duplicate"}
             )
+            return _duplicate_result(bucket, e.existing)
 
-            # Make the blob publicly accessible
-            blob.make_public()
+        partner_doc_id = partner_record["doc_id"]
+        partner_doc_ref = partner_record["doc_ref"]
 
-            # Get the public URL
-            public_url = blob.public_url
-            logger.info(f"Image uploaded successfully to {public_url}")
+        if not media["committed"] and duplicate is not None:
+            logger.info(
+                "Image %s matches existing photo %s, upload discarded",
+                image_id, duplicate.get("photoId"), extra={"event": "image.duplicate"}
+            )
+            return _duplicate_result(bucket, duplicate)
 
-        except Exception as e:
-            logger.error(f"Failed to upload image to Firebase Storage: {str(e)}")
+        if not media["committed"]:
+            distance, photo_id = near_duplicate
+            logger.info(
+                "Image %s is %d bits from existing photo %s, upload discarded",
+                image_id, distance, photo_id, extra={"event": "image.near_duplicate"}
+            )
+            existing = await run_blocking(_read_photo, db, partner_doc_id, photo_id) or {}
+            result = _duplicate_result(bucket, {"photoId": photo_id, **existing})
+            result["data"].update({"nearDuplicate": True, "distance": distance})
+            return result
 
-            # Try to provide more specific error information
-            error_message = str(e)
-            if "404" in error_message and "bucket" in error_message.lower():
-                error_message = f"The specified bucket does not exist or is not accessible. Please check your Firebase configuration. Details: {error_message}"
-            elif "403" in error_message:
-                error_message = f"Permission denied when accessing Firebase Storage. Please check your credentials. Details: {error_message}"
+        content_type = media["content_type"]
 
+        # Variants are rendered and uploaded while the original's URL is set up
+        variants_task = None
+        if make_variants:
+            variants_task = asyncio.ensure_future(_store_variants(bucket, partner_doc_id, filename, media.pop("content")))
+
+        try:
+            # See STORAGE_URL_MODE; only the legacy mode costs a request
+            url_fields = await blob_url(blob)
+            public_url = url_fields["storageUrl"]
+
+        except Exception as e:
+            logger.error("Failed to get a URL for the image in Firebase Storage: %s", e)
+            if variants_task is not None:
+                variants_task.cancel()
             return {
                 "status": "error",
-                "message": f"Failed to upload image to storage: {error_message}"
+                "message": f"Failed to upload image to storage: {str(e)}"
             }
 
-        logger.info(f"Storing image metadata in Firestore for phone_number: {phone_number}")
+        from firebase_admin.firestore import SERVER_TIMESTAMP
         # Store metadata in Firestore
         try:
             photos_collection = partner_doc_ref.collection("photos")
@@ -288,35 +637,71 @@ async def store_image_in_firestore(phone_number: str, image_url: str, image_id:
             photo_data = {
                 "imageId": image_id,
                 "caption": caption or "",
-                "uploadedAt": firestore.SERVER_TIMESTAMP,
-                "storageUrl": public_url,
+                "uploadedAt": SERVER_TIMESTAMP,
+                **url_fields,
                 "storagePath": storage_path,
                 "filename": filename,
                 "contentType": content_type,
-                "fileSize": len(image_content)
+                "fileSize": media["size"],
+                "sha256": media["sha256"]
+            }
+            if dhash is not None:
+                # Zero-padded hex; Firestore integers are signed 64-bit
+                photo_data["dhash"] = f"{dhash:016x}"
+            if near_duplicate is not None:
+                photo_data["nearDuplicateOf"], photo_data["nearDuplicateDistance"] = near_duplicate[1], near_duplicate[0]
+
+            processed = None
+            if variants_task is not None:
+                try:
+                    processed = await asyncio.wait_for(variants_task, IMAGE_VARIANT_TIMEOUT)
+                except asyncio.TimeoutError:
+                    logger.warning("Image variants for %s not ready after %ss, stored without them", image_id, IMAGE_VARIANT_TIMEOUT)
+            if processed:
+                photo_data.update(processed)
+
+            hash_record = {
+                "photoId": photo_doc.id,
+                "storageUrl": public_url,
+                "storagePath": storage_path
             }
 
-            photo_doc.set(photo_data)
+            # Write the photo and its hash index entry together; the partner is
+            # told it is saved, so wait for the commit
+            with timed("metadata_write"):
+                await (await metadata_writes.submit(
+                    (photo_doc, photo_data, False),
+                    (_photo_hash_ref(db, partner_doc_id, media["sha256"]), hash_record, False)
+                ))
+            photo_hash_cache.set((partner_doc_id, media["sha256"]), hash_record)
+            if dhash is not None:
+                _index_photo(partner_doc_id, dhash, photo_doc.id)
         except Exception as e:
-            logger.error(f"Failed to store image metadata in Firestore: {str(e)}")
+            logger.error("Failed to store image metadata in Firestore: %s", e)
             return {
                 "status": "error",
                 "message": f"Failed to store image metadata: {str(e)}"
             }
 
-        logger.info(f"Image successfully stored for phone_number: {phone_number}")
+        logger.info(
+            "Image %s stored as %s", image_id, storage_path,
+            extra={"event": "image.stored", "size": media["size"]}
+        )
+        data = {
+            "photoId": photo_doc.id,
+            "storageUrl": public_url,
+            "storagePath": storage_path
+        }
+        if near_duplicate is not None:
+            data["nearDuplicateOf"] = near_duplicate[1]
         return {
             "status": "success",
             "message": "Image uploaded successfully",
-            "data": {
-                "photoId": photo_doc.id,
-                "storageUrl": public_url,
-                "storagePath": storage_path
-            }
+            "data": data
         }
 
     except Exception as e:
-        logger.error(f"Error storing image: {str(e)}")
+        logger.error("Error storing image: %s", e)
         return {
             "status": "error",
             "message": f"Error storing image: {str(e)}"
@@ -0,0 +1,209 @@
+import os
+import logging
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+
+import httpx
+
+from whatsapp_bot.app.services.container import services
+from whatsapp_bot.app.services.tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+GRAPH_API_BASE_URL = "https://graph.facebook.com/v17.0"
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    return float(value) if value else default
+
+
+def _http2_available() -> bool:
+    """HTTP/2 needs the optional ``h2`` package (``httpx[http2]``)."""
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+# Per-request timeouts (seconds). Sends are small JSON posts; media fetches
+# may pull several megabytes from the WhatsApp CDN.
+SEND_TIMEOUT = _env_float("GRAPH_SEND_TIMEOUT", 10.0)
+MEDIA_TIMEOUT = _env_float("GRAPH_MEDIA_TIMEOUT", 60.0)
+
+
+class GraphClient:
+    """
+    App-lifetime wrapper around a pooled ``httpx.AsyncClient``.
+
+    Connections to graph.facebook.com and the media CDN are kept alive and
+    reused across webhooks, so a reply no longer pays a TCP + TLS handshake.
+    The wrapper also keeps the counters reported by ``pool_metrics``, and
+    every request carries the current trace context as ``traceparent``.
+    """
+
+    def __init__(
+        self,
+        http2: Optional[bool] = None,
+        max_connections: Optional[int] = None,
+        max_keepalive_connections: Optional[int] = None,
+        keepalive_expiry: Optional[float] = None,
+        timeout: Optional[float] = None,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        if http2 is None:
+            # Opt-in: needs httpx[http2], which is not a declared dependency
+            http2 = os.getenv("GRAPH_HTTP2", "false").lower() in ("1", "true", "yes")
+        if http2 and not _http2_available():
+            logger.warning("GRAPH_HTTP2 is enabled but 'h2' is not installed, falling back to HTTP/1.1")
+            http2 = False
+
+        self.max_connections = max_connections or _env_int("GRAPH_MAX_CONNECTIONS", 100)
+        self.limits = httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=max_keepalive_connections or _env_int("GRAPH_MAX_KEEPALIVE", 20),
+            keepalive_expiry=keepalive_expiry or _env_float("GRAPH_KEEPALIVE_EXPIRY", 30.0),
+        )
+        self.http2 = http2
+        self._client = httpx.AsyncClient(
+            http2=http2,
+            limits=self.limits,
+            timeout=timeout or SEND_TIMEOUT,
+            transport=transport,
+        )
+
+        self.requests = 0
+        self.in_flight = 0
+        # Requests started while max_connections were already in flight; httpcore
+        # does not report real pool waits, so this is an upper-bound estimate
+        self.waits_estimated = 0
+        self.errors = 0
+
+    @property
+    def is_closed(self) -> bool:
+        return self._client.is_closed
+
+    def _acquire(self):
+        self.requests += 1
+        # Every connection is probably busy, so this request likely queues in the pool
+        if self.in_flight >= self.max_connections:
+            self.waits_estimated += 1
+        self.in_flight += 1
+
+    def _release(self):
+        self.in_flight -= 1
+
+    async def request(self, method: str, url: str, headers: Optional[Dict] = None, **kwargs) -> httpx.Response:
+        self._acquire()
+        try:
+            return await self._client.request(method, url, headers=tracer.inject(headers), **kwargs)
+        except httpx.RequestError:
+            self.errors += 1
+            raise
+        finally:
+            self._release()
+
+    async def get(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("POST", url, **kwargs)
+
+    @asynccontextmanager
+    async def stream(self, method: str, url: str, headers: Optional[Dict] = None, **kwargs):
+        self._acquire()
+        try:
+            async with self._client.stream(method, url, headers=tracer.inject(headers), **kwargs) as response:
+                yield response
+        except httpx.RequestError:
+            self.errors += 1
+            raise
+        finally:
+            self._release()
+
+    def pool_metrics(self) -> Dict:
+        """
+        Snapshot of pool usage: in-use and idle connections plus request counters.
+
+        Connection counts are read from httpcore internals and are empty when
+        they are not available; ``pool_waits_estimated`` is inferred from the
+        in-flight count, not measured.
+        """
+        connections = []
+        try:
+            # httpcore does not expose pool state publicly; read it defensively.
+            connections = list(self._client._transport._pool.connections)
+        except AttributeError:
+            pass
+
+        idle = sum(1 for conn in connections if conn.is_idle())
+        return {
+            "http2": self.http2,
+            "max_connections": self.max_connections,
+            "max_keepalive_connections": self.limits.max_keepalive_connections,
+            "connections": len(connections),
+            "connections_in_use": len(connections) - idle,
+            "connections_idle": idle,
+            "requests_total": self.requests,
+            "requests_in_flight": self.in_flight,
+            "pool_waits_estimated": self.waits_estimated,
+            "request_errors": self.errors,
+        }
+
+    async def aclose(self):
+        await self._client.aclose()
+
+
+_client: Optional[GraphClient] = None
+
+
+def get_http_client() -> GraphClient:
+    """Return the shared client, creating it on first use (e.g. outside the app lifecycle)."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = GraphClient()
+    return _client
+
+
+def set_http_client(client: Optional[GraphClient]):
+    """Replace the shared client, e.g. with one on a fake transport for load tests."""
+    global _client
+    _client = client
+
+
+async def _init_http_client() -> GraphClient:
+    return get_http_client()
+
+
+async def start_http_client():
+    """Create the shared client. Called from the FastAPI startup hook."""
+    client = get_http_client()
+    logger.info(
+        "Graph API client started: http2=%s, max_connections=%s, max_keepalive=%s",
+        client.http2, client.max_connections, client.limits.max_keepalive_connections
+    )
+
+
+async def close_http_client():
+    """Close the shared client and its pooled connections. Called on shutdown."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+        logger.info("Graph API client closed")
+
+
+def get_pool_metrics() -> Dict:
+    if _client is None:
+        return {}
+    return _client.pool_metrics()
+
+
+# Closed explicitly by the shutdown hook, after the outbound queue has drained
+services.register("http", _init_http_client)
@@ -0,0 +1,182 @@
+import os
+import asyncio
+import importlib.util
+import io
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+_CONTENT_TYPES = {"WEBP": "image/webp", "AVIF": "image/avif", "JPEG": "image/jpeg"}
+
+
+def _parse_sizes(value: str) -> List[int]:
+    return sorted({int(size) for size in value.split(",") if size.strip()})
+
+
+# Width of each thumbnail; the full-size variant is capped at IMAGE_MAX_DIMENSION
+IMAGE_THUMBNAIL_SIZES = _parse_sizes(os.getenv("IMAGE_THUMBNAIL_SIZES", "320,800"))
+IMAGE_MAX_DIMENSION = int(os.getenv("IMAGE_MAX_DIMENSION", "2048"))
+IMAGE_VARIANT_QUALITY = int(os.getenv("IMAGE_VARIANT_QUALITY", "80"))
+# How long the photo's metadata write waits for its variants before going ahead without them
+IMAGE_VARIANT_TIMEOUT = float(os.getenv("IMAGE_VARIANT_TIMEOUT", "30"))
+
+
+def variants_enabled() -> bool:
+    """Variants are opt-in (IMAGE_VARIANTS=true) and need the optional Pillow package (the ``images`` extra)."""
+    if os.getenv("IMAGE_VARIANTS", "false").lower() != "true":
+        return False
+    return importlib.util.find_spec("PIL") is not None
+
+
+def near_duplicate_mode() -> str:
+    """
+    What to do with photos perceptually close to one the partner already has
+    (PHOTO_NEAR_DUPLICATES): ``off``, ``flag`` (store it and note the match)
+    or ``skip`` (treat it like an exact duplicate). Needs Pillow (the
+    ``images`` extra).
+    """
+    mode = os.getenv("PHOTO_NEAR_DUPLICATES", "off").lower()
+    if mode not in ("flag", "skip") or importlib.util.find_spec("PIL") is None:
+        return "off"
+    return mode
+
+
+def difference_hash(content: bytes) -> int:
+    """
+    64-bit dHash of an image.
+
+    The image is shrunk to 9x8 grey pixels and each bit records whether a
+    pixel is brighter than its right-hand neighbour, so re-compression,
+    resizing and small crops change only a few bits.
+    """
+    from PIL import Image, ImageOps
+
+    with Image.open(io.BytesIO(content)) as source:
+        # JPEGs are decoded at a fraction of their size; plenty for 9x8 pixels
+        source.draft("L", (64, 64))
+        image = ImageOps.exif_transpose(source).convert("L").resize((9, 8), Image.Resampling.BOX)
+    pixels = image.tobytes()
+
+    value = 0
+    for row in range(8):
+        for column in range(8):
+            offset = row * 9 + column
+            value = (value << 1) | (pixels[offset] > pixels[offset + 1])
+    return value
+
+
+def render_variants(content: bytes, sizes: Sequence[int], max_dimension: int, image_format: str, quality: int) -> Dict:
+    """
+    Decode an image and encode its resized variants. Runs in a worker process.
+
+    The EXIF orientation is applied to the pixels and the metadata itself is
+    dropped, so variants carry no camera or location data.
+
+    Returns:
+        dict: ``width`` and ``height`` of the original, and ``variants``, a
+        list of ``name``, ``data``, ``width`` and ``height`` per variant
+    """
+    from PIL import Image, ImageOps, features
+
+    if image_format == "AVIF" and not features.check("avif"):
+        image_format = "WEBP"
+
+    with Image.open(io.BytesIO(content)) as source:
+        image = ImageOps.exif_transpose(source)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGB")
+        width, height = image.size
+
+        targets = [(f"w{size}", size) for size in sizes if size < width]
+        targets.append(("full", min(width, max_dimension)))
+
+        variants = []
+        for name, target_width in targets:
+            variant = image
+            if target_width < width:
+                target_height = max(1, round(height * target_width / width))
+                # Shrinks by whole factors first, then filters; much faster for big reductions
+                variant = image.resize((target_width, target_height), Image.Resampling.LANCZOS, reducing_gap=3.0)
+            output = io.BytesIO()
+            variant.save(output, format=image_format, quality=quality)
+            variants.append({
+                "name": name,
+                "data": output.getvalue(),
+                "width": variant.width,
+                "height": variant.height,
+            })
+
+    return {
+        "width": width,
+        "height": height,
+        "format": image_format,
+        "content_type": _CONTENT_TYPES[image_format],
+        "variants": variants,
+    }
+
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+
+def get_image_executor() -> ProcessPoolExecutor:
+    """
+    Process pool for image decoding and encoding.
+
+    Decoding, resizing and encoding a phone photo take hundreds of milliseconds of CPU,
+    so they run in separate processes (IMAGE_PROCESS_WORKERS, default half
+    the cores). Workers are spawned rather than forked, so they never
+    inherit the event loop, executor threads or open client connections.
+    """
+    global _executor
+    if _executor is None:
+        workers = int(os.getenv("IMAGE_PROCESS_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+        _executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        logger.info("Image process pool started with %s workers", workers)
+    return _executor
+
+
+async def _run_in_pool(func: Callable, *args):
+    global _executor
+    loop = asyncio.get_running_loop()
+    executor = get_image_executor()
+    try:
+        return await loop.run_in_executor(executor, func, *args)
+    except BrokenProcessPool:
+        # A worker died (e.g. killed for memory); start a fresh pool for the next image
+        if _executor is executor:
+            _executor = None
+            executor.shutdown(wait=False)
+        raise
+
+
+async def create_variants(content: bytes) -> Dict:
+    """Render the configured variants of ``content`` in the process pool."""
+    return await _run_in_pool(
+        render_variants,
+        content,
+        IMAGE_THUMBNAIL_SIZES,
+        IMAGE_MAX_DIMENSION,
+        os.getenv("IMAGE_VARIANT_FORMAT", "webp").upper(),
+        IMAGE_VARIANT_QUALITY,
+    )
+
+
+async def perceptual_hash(content: bytes) -> int:
+    """
+    dHash of ``content``. It is on the upload's critical path, so it runs in a
+    thread rather than queueing behind variant renders in the process pool;
+    Pillow releases the GIL while decoding and resizing, and the reduced-size
+    decode keeps it to a few milliseconds.
+    """
+    return await asyncio.to_thread(difference_hash, content)
+
+
+def shutdown_image_executor(wait: bool = True):
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=wait)
+        _executor = None
@@ -0,0 +1,328 @@
+import os
+import asyncio
+import base64
+import hashlib
+import logging
+import random
+from typing import Awaitable, Callable, Dict, Optional
+
+import httpx
+
+from whatsapp_bot.app.services.executor import run_blocking
+from whatsapp_bot.app.services.http_client import MEDIA_TIMEOUT, get_http_client
+from whatsapp_bot.app.services.metrics import timed
+
+logger = logging.getLogger(__name__)
+
+# Resumable uploads require chunk sizes that are a multiple of 256 KiB
+_UPLOAD_CHUNK_ALIGNMENT = 256 * 1024
+
+
+def _aligned_chunk_size(value: int) -> int:
+    return max(1, -(-value // _UPLOAD_CHUNK_ALIGNMENT)) * _UPLOAD_CHUNK_ALIGNMENT
+
+
+MEDIA_CHUNK_SIZE = _aligned_chunk_size(int(os.getenv("MEDIA_CHUNK_SIZE", str(1024 * 1024))))
+# How many downloaded chunks may wait for the uploader before the download is paused
+MEDIA_PIPELINE_DEPTH = int(os.getenv("MEDIA_PIPELINE_DEPTH", "2"))
+# Total time a download may take, retries included
+MEDIA_DOWNLOAD_DEADLINE = float(os.getenv("MEDIA_DOWNLOAD_DEADLINE", "120"))
+MEDIA_RETRY_BACKOFF = float(os.getenv("MEDIA_RETRY_BACKOFF", "0.5"))
+MEDIA_RETRY_MAX_BACKOFF = float(os.getenv("MEDIA_RETRY_MAX_BACKOFF", "8"))
+
+_RETRYABLE_STATUS = {408, 425, 429, 500, 502, 503, 504}
+
+
+def backoff_delay(attempt: int) -> float:
+    """Full jitter: uniform in [0, MEDIA_RETRY_BACKOFF * 2^attempt], capped."""
+    return random.uniform(0, min(MEDIA_RETRY_MAX_BACKOFF, MEDIA_RETRY_BACKOFF * (2 ** attempt)))
+
+
+def _retryable(error: Exception) -> bool:
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code in _RETRYABLE_STATUS
+    return isinstance(error, httpx.RequestError)
+
+
+def reported_size(value) -> Optional[int]:
+    """A media size as reported by the Graph API (int or numeric string); None when missing or unusable."""
+    try:
+        size = int(value)
+    except (TypeError, ValueError):
+        return None
+    return size if size > 0 else None
+
+
+def _hash_matches(digest, reported: str) -> bool:
+    # The media API reports hex; webhook payloads carry base64
+    raw = digest.digest()
+    return reported.lower() == raw.hex() or reported == base64.b64encode(raw).decode("ascii")
+
+
+class EmptyMediaError(Exception):
+    """The CDN answered with no content."""
+
+
+class MediaUploadError(Exception):
+    """Writing to Firebase Storage failed."""
+
+
+class MediaIntegrityError(Exception):
+    """The downloaded media does not match the size or hash WhatsApp reported."""
+
+
+class _Uploader:
+    """
+    Feeds queued chunks into a blob writer on the Firebase executor.
+
+    The writer is opened by the uploader itself, so the download can start
+    filling the queue while the blob (and whatever decides its path) is
+    still being resolved.
+    """
+
+    def __init__(self, open_writer: Callable[[], Awaitable], queue: asyncio.Queue):
+        self.open_writer = open_writer
+        self.writer = None
+        self.queue = queue
+        self.error: Optional[BaseException] = None
+
+    async def run(self):
+        try:
+            self.writer = await self.open_writer()
+        except Exception as e:
+            self.error = e
+
+        while True:
+            chunk = await self.queue.get()
+            if chunk is None:
+                return
+            if self.error is not None:
+                # Keep draining so the producer never blocks on a dead consumer
+                continue
+            try:
+                with timed("storage_write"):
+                    await run_blocking(self.writer.write, chunk)
+            except Exception as e:
+                self.error = MediaUploadError(str(e))
+                self.error.__cause__ = e
+
+
+class _Download:
+    """
+    Bytes received so far, and the range requests that fetch the rest.
+
+    Each ``fetch`` asks for ``Range: bytes=<received>-``, so a retry picks
+    up where the previous connection dropped instead of starting over. A
+    CDN that ignores the header answers 200 with the whole file; the part
+    already received is then skipped.
+    """
+
+    def __init__(self, url: str, headers: Dict, chunk_size: int, keep_content: bool):
+        self.url = url
+        self.headers = headers
+        self.chunk_size = chunk_size
+        self.digest = hashlib.sha256()
+        self.size = 0
+        self.chunks = [] if keep_content else None
+        self.content_type: Optional[str] = None
+        self.resumes = 0
+
+    async def fetch(self, start_upload: Callable[[str], "_Uploader"], expected_size: Optional[int]):
+        headers = dict(self.headers)
+        if self.size:
+            headers["Range"] = f"bytes={self.size}-"
+            self.resumes += 1
+
+        client = get_http_client()
+        async with client.stream("GET", self.url, headers=headers, timeout=MEDIA_TIMEOUT, follow_redirects=True) as response:
+            if self.size and response.status_code == 416 and self.size == expected_size:
+                # The previous attempt got every byte and failed on the way out
+                return
+            response.raise_for_status()
+
+            skip = 0
+            if self.size:
+                skip = self.size
+                content_range = response.headers.get("content-range", "")
+                if response.status_code == 206 and content_range.startswith("bytes "):
+                    first = int(content_range[len("bytes "):].split("-", 1)[0])
+                    if first > self.size:
+                        raise MediaIntegrityError(f"CDN resumed at byte {first}, expected {self.size}")
+                    skip = self.size - first
+                uploader = start_upload(self.content_type)
+            else:
+                content_length = response.headers.get("content-length")
+                if content_length and int(content_length) == 0:
+                    raise EmptyMediaError("Media has zero content length")
+                self.content_type = response.headers.get("content-type")
+                uploader = start_upload(self.content_type)
+
+            # Chunks are assembled here rather than by aiter_bytes(chunk_size), which
+            # would lose a partly filled chunk when the connection drops
+            buffered = bytearray()
+            try:
+                async for data in response.aiter_bytes():
+                    if uploader.error is not None:
+                        return
+                    if skip:
+                        if len(data) <= skip:
+                            skip -= len(data)
+                            continue
+                        data, skip = data[skip:], 0
+                    buffered += data
+                    if len(buffered) >= self.chunk_size:
+                        await self._emit(uploader, bytes(buffered))
+                        buffered.clear()
+            except httpx.RequestError:
+                # Keep what arrived before the drop; the retry resumes after it
+                if buffered:
+                    await self._emit(uploader, bytes(buffered))
+                raise
+            if buffered:
+                await self._emit(uploader, bytes(buffered))
+
+    async def _emit(self, uploader: "_Uploader", chunk: bytes):
+        self.digest.update(chunk)
+        self.size += len(chunk)
+        if self.chunks is not None:
+            self.chunks.append(chunk)
+        await uploader.queue.put(chunk)
+
+
+async def stream_media_to_blob(
+    url: str,
+    headers: Dict,
+    blob,
+    chunk_size: Optional[int] = None,
+    default_content_type: str = "image/jpeg",
+    before_commit: Optional[Callable[[Dict], Awaitable[bool]]] = None,
+    keep_content: bool = False,
+    expected_size: Optional[int] = None,
+    expected_sha256: Optional[str] = None,
+    deadline: Optional[float] = None,
+) -> Dict:
+    """
+    Stream a media file from the WhatsApp CDN into a Storage blob.
+
+    Chunks are pulled with ``client.stream`` and pushed through a small bounded
+    queue into a resumable upload, so the upload starts with the first chunk
+    and memory per transfer stays around ``(MEDIA_PIPELINE_DEPTH + 1) *
+    chunk_size`` whatever the file size. Size and SHA-256 are computed on the fly.
+
+    A dropped connection, timeout or retryable status is retried after a
+    jittered exponential backoff, resuming from the last byte received into
+    the same upload session, until ``deadline`` (event loop time; defaults
+    to MEDIA_DOWNLOAD_DEADLINE seconds from now). The result is checked
+    against ``expected_size`` and ``expected_sha256`` as reported by the
+    media API, when given, before anything is committed. A size that is not a
+    positive integer (or numeric string) is treated as unknown.
+
+    ``blob`` may also be an async callable returning the blob. It is awaited
+    once the download has started, so whatever it waits on (the partner
+    lookup, a duplicate check) overlaps with the first chunks arriving.
+    Anything it raises aborts the download and is re-raised unchanged.
+
+    With ``keep_content`` the downloaded bytes are also kept and returned as
+    ``content``, for processing after the upload; memory then grows with
+    the file size.
+
+    ``before_commit`` is awaited with the result once every byte has been
+    received, before the upload is finalized. If it returns False the upload
+    session is abandoned and no object is created.
+
+    Returns:
+        dict: ``size``, ``sha256`` and ``content_type`` of the media,
+        ``resumes`` (range requests needed) and ``committed`` telling
+        whether the object was written
+
+    Raises:
+        httpx.HTTPStatusError, httpx.RequestError: the download failed and
+            could not be retried in time
+        asyncio.TimeoutError: the deadline passed mid-download
+        EmptyMediaError: the download had no content
+        MediaIntegrityError: size or hash differ from the reported ones
+        MediaUploadError: the upload failed
+    """
+    chunk_size = _aligned_chunk_size(chunk_size) if chunk_size else MEDIA_CHUNK_SIZE
+    expected_size = reported_size(expected_size)
+    loop = asyncio.get_running_loop()
+    if deadline is None:
+        deadline = loop.time() + MEDIA_DOWNLOAD_DEADLINE
+    download = _Download(url, headers, chunk_size, keep_content)
+    uploader: Optional[_Uploader] = None
+    upload_task: Optional[asyncio.Task] = None
+
+    def start_upload(content_type: Optional[str]) -> _Uploader:
+        nonlocal uploader, upload_task
+        if uploader is None:
+            async def open_writer():
+                target = await blob() if callable(blob) else blob
+                try:
+                    return await run_blocking(
+                        target.open, "wb", chunk_size=chunk_size, content_type=content_type or default_content_type
+                    )
+                except Exception as e:
+                    raise MediaUploadError(str(e)) from e
+
+            uploader = _Uploader(open_writer, asyncio.Queue(maxsize=MEDIA_PIPELINE_DEPTH))
+            upload_task = asyncio.create_task(uploader.run())
+        return uploader
+
+    try:
+        attempt = 0
+        while True:
+            try:
+                await asyncio.wait_for(download.fetch(start_upload, expected_size), max(0.0, deadline - loop.time()))
+                break
+            except (httpx.HTTPStatusError, httpx.RequestError) as e:
+                if not _retryable(e) or (uploader is not None and uploader.error is not None):
+                    raise
+                delay = backoff_delay(attempt)
+                if loop.time() + delay >= deadline:
+                    raise
+                logger.warning(
+                    "Media download failed after %d bytes (%s), resuming in %.2fs", download.size, e, delay,
+                    extra={"event": "media.retry"}
+                )
+                attempt += 1
+                await asyncio.sleep(delay)
+
+        if uploader is not None:
+            await uploader.queue.put(None)
+            await upload_task
+    except BaseException:
+        # Abandon the resumable session; nothing is committed until close()
+        if upload_task is not None:
+            upload_task.cancel()
+        raise
+
+    if uploader is not None and uploader.error is not None:
+        raise uploader.error
+    if download.size == 0:
+        raise EmptyMediaError("Media has no content")
+    if expected_size and download.size != expected_size:
+        raise MediaIntegrityError(f"Received {download.size} bytes, expected {expected_size}")
+    if expected_sha256 and not _hash_matches(download.digest, expected_sha256):
+        raise MediaIntegrityError("Content hash does not match the reported sha256")
+
+    result = {
+        "size": download.size,
+        "sha256": download.digest.hexdigest(),
+        "content_type": download.content_type or default_content_type,
+        "resumes": download.resumes,
+        "committed": False,
+    }
+    if download.chunks is not None:
+        result["content"] = b"".join(download.chunks)
+    if before_commit is not None and not await before_commit(result):
+        return result
+
+    try:
+        # Sends the final chunk and commits the object
+        with timed("storage_commit"):
+            await run_blocking(uploader.writer.close)
+    except Exception as e:
+        raise MediaUploadError(str(e)) from e
+
+    result["committed"] = True
+    return result
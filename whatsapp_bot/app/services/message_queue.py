@@ -0,0 +1,128 @@
+import os
+import asyncio
+import contextvars
+import logging
+import zlib
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class MessageWorkerPool:
+    """
+    Bounded pool of asyncio workers that drains inbound webhook messages.
+
+    Each worker owns its own queue and every key (the sender's phone number)
+    is always routed to the same worker, so messages from one partner are
+    processed strictly in arrival order while different partners run
+    concurrently. Queues are bounded: when a shard is full, ``submit`` waits
+    up to ``enqueue_timeout`` seconds and then reports the item as rejected
+    so the caller can push back on Meta instead of buffering without limit.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[Any], Awaitable[Any]],
+        workers: Optional[int] = None,
+        queue_size: Optional[int] = None,
+        enqueue_timeout: Optional[float] = None,
+    ):
+        self.handler = handler
+        self.workers = workers or int(os.getenv("WEBHOOK_WORKERS", "8"))
+        self.queue_size = queue_size or int(os.getenv("WEBHOOK_QUEUE_SIZE", "100"))
+        self.enqueue_timeout = (
+            enqueue_timeout if enqueue_timeout is not None
+            else float(os.getenv("WEBHOOK_ENQUEUE_TIMEOUT", "0.5"))
+        )
+        self._queues: List[asyncio.Queue] = []
+        self._tasks: List[asyncio.Task] = []
+
+        self.accepted = 0
+        self.rejected = 0
+        self.processed = 0
+        self.failed = 0
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    async def start(self):
+        if self.running:
+            return
+        self._queues = [asyncio.Queue(maxsize=self.queue_size) for _ in range(self.workers)]
+        self._tasks = [
+            asyncio.create_task(self._worker(index, queue))
+            for index, queue in enumerate(self._queues)
+        ]
+        logger.info("Started %s webhook workers (queue size %s per worker)", self.workers, self.queue_size)
+
+    async def stop(self, drain: bool = True, timeout: float = 30.0):
+        """Stop the workers, optionally waiting for queued messages to finish first."""
+        if not self.running:
+            return
+        if drain:
+            try:
+                await asyncio.wait_for(
+                    asyncio.gather(*(queue.join() for queue in self._queues)),
+                    timeout
+                )
+            except asyncio.TimeoutError:
+                logger.warning("Webhook queue did not drain within %ss, %s messages dropped", timeout, self.depth())
+
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queues = []
+        logger.info("Webhook workers stopped")
+
+    def _shard(self, key: str) -> asyncio.Queue:
+        return self._queues[zlib.crc32(key.encode("utf-8")) % self.workers]
+
+    async def submit(self, key: str, item: Any) -> bool:
+        """Queue ``item`` behind earlier items with the same ``key``. Returns False if rejected."""
+        if not self.running:
+            await self.start()
+
+        queue = self._shard(key)
+        # The submitter's context (e.g. the webhook's trace span) travels with the item
+        entry = (item, contextvars.copy_context())
+        try:
+            if self.enqueue_timeout <= 0:
+                queue.put_nowait(entry)
+            else:
+                await asyncio.wait_for(queue.put(entry), self.enqueue_timeout)
+        except (asyncio.QueueFull, asyncio.TimeoutError):
+            self.rejected += 1
+            logger.warning("Webhook queue full, rejecting message for %s", key)
+            return False
+
+        self.accepted += 1
+        return True
+
+    async def _worker(self, index: int, queue: asyncio.Queue):
+        while True:
+            item, context = await queue.get()
+            try:
+                await asyncio.create_task(self.handler(item), context=context)
+                self.processed += 1
+            except Exception as e:
+                self.failed += 1
+                logger.error("Webhook worker %s failed to process message: %s", index, e)
+            finally:
+                queue.task_done()
+
+    def depth(self) -> int:
+        return sum(queue.qsize() for queue in self._queues)
+
+    def stats(self) -> Dict:
+        return {
+            "running": self.running,
+            "workers": self.workers,
+            "queue_size": self.queue_size,
+            "queue_depth": self.depth(),
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "processed": self.processed,
+            "failed": self.failed,
+        }
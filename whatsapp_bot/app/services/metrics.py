@@ -0,0 +1,221 @@
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from whatsapp_bot.app.services.tracing import tracer
+
+# Seconds; spans a cached lookup up to a slow media upload
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Returns the current value for each label-value tuple
+Callback = Callable[[], Dict[Tuple[str, ...], float]]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic counter with optional labels, e.g. ``MESSAGES.inc("text")``."""
+
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labelvalues: str, amount: float = 1):
+        self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def value(self, *labelvalues: str) -> float:
+        return self._values.get(labelvalues, 0)
+
+    def render(self) -> Iterable[str]:
+        for labelvalues, value in self._values.items():
+            yield f"{self.name}{_labels(self.labelnames, labelvalues)} {_number(value)}"
+
+
+class _HistogramState:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self, buckets: int):
+        # One slot per bucket plus the +Inf overflow; made cumulative on render
+        self.counts = [0] * (buckets + 1)
+        self.sum = 0.0
+        self.count = 0
+
+
+class Histogram:
+    """Fixed-bucket histogram with optional labels, e.g. ``STAGE_SECONDS.observe(0.2, "partner_query")``."""
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._states: Dict[Tuple[str, ...], _HistogramState] = {}
+
+    def observe(self, value: float, *labelvalues: str):
+        state = self._states.get(labelvalues)
+        if state is None:
+            state = self._states[labelvalues] = _HistogramState(len(self.buckets))
+        state.counts[bisect_left(self.buckets, value)] += 1
+        state.sum += value
+        state.count += 1
+
+    def label_values(self) -> List[Tuple[str, ...]]:
+        return list(self._states)
+
+    def snapshot(self, *labelvalues: str) -> Dict:
+        state = self._states.get(labelvalues)
+        if state is None:
+            return {"count": 0, "sum": 0.0}
+        return {"count": state.count, "sum": state.sum}
+
+    def render(self) -> Iterable[str]:
+        for labelvalues, state in self._states.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), state.counts):
+                cumulative += count
+                le = f'le="{_number(bound)}"'
+                yield f"{self.name}_bucket{_labels(self.labelnames, labelvalues, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labelnames, labelvalues)} {_number(state.sum)}"
+            yield f"{self.name}_count{_labels(self.labelnames, labelvalues)} {state.count}"
+
+
+class _CallbackMetric:
+    """Counter or gauge read from existing subsystem stats at scrape time."""
+
+    def __init__(self, name: str, documentation: str, type_: str, labelnames: Sequence[str], callback: Callback):
+        self.name = name
+        self.documentation = documentation
+        self.type = type_
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+
+    def render(self) -> Iterable[str]:
+        for labelvalues, value in self.callback().items():
+            yield f"{self.name}{_labels(self.labelnames, labelvalues)} {_number(value)}"
+
+
+class MetricsRegistry:
+    """
+    In-process metrics in the Prometheus text exposition format.
+
+    Recording is a dict lookup and an integer add on the event loop thread,
+    cheap enough to leave on in production. Values the subsystems already
+    count (cache hits, queue depths) are not recorded twice; they are read
+    through callbacks when ``/metrics`` is scraped.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+
+    def _register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def callback(self, name: str, documentation: str, type_: str, labelnames: Sequence[str], callback: Callback):
+        return self._register(_CallbackMetric(name, documentation, type_, labelnames, callback))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {_escape(metric.documentation)}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+MESSAGES = registry.counter("whatsapp_messages_total", "Inbound messages by type", ("type",))
+WEBHOOKS = registry.counter("whatsapp_webhook_deliveries_total", "Webhook deliveries by outcome", ("status",))
+STAGE_SECONDS = registry.histogram("whatsapp_stage_duration_seconds", "Time spent per processing stage", ("stage",))
+STAGE_ERRORS = registry.counter("whatsapp_stage_errors_total", "Stages that raised", ("stage",))
+
+
+class timed:
+    """
+    Time a stage into ``STAGE_SECONDS``; an exception escaping the block also
+    counts towards ``STAGE_ERRORS``. When tracing is enabled the stage is a
+    span too, current for the block, so nested stages become its children.
+    Works in sync and async code alike::
+
+        with timed("media_transfer", attempt=2) as stage:
+            media = await ...
+            stage.set_attribute("size", media["size"])
+    """
+
+    __slots__ = ("stage", "attributes", "started", "span", "_token")
+
+    def __init__(self, stage: str, **attributes):
+        self.stage = stage
+        self.attributes = attributes
+        self.started: Optional[float] = None
+        self.span = None
+        self._token = None
+
+    def __enter__(self):
+        if tracer.enabled:
+            self.span = tracer.start_span(self.stage, self.attributes)
+            self._token = tracer.activate(self.span)
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        STAGE_SECONDS.observe(time.perf_counter() - self.started, self.stage)
+        if exc_type is not None and issubclass(exc_type, Exception):
+            STAGE_ERRORS.inc(self.stage)
+        if self.span is not None:
+            tracer.deactivate(self._token)
+            if exc is not None:
+                self.span.record_exception(exc)
+            self.span.end()
+        return False
+
+    def set_attribute(self, key: str, value):
+        if self.span is not None:
+            self.span.set_attribute(key, value)
+
+
+def record_error(stage: str):
+    """Count a stage failure that was handled without raising (e.g. an error dict)."""
+    STAGE_ERRORS.inc(stage)
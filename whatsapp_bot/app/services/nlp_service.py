@@ -1,12 +1,48 @@
+import os
+import asyncio
+import hashlib
+import logging
+import time
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional
 
+from whatsapp_bot.app.services.cache import TTLCache
+from whatsapp_bot.app.services.metrics import STAGE_SECONDS, record_error, timed
+from whatsapp_bot.app.services.tracing import tracer
+from whatsapp_bot.app.services.reply_cache import ReplyCache, create_reply_cache, normalize_text
 
+logger = logging.getLogger(__name__)
 
+# Called with the current summary and the turns being dropped; returns the new summary
+Summarizer = Callable[[str, List[Dict]], Awaitable[str]]
 
 
-import google.generativeai as genai
+class FallbackReply(str):
+    """Fixed text sent in place of a reply the model failed to produce."""
+
+
+FALLBACK_REPLY = FallbackReply("Sorry, I couldn't answer that right now. Please try again in a moment.")
+
+
+def _estimate_tokens(text: str) -> int:
+    # Rough heuristic (~4 characters per token); good enough for budgeting
+    return len(text) // 4 + 1
+
 
 class DealerAgent:
-    def __init__(self, api_key: str):
+    def __init__(
+        self,
+        api_key: str,
+        max_turns: Optional[int] = None,
+        max_history_tokens: Optional[int] = None,
+        max_conversations: Optional[int] = None,
+        conversation_ttl: Optional[float] = None,
+        summarizer: Optional[Summarizer] = None,
+        reply_cache: Optional[ReplyCache] = None,
+        cache_context: Optional[int] = None,
+    ):
+        # The SDK is heavy to import, so it is only loaded when an agent is built
+        import google.generativeai as genai
+
         genai.configure(api_key=api_key)
         self.model = genai.GenerativeModel('gemini-pro')
         self.context = {
@@ -26,9 +62,19 @@ class DealerAgent:
                 ]
             }
         }
-        self.conversation = self.model.start_chat(history=[
-            {"role": "user", "parts": [self._create_system_prompt()]}
-        ])
+        self.system_prompt = self._create_system_prompt()
+
+        # History window per conversation: at most max_turns exchanges and max_history_tokens
+        self.max_turns = max_turns or int(os.getenv("AGENT_HISTORY_TURNS", "10"))
+        self.max_history_tokens = max_history_tokens or int(os.getenv("AGENT_HISTORY_TOKENS", "2000"))
+        self.summarizer = summarizer
+        self.conversations = TTLCache(
+            max_size=max_conversations or int(os.getenv("AGENT_MAX_CONVERSATIONS", "5000")),
+            ttl=conversation_ttl or float(os.getenv("AGENT_CONVERSATION_TTL", "86400"))
+        )
+        self.reply_cache = reply_cache if reply_cache is not None else create_reply_cache()
+        # Exchanges of recent history a cached reply must match
+        self.cache_context = cache_context if cache_context is not None else int(os.getenv("AGENT_REPLY_CACHE_CONTEXT", "1"))
 
     def _create_system_prompt(self) -> str:
         return f"""
@@ -41,9 +87,173 @@ class DealerAgent:
         3. Guide through categories before showing specific products.
         """
 
-    async def process_message(self, message: str) -> str:
+    def _conversation(self, phone_number: str) -> Dict:
+        conversation = self.conversations.get(phone_number)
+        if conversation is None:
+            # "unsummarized": dropped turns not yet folded into the summary by "summarizing"
+            conversation = {"summary": "", "turns": [], "unsummarized": [], "summarizing": None}
+        # Re-set on every use so the idle TTL restarts
+        self.conversations.set(phone_number, conversation)
+        return conversation
+
+    def _build_history(self, conversation: Dict) -> List[Dict]:
+        history = [
+            {"role": "user", "parts": [self.system_prompt]},
+            {"role": "model", "parts": ["Understood."]}
+        ]
+        if conversation["summary"]:
+            history.append({"role": "user", "parts": [f"Summary of our earlier conversation: {conversation['summary']}"]})
+            history.append({"role": "model", "parts": ["Noted."]})
+        return history + conversation["turns"]
+
+    async def _truncate(self, conversation: Dict):
+        """
+        Keep the sliding window within the turn and token budgets.
+
+        What falls out is summarized in the background, so the reply is not
+        held up by a second model call; until that finishes, the next message
+        sees the previous summary.
+        """
+        turns = conversation["turns"]
+        dropped = []
+        while turns and (
+            len(turns) > self.max_turns * 2
+            or sum(_estimate_tokens(turn["parts"][0]) for turn in turns) > self.max_history_tokens
+        ):
+            # Drop whole exchanges so the history keeps alternating user/model
+            dropped.extend(turns[:2])
+            del turns[:2]
+
+        if dropped and self.summarizer is not None:
+            conversation["unsummarized"].extend(dropped)
+            if conversation["summarizing"] is None:
+                conversation["summarizing"] = asyncio.create_task(self._summarize(conversation))
+
+    async def _summarize(self, conversation: Dict):
+        """Fold dropped turns into the summary, one summarizer call at a time per conversation."""
+        try:
+            while conversation["unsummarized"]:
+                dropped, conversation["unsummarized"] = conversation["unsummarized"], []
+                try:
+                    conversation["summary"] = await self.summarizer(conversation["summary"], dropped)
+                except Exception as e:
+                    # The summary stays as it was; those turns are forgotten
+                    logger.warning("Conversation summary failed: %s", e, extra={"event": "llm.error"})
+        finally:
+            conversation["summarizing"] = None
+
+    async def summarize(self, summary: str, dropped: List[Dict]) -> str:
+        """Summarization hook backed by the model itself; ``create_agent`` installs it unless AGENT_SUMMARIZE=false."""
+        transcript = "\n".join(f"{turn['role']}: {turn['parts'][0]}" for turn in dropped)
+        prompt = (
+            "Update this summary of a conversation between an AMD dealer assistant and a partner. "
+            "Keep names, products, order numbers and open requests. Reply with the summary only.\n\n"
+            f"Current summary: {summary or '(none)'}\n\nNew messages:\n{transcript}"
+        )
+        with timed("llm_summarize"):
+            response = await self.model.generate_content_async(prompt)
+        return response.text
+
+    def _fingerprint(self, conversation: Dict) -> str:
+        """
+        Conversation state a cached reply must match: the system prompt and
+        the last ``cache_context`` exchanges, normalized like the message
+        itself. Older turns and the summary are left out, so partners whose
+        conversations differ only further back still share replies, while a
+        follow-up ("when will it arrive") is only reused after the same
+        previous exchange.
+        """
+        digest = hashlib.sha1(self.system_prompt.encode("utf-8"))
+        recent = conversation["turns"][-2 * self.cache_context:] if self.cache_context > 0 else []
+        for turn in recent:
+            digest.update(f"\x00{turn['role']}\x00{normalize_text(turn['parts'][0])}".encode("utf-8"))
+        return digest.hexdigest()
+
+    def reset_conversation(self, phone_number: str):
+        self.conversations.pop(phone_number)
+
+    async def process_message(self, phone_number: str, message: str) -> str:
         try:
-            response = await self.conversation.send_message_async(message)
-            return response.text
+            conversation = self._conversation(phone_number)
+            fingerprint = self._fingerprint(conversation)
+
+            reply = self.reply_cache.get(message, fingerprint) if self.reply_cache else None
+            if reply is None:
+                started = time.monotonic()
+                with timed("llm_reply"):
+                    chat = self.model.start_chat(history=self._build_history(conversation))
+                    response = await chat.send_message_async(message)
+                    reply = response.text
+                if self.reply_cache:
+                    self.reply_cache.put(message, fingerprint, reply, latency=time.monotonic() - started)
+
+            conversation["turns"].append({"role": "user", "parts": [message]})
+            conversation["turns"].append({"role": "model", "parts": [reply]})
+            await self._truncate(conversation)
+            return reply
         except Exception as e:
-            return f"Error processing message: {str(e)}"
\ No newline at end of file
+            logger.error("Model reply failed: %s", e, extra={"event": "llm.error"})
+            return FALLBACK_REPLY
+
+    async def stream_message(self, phone_number: str, message: str) -> AsyncIterator[str]:
+        """
+        Like ``process_message``, but yields the reply text as the model streams it.
+
+        Cached replies are yielded in one piece. The exchange is recorded in the
+        conversation (and the reply cache) once the stream has finished. If the
+        model fails, ``FALLBACK_REPLY`` is yielded last and nothing is recorded.
+        """
+        conversation = self._conversation(phone_number)
+        fingerprint = self._fingerprint(conversation)
+
+        reply = self.reply_cache.get(message, fingerprint) if self.reply_cache else None
+        if reply is not None:
+            yield reply
+        else:
+            started = time.monotonic()
+            parts = []
+            # Not made current: the caller's sends between chunks are not part of the model call
+            span = tracer.start_span("llm_stream")
+            try:
+                chat = self.model.start_chat(history=self._build_history(conversation))
+                response = await chat.send_message_async(message, stream=True)
+                async for chunk in response:
+                    if chunk.text:
+                        if not parts:
+                            STAGE_SECONDS.observe(time.monotonic() - started, "llm_first_token")
+                            span.add_event("first_token")
+                        parts.append(chunk.text)
+                        yield chunk.text
+            except Exception as e:
+                logger.error("Model stream failed after %d chunks: %s", len(parts), e, extra={"event": "llm.error"})
+                STAGE_SECONDS.observe(time.monotonic() - started, "llm_stream")
+                record_error("llm_stream")
+                span.set_attribute("chunks", len(parts))
+                span.record_exception(e)
+                span.end()
+                # Raw SDK errors are not for partners
+                yield FALLBACK_REPLY if not parts else FallbackReply(f"\n\n{FALLBACK_REPLY}")
+                return
+
+            STAGE_SECONDS.observe(time.monotonic() - started, "llm_stream")
+            span.set_attribute("chunks", len(parts))
+            span.end()
+            reply = "".join(parts)
+            if self.reply_cache:
+                self.reply_cache.put(message, fingerprint, reply, latency=time.monotonic() - started)
+
+        conversation["turns"].append({"role": "user", "parts": [message]})
+        conversation["turns"].append({"role": "model", "parts": [reply]})
+        await self._truncate(conversation)
+
+
+async def create_agent() -> DealerAgent:
+    """Service container factory for the shared agent."""
+    api_key = os.getenv("GEMINI_API_KEY")
+    if not api_key:
+        raise ValueError("GEMINI_API_KEY is not set")
+    # Importing the SDK takes most of a second; keep it off the event loop
+    agent = await asyncio.to_thread(DealerAgent, api_key=api_key)
+    if os.getenv("AGENT_SUMMARIZE", "true").lower() in ("1", "true", "yes"):
+        agent.summarizer = agent.summarize
+    return agent
@@ -0,0 +1,62 @@
+from typing import Dict, Hashable, List, Optional, Tuple
+
+HASH_BITS = 64
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+class HammingIndex:
+    """
+    Finds 64-bit perceptual hashes within ``max_distance`` bits of a query.
+
+    Multi-index hashing: each hash is cut into ``max_distance + 1`` chunks
+    and filed under every chunk's value. Two hashes that differ in at most
+    ``max_distance`` bits must agree exactly on at least one chunk, so a
+    query only compares itself against entries sharing a chunk with it,
+    a small fraction of the index, instead of scanning every photo.
+    """
+
+    def __init__(self, max_distance: int):
+        self.max_distance = max_distance
+        chunks = min(HASH_BITS, max_distance + 1)
+        # (shift, mask) per chunk; chunk sizes differ by at most one bit
+        self._chunks: List[Tuple[int, int]] = []
+        start = 0
+        for index in range(chunks):
+            width = HASH_BITS // chunks + (1 if index < HASH_BITS % chunks else 0)
+            self._chunks.append((start, (1 << width) - 1))
+            start += width
+        self._tables: List[Dict[int, List[int]]] = [{} for _ in self._chunks]
+        self._hashes: List[int] = []
+        self._items: List[Hashable] = []
+
+    def __len__(self) -> int:
+        return len(self._hashes)
+
+    def add(self, value: int, item: Hashable):
+        position = len(self._hashes)
+        self._hashes.append(value)
+        self._items.append(item)
+        for table, (shift, mask) in zip(self._tables, self._chunks):
+            table.setdefault((value >> shift) & mask, []).append(position)
+
+    def search(self, value: int) -> List[Tuple[int, Hashable]]:
+        """Every ``(distance, item)`` within ``max_distance`` of ``value``, closest first."""
+        seen = set()
+        matches = []
+        for table, (shift, mask) in zip(self._tables, self._chunks):
+            for position in table.get((value >> shift) & mask, ()):
+                if position in seen:
+                    continue
+                seen.add(position)
+                distance = (value ^ self._hashes[position]).bit_count()
+                if distance <= self.max_distance:
+                    matches.append((distance, self._items[position]))
+        matches.sort(key=lambda match: match[0])
+        return matches
+
+    def nearest(self, value: int) -> Optional[Tuple[int, Hashable]]:
+        matches = self.search(value)
+        return matches[0] if matches else None
@@ -0,0 +1,179 @@
+import os
+import math
+import re
+from collections import Counter, OrderedDict
+from typing import Dict, FrozenSet, Optional, Tuple
+
+from whatsapp_bot.app.services.cache import TTLCache
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_WHITESPACE = re.compile(r"\s+")
+_DIGITS = re.compile(r"\d")
+
+
+def normalize_text(text: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace."""
+    return _WHITESPACE.sub(" ", _PUNCTUATION.sub(" ", text.lower())).strip()
+
+
+def identifiers(normalized: str) -> FrozenSet[str]:
+    """Words containing digits: order numbers, SKUs, quantities, dates."""
+    return frozenset(word for word in normalized.split() if _DIGITS.search(word))
+
+
+class Embedder:
+    """Turns normalized text into a sparse vector for similarity lookups."""
+
+    def embed(self, text: str) -> Dict[str, float]:
+        raise NotImplementedError
+
+
+class NGramEmbedder(Embedder):
+    """
+    Character n-gram embedder. Runs fully offline and needs no model files,
+    so it doubles as the stub model for tests; a local sentence-embedding
+    model can be plugged in through the same interface.
+    """
+
+    def __init__(self, n: int = 3):
+        self.n = n
+
+    def embed(self, text: str) -> Dict[str, float]:
+        padded = f" {text} "
+        counts = Counter(padded[i:i + self.n] for i in range(max(1, len(padded) - self.n + 1)))
+        norm = math.sqrt(sum(count * count for count in counts.values())) or 1.0
+        return {gram: count / norm for gram, count in counts.items()}
+
+
+def cosine_similarity(a: Dict[str, float], b: Dict[str, float]) -> float:
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(weight * b.get(gram, 0.0) for gram, weight in a.items())
+
+
+class ReplyCache:
+    """
+    Cache of LLM replies keyed on normalized message text plus a conversation
+    state fingerprint.
+
+    The exact tier is a dict lookup. When an ``embedder`` is configured, a
+    miss falls back to the most similar cached message with the same
+    fingerprint, if it scores at least ``similarity_threshold``. Only
+    messages with exactly the same identifiers (words with digits) are
+    candidates, so "order ORD-12345" never gets the reply for "ORD-12346",
+    and at most ``max_candidates`` of the most recent ones are compared.
+    Entries expire after ``ttl`` and the least recently used are evicted
+    beyond ``max_size``.
+    """
+
+    def __init__(
+        self,
+        max_size: int = 2000,
+        ttl: float = 3600.0,
+        embedder: Optional[Embedder] = None,
+        similarity_threshold: float = 0.85,
+        max_candidates: int = 64,
+    ):
+        self.embedder = embedder
+        self.similarity_threshold = similarity_threshold
+        self.max_candidates = max_candidates
+        self._entries = TTLCache(max_size=max_size, ttl=ttl)
+        # (fingerprint, identifiers) -> OrderedDict of candidate keys, oldest first;
+        # bounded like the entries so fingerprints of finished conversations age out
+        self._candidates = TTLCache(max_size=max_size, ttl=ttl)
+
+        self.exact_hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self.model_latency_total = 0.0
+        self.model_calls = 0
+        self.latency_saved = 0.0
+
+    def _key(self, message: str, fingerprint: str) -> Tuple[str, str]:
+        return fingerprint, normalize_text(message)
+
+    def _record_hit(self):
+        # Each hit saves roughly one average model round trip
+        if self.model_calls:
+            self.latency_saved += self.model_latency_total / self.model_calls
+
+    def get(self, message: str, fingerprint: str) -> Optional[str]:
+        key = self._key(message, fingerprint)
+        entry = self._entries.get(key)
+        if entry is not None:
+            self.exact_hits += 1
+            self._record_hit()
+            return entry[0]
+
+        candidates = self._candidates.get((fingerprint, identifiers(key[1])), count=False)
+        if self.embedder is not None and key[1] and candidates:
+            vector = self.embedder.embed(key[1])
+            best_score, best_reply = 0.0, None
+            for candidate in reversed(list(candidates)):
+                entry = self._entries.get(candidate, count=False)
+                if entry is None:
+                    # Expired or evicted from the main cache
+                    del candidates[candidate]
+                    continue
+                reply, entry_vector = entry
+                score = cosine_similarity(vector, entry_vector)
+                if score > best_score:
+                    best_score, best_reply = score, reply
+            if best_reply is not None and best_score >= self.similarity_threshold:
+                self.similar_hits += 1
+                self._record_hit()
+                return best_reply
+
+        self.misses += 1
+        return None
+
+    def put(self, message: str, fingerprint: str, reply: str, latency: Optional[float] = None):
+        key = self._key(message, fingerprint)
+        vector = self.embedder.embed(key[1]) if self.embedder is not None else None
+        self._entries.set(key, (reply, vector))
+        if vector is not None:
+            bucket_key = (fingerprint, identifiers(key[1]))
+            bucket = self._candidates.get(bucket_key, count=False)
+            if bucket is None:
+                bucket = OrderedDict()
+            self._candidates.set(bucket_key, bucket)
+            bucket[key] = None
+            bucket.move_to_end(key)
+            while len(bucket) > self.max_candidates:
+                bucket.popitem(last=False)
+        if latency is not None:
+            self.model_calls += 1
+            self.model_latency_total += latency
+
+    def clear(self):
+        self._entries.clear()
+        self._candidates.clear()
+
+    def stats(self) -> Dict:
+        lookups = self.exact_hits + self.similar_hits + self.misses
+        return {
+            "size": len(self._entries),
+            "exact_hits": self.exact_hits,
+            "similar_hits": self.similar_hits,
+            "misses": self.misses,
+            "hit_rate": (self.exact_hits + self.similar_hits) / lookups if lookups else 0.0,
+            "latency_saved_seconds": self.latency_saved,
+            "model_latency_avg_seconds": self.model_latency_total / self.model_calls if self.model_calls else 0.0,
+        }
+
+
+def create_reply_cache() -> Optional[ReplyCache]:
+    """Build the reply cache configured by AGENT_REPLY_CACHE_* (None when disabled)."""
+    if os.getenv("AGENT_REPLY_CACHE", "true").lower() not in ("1", "true", "yes"):
+        return None
+
+    # Opt-in: similar is not the same question
+    threshold = float(os.getenv("AGENT_REPLY_CACHE_SIMILARITY", "0"))
+    return ReplyCache(
+        max_size=int(os.getenv("AGENT_REPLY_CACHE_SIZE", "2000")),
+        ttl=float(os.getenv("AGENT_REPLY_CACHE_TTL", "3600")),
+        # A threshold of 0 turns the similarity tier off
+        embedder=NGramEmbedder() if threshold > 0 else None,
+        similarity_threshold=threshold,
+        max_candidates=int(os.getenv("AGENT_REPLY_CACHE_CANDIDATES", "64"))
+    )
@@ -0,0 +1,321 @@
+import os
+import asyncio
+import heapq
+import itertools
+import logging
+import random
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+import httpx
+
+from whatsapp_bot.app.services.cache import TTLCache
+from whatsapp_bot.app.services.http_client import get_http_client
+
+logger = logging.getLogger(__name__)
+
+# Lower values are sent first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 10
+
+_RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+# Failures where the request never reached Meta, so resending cannot duplicate a message
+_UNSENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+class TokenBucket:
+    """
+    Token bucket in reservation form: ``reserve`` always takes a token and
+    returns how long the caller must wait before using it. Tokens may go
+    negative, so consecutive reservations are spaced ``1 / rate`` apart.
+    """
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated_at = time.monotonic()
+
+    def reserve(self) -> float:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+
+class _SendJob:
+    __slots__ = (
+        "url", "headers", "json", "content", "sender_id", "recipient", "future",
+        "priority", "sequence", "sender_reserved", "enqueued_at"
+    )
+
+    def __init__(self, url, headers, json, content, sender_id, recipient, future, priority, sequence):
+        self.url = url
+        self.headers = headers
+        self.json = json
+        self.content = content
+        self.sender_id = sender_id
+        self.recipient = recipient
+        self.future = future
+        self.priority = priority
+        self.sequence = sequence
+        self.sender_reserved = False
+        self.enqueued_at = time.monotonic()
+
+
+class OutboundScheduler:
+    """
+    Paces Graph API message sends to stay inside WhatsApp Cloud API throughput limits.
+
+    Each recipient has a FIFO queue, so their messages go out in order;
+    only its head is scheduled, at the time the recipient's token bucket
+    allows, and the next one only once the head's send (retries included)
+    has finished. Heads that are due wait in a priority queue (interactive
+    replies ahead of bulk notifications), take a token from the sender's
+    (phone-number-id) bucket, and only then a concurrency slot, so a
+    rate-limited recipient never holds a slot other recipients could use.
+    At most ``concurrency`` requests are in flight. 429 and 5xx answers, and
+    connections that failed before the request was sent, are retried with
+    jittered exponential backoff, honoring Retry-After when Meta sends it.
+    """
+
+    def __init__(
+        self,
+        concurrency: Optional[int] = None,
+        sender_rate: Optional[float] = None,
+        sender_burst: Optional[float] = None,
+        recipient_rate: Optional[float] = None,
+        recipient_burst: Optional[float] = None,
+        max_retries: Optional[int] = None,
+        base_backoff: Optional[float] = None,
+        max_backoff: Optional[float] = None,
+    ):
+        self.concurrency = concurrency or int(os.getenv("GRAPH_SEND_CONCURRENCY", "32"))
+        self.sender_rate = sender_rate or float(os.getenv("GRAPH_SENDER_RATE", "80"))
+        self.sender_burst = sender_burst or float(os.getenv("GRAPH_SENDER_BURST", "80"))
+        self.recipient_rate = recipient_rate or float(os.getenv("GRAPH_RECIPIENT_RATE", "1"))
+        self.recipient_burst = recipient_burst or float(os.getenv("GRAPH_RECIPIENT_BURST", "5"))
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv("GRAPH_SEND_MAX_RETRIES", "4"))
+        self.base_backoff = base_backoff or float(os.getenv("GRAPH_SEND_BACKOFF", "0.5"))
+        self.max_backoff = max_backoff or float(os.getenv("GRAPH_SEND_MAX_BACKOFF", "30"))
+
+        self._sender_buckets: Dict[str, TokenBucket] = {}
+        self._recipient_buckets = TTLCache(max_size=50000, ttl=600)
+        self._recipient_queues: Dict[str, Deque[_SendJob]] = {}
+        # (ready_at, sequence, job): heads waiting for a recipient or sender token
+        self._waiting: List[Tuple[float, int, _SendJob]] = []
+        # (priority, sequence, job): heads that may be sent now
+        self._ready: List[Tuple[int, int, _SendJob]] = []
+        self._queued = 0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._idle: Optional[asyncio.Event] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._inflight: set = set()
+        self._sequence = itertools.count()
+
+        self.sent = 0
+        self.failed = 0
+        self.retries = 0
+        self.latency_count = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._dispatcher is not None
+
+    async def start(self):
+        if self.running:
+            return
+        self._wakeup = asyncio.Event()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._slots = asyncio.Semaphore(self.concurrency)
+        self._dispatcher = asyncio.create_task(self._dispatch())
+        logger.info(
+            "Outbound scheduler started: concurrency=%d, sender_rate=%s/s, recipient_rate=%s/s",
+            self.concurrency, self.sender_rate, self.recipient_rate
+        )
+
+    async def stop(self, drain: bool = True, timeout: float = 30.0):
+        if not self.running:
+            return
+        if drain:
+            try:
+                await asyncio.wait_for(self._idle.wait(), timeout)
+                if self._inflight:
+                    await asyncio.wait_for(asyncio.gather(*self._inflight, return_exceptions=True), timeout)
+            except asyncio.TimeoutError:
+                logger.warning("Outbound queue did not drain within %ss", timeout)
+
+        self._dispatcher.cancel()
+        await asyncio.gather(self._dispatcher, return_exceptions=True)
+        self._dispatcher = None
+        logger.info("Outbound scheduler stopped")
+
+    async def send(
+        self,
+        url: str,
+        headers: Dict,
+        sender_id: str,
+        recipient: str,
+        json: Any = None,
+        content: Optional[bytes] = None,
+        priority: int = PRIORITY_INTERACTIVE,
+    ) -> httpx.Response:
+        """
+        Queue a message POST and wait for the Graph API response.
+
+        The returned response may still carry an error status once retries are
+        exhausted; callers check it with ``raise_for_status`` as before.
+        """
+        if not self.running:
+            # Outside the app lifecycle (scripts, tests) send directly, still with retries
+            return await self._post_with_retry(url, headers, json, content)
+
+        future = asyncio.get_running_loop().create_future()
+        job = _SendJob(url, headers, json, content, sender_id, recipient, future, priority, next(self._sequence))
+        self._queued += 1
+        self._idle.clear()
+        queue = self._recipient_queues.get(recipient)
+        if queue is None:
+            queue = self._recipient_queues[recipient] = deque()
+        queue.append(job)
+        if len(queue) == 1:
+            self._schedule_head(job)
+        return await future
+
+    def _sender_bucket(self, sender_id: str) -> TokenBucket:
+        bucket = self._sender_buckets.get(sender_id)
+        if bucket is None:
+            bucket = self._sender_buckets[sender_id] = TokenBucket(self.sender_rate, self.sender_burst)
+        return bucket
+
+    def _recipient_bucket(self, recipient: str) -> TokenBucket:
+        bucket = self._recipient_buckets.get(recipient, count=False)
+        if bucket is None:
+            bucket = TokenBucket(self.recipient_rate, self.recipient_burst)
+        # Re-set on every use so idle recipients age out
+        self._recipient_buckets.set(recipient, bucket)
+        return bucket
+
+    def _schedule_head(self, job: _SendJob):
+        """Take the recipient's token for a job that just reached the head of its queue."""
+        delay = self._recipient_bucket(job.recipient).reserve()
+        heapq.heappush(self._waiting, (time.monotonic() + delay, job.sequence, job))
+        self._wakeup.set()
+
+    def _promote(self):
+        now = time.monotonic()
+        while self._waiting and self._waiting[0][0] <= now:
+            _, sequence, job = heapq.heappop(self._waiting)
+            heapq.heappush(self._ready, (job.priority, sequence, job))
+
+    async def _dispatch(self):
+        while True:
+            self._promote()
+            if not self._ready:
+                timeout = self._waiting[0][0] - time.monotonic() if self._waiting else None
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            await self._slots.acquire()
+            # Pick after getting the slot; something more urgent may have become due meanwhile
+            self._promote()
+            _, sequence, job = heapq.heappop(self._ready)
+            if not job.sender_reserved:
+                job.sender_reserved = True
+                delay = self._sender_bucket(job.sender_id).reserve()
+                if delay > 0:
+                    self._slots.release()
+                    heapq.heappush(self._waiting, (time.monotonic() + delay, sequence, job))
+                    continue
+
+            task = asyncio.create_task(self._run(job))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _run(self, job: _SendJob):
+        try:
+            response = await self._post_with_retry(job.url, job.headers, job.json, job.content)
+            if not job.future.done():
+                job.future.set_result(response)
+        except Exception as e:
+            self.failed += 1
+            if not job.future.done():
+                job.future.set_exception(e)
+        finally:
+            latency = time.monotonic() - job.enqueued_at
+            self.latency_count += 1
+            self.latency_total += latency
+            self.latency_max = max(self.latency_max, latency)
+            self._slots.release()
+            # Only now may the recipient's next message go, so a retried send cannot be overtaken
+            queue = self._recipient_queues[job.recipient]
+            queue.popleft()
+            if queue:
+                self._schedule_head(queue[0])
+            else:
+                del self._recipient_queues[job.recipient]
+            self._queued -= 1
+            if not self._queued:
+                self._idle.set()
+
+    def _backoff(self, attempt: int, response: Optional[httpx.Response] = None) -> float:
+        if response is not None:
+            retry_after = response.headers.get("retry-after")
+            if retry_after:
+                try:
+                    return min(float(retry_after), self.max_backoff)
+                except ValueError:
+                    pass
+        # Full jitter: uniform in [0, base * 2^attempt]
+        return random.uniform(0, min(self.max_backoff, self.base_backoff * (2 ** attempt)))
+
+    async def _post_with_retry(self, url: str, headers: Dict, json: Any, content: Optional[bytes]) -> httpx.Response:
+        client = get_http_client()
+        attempt = 0
+        while True:
+            try:
+                response = await client.post(url, headers=headers, json=json, content=content)
+            except httpx.RequestError as e:
+                # Anything past connecting may have delivered the message already
+                if not isinstance(e, _UNSENT_ERRORS) or attempt >= self.max_retries:
+                    raise
+                delay = self._backoff(attempt)
+                logger.warning("Graph API send failed (%s), retrying in %.2fs", e, delay)
+            else:
+                if response.status_code not in _RETRYABLE_STATUS or attempt >= self.max_retries:
+                    if response.is_success:
+                        self.sent += 1
+                    else:
+                        self.failed += 1
+                    return response
+                delay = self._backoff(attempt, response)
+                logger.warning("Graph API returned %d, retrying in %.2fs", response.status_code, delay)
+
+            attempt += 1
+            self.retries += 1
+            await asyncio.sleep(delay)
+
+    def stats(self) -> Dict:
+        return {
+            "running": self.running,
+            "queue_depth": self._queued - len(self._inflight),
+            "in_flight": len(self._inflight),
+            "sent": self.sent,
+            "failed": self.failed,
+            "retries": self.retries,
+            "latency_avg_seconds": self.latency_total / self.latency_count if self.latency_count else 0.0,
+            "latency_max_seconds": self.latency_max,
+        }
+
+
+outbound_scheduler = OutboundScheduler()
@@ -1,25 +1,188 @@
-from datetime import datetime
-from typing import Dict
+import os
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+from whatsapp_bot.app.services.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+
+class SessionBackend:
+    """Async storage for per-phone-number session records."""
+
+    async def load(self, phone_number: str) -> Optional[Dict]:
+        raise NotImplementedError
+
+    async def save(self, phone_number: str, record: Dict):
+        raise NotImplementedError
+
+    async def delete(self, phone_number: str):
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+    def stats(self) -> Dict:
+        return {}
+
+
+class InMemorySessionBackend(SessionBackend):
+    """Process-local store bounded by ``max_size`` with idle TTL eviction."""
+
+    def __init__(self, max_size: int, ttl: float):
+        self._sessions = TTLCache(max_size=max_size, ttl=ttl)
+
+    async def load(self, phone_number: str) -> Optional[Dict]:
+        return self._sessions.get(phone_number)
+
+    async def save(self, phone_number: str, record: Dict):
+        # Re-setting the entry restarts its idle TTL
+        self._sessions.set(phone_number, record)
+
+    async def delete(self, phone_number: str):
+        self._sessions.pop(phone_number)
+
+    def stats(self) -> Dict:
+        return self._sessions.stats()
+
+
+class SQLiteSessionBackend(SessionBackend):
+    """
+    SQLite-backed store. Sessions survive restarts and are shared by every
+    uvicorn worker on the host.
+    """
+
+    def __init__(self, path: str, ttl: float, max_size: int):
+        self.path = path
+        self.ttl = ttl
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "phone_number TEXT PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS sessions_updated_at ON sessions (updated_at)")
+        self._writes = 0
+
+    def _load(self, phone_number: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM sessions WHERE phone_number = ? AND updated_at >= ?",
+                (phone_number, time.time() - self.ttl)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _save(self, phone_number: str, record: Dict):
+        now = time.time()
+        data = json.dumps(record, separators=(",", ":"), default=str)
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO sessions (phone_number, data, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(phone_number) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at",
+                (phone_number, data, now)
+            )
+            self._writes += 1
+            if self._writes % 500 == 0:
+                self._evict(now)
+
+    def _evict(self, now: float):
+        self._conn.execute("DELETE FROM sessions WHERE updated_at < ?", (now - self.ttl,))
+        # Beyond max_size, drop the least recently active sessions
+        self._conn.execute(
+            "DELETE FROM sessions WHERE phone_number IN ("
+            "SELECT phone_number FROM sessions ORDER BY updated_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_size,)
+        )
+
+    def _delete(self, phone_number: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM sessions WHERE phone_number = ?", (phone_number,))
+
+    async def load(self, phone_number: str) -> Optional[Dict]:
+        return await asyncio.to_thread(self._load, phone_number)
+
+    async def save(self, phone_number: str, record: Dict):
+        await asyncio.to_thread(self._save, phone_number, record)
+
+    async def delete(self, phone_number: str):
+        await asyncio.to_thread(self._delete, phone_number)
+
+    async def close(self):
+        self._conn.close()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            size = self._conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+        return {"size": size, "max_size": self.max_size}
+
 
 class SessionManager:
-    def __init__(self):
-        self.sessions: Dict[str, Dict] = {}
+    """Process-wide session store on top of a pluggable ``SessionBackend``."""
+
+    def __init__(self, backend: SessionBackend, max_context: int = 20):
+        self.backend = backend
+        self.max_context = max_context
 
-    def get_session(self, phone_number: str) -> Dict:
-        if phone_number not in self.sessions:
-            self.sessions[phone_number] = {
+    async def get_session(self, phone_number: str) -> Dict:
+        session = await self.backend.load(phone_number)
+        if session is None:
+            session = {
                 "phone_number": phone_number,
-                "start_time": datetime.now(),
+                "start_time": time.time(),
                 "context": [],
                 "last_message": None
             }
-        return self.sessions[phone_number]
+        return session
 
-    def update_context(self, phone_number: str, message: str, role: str = "user"):
-        session = self.get_session(phone_number)
+    async def save_session(self, phone_number: str, session: Dict):
+        await self.backend.save(phone_number, self._compact(session))
+
+    async def end_session(self, phone_number: str):
+        await self.backend.delete(phone_number)
+
+    async def update_context(self, phone_number: str, message: str, role: str = "user"):
+        session = await self.get_session(phone_number)
         session["context"].append({
             "role": role,
             "content": message,
-            "timestamp": datetime.now().isoformat()
+            "timestamp": time.time()
         })
-        session["last_message"] = datetime.now()
+        session["last_message"] = time.time()
+        await self.save_session(phone_number, session)
+
+    def _compact(self, session: Dict) -> Dict:
+        """Drop empty fields and keep only the most recent context entries."""
+        record = {key: value for key, value in session.items() if value is not None}
+        if len(record.get("context", [])) > self.max_context:
+            record["context"] = record["context"][-self.max_context:]
+        return record
+
+    def stats(self) -> Dict:
+        return {"backend": type(self.backend).__name__, **self.backend.stats()}
+
+
+def create_session_manager() -> SessionManager:
+    """Build the session manager configured by SESSION_BACKEND (memory or sqlite)."""
+    ttl = float(os.getenv("SESSION_TTL_SECONDS", "86400"))
+    max_size = int(os.getenv("SESSION_MAX_SIZE", "10000"))
+    max_context = int(os.getenv("SESSION_MAX_CONTEXT", "20"))
+    backend_name = os.getenv("SESSION_BACKEND", "memory").lower()
+
+    if backend_name == "sqlite":
+        path = os.getenv("SESSION_SQLITE_PATH", "whatsapp_sessions.sqlite3")
+        backend = SQLiteSessionBackend(path, ttl=ttl, max_size=max_size)
+        logger.info("Using SQLite session store at %s", path)
+    else:
+        backend = InMemorySessionBackend(max_size=max_size, ttl=ttl)
+
+    return SessionManager(backend, max_context=max_context)
+
+
+session_manager = create_session_manager()
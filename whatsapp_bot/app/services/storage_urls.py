@@ -0,0 +1,79 @@
+import os
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional
+
+from whatsapp_bot.app.services.cache import TTLCache
+from whatsapp_bot.app.services.executor import run_blocking
+from whatsapp_bot.app.services.metrics import timed
+
+logger = logging.getLogger(__name__)
+
+URL_MODES = ("legacy", "public", "signed")
+
+# V4 signed URLs are valid for at most seven days
+SIGNED_URL_TTL = min(int(os.getenv("STORAGE_SIGNED_URL_TTL", str(7 * 24 * 3600))), 7 * 24 * 3600)
+
+# A cached URL is handed out only during the first half of its life, so
+# whoever receives it still has at least half the TTL to use it
+_signed_urls = TTLCache(
+    max_size=int(os.getenv("STORAGE_SIGNED_URL_CACHE", "10000")),
+    ttl=SIGNED_URL_TTL / 2
+)
+
+
+def url_mode() -> str:
+    """
+    How stored objects are made reachable (STORAGE_URL_MODE):
+
+    - ``legacy``: ``make_public`` on every blob, one extra Storage request each
+    - ``public``: the bucket grants public read through uniform bucket-level
+      access, so the object's URL is simply derived from its path
+    - ``signed``: V4 signed URLs, signed locally with the service account key
+    """
+    mode = os.getenv("STORAGE_URL_MODE", "legacy").lower()
+    if mode not in URL_MODES:
+        logger.warning("Unknown STORAGE_URL_MODE %r, using legacy", mode)
+        return "legacy"
+    return mode
+
+
+def signed_url(blob) -> Dict:
+    """
+    A cached V4 signed GET URL for ``blob``. Signing uses the service
+    account's private key in-process, so there is no network round trip.
+    """
+    # The app writes to a single bucket, so the object name is enough
+    fields = _signed_urls.get(blob.name)
+    if fields is None:
+        expires_at = datetime.now(timezone.utc) + timedelta(seconds=SIGNED_URL_TTL)
+        url = blob.generate_signed_url(version="v4", expiration=timedelta(seconds=SIGNED_URL_TTL), method="GET")
+        fields = {"storageUrl": url, "storageUrlExpiresAt": expires_at}
+        _signed_urls.set(blob.name, fields)
+    return fields
+
+
+async def blob_url(blob) -> Dict:
+    """
+    URL fields for a freshly uploaded blob: ``storageUrl``, plus
+    ``storageUrlExpiresAt`` for signed URLs. Only ``legacy`` mode makes a
+    network call.
+    """
+    mode = url_mode()
+    if mode == "signed":
+        return signed_url(blob)
+    if mode == "legacy":
+        with timed("make_public"):
+            await run_blocking(blob.make_public)
+    return {"storageUrl": blob.public_url}
+
+
+def refresh_url(bucket, storage_path: Optional[str], storage_url: Optional[str]) -> Optional[str]:
+    """The URL to hand out for an already stored object; signed URLs are re-issued from its path."""
+    if storage_path and url_mode() == "signed":
+        return signed_url(bucket.blob(storage_path))["storageUrl"]
+    return storage_url
+
+
+def signed_url_stats() -> Dict:
+    return _signed_urls.stats()
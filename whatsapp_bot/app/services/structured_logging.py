@@ -0,0 +1,215 @@
+import os
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import re
+import sys
+import time
+from typing import Dict, Optional
+
+from whatsapp_bot.app.services.tracing import tracer
+
+# Payload fields that carry phone numbers, message content or credentials
+REDACTED_KEYS = frozenset({
+    "from", "wa_id", "to", "recipient", "phone", "phone_number", "contactNumber", "input",
+    "body", "caption", "text", "url", "Authorization", "access_token",
+})
+# Standalone runs of 8+ digits (optionally with a leading +) are treated as phone numbers;
+# digits inside identifiers such as message ids are left alone
+_PHONE_NUMBER = re.compile(r"(?<!\w)\+?\d{8,}(?!\w)")
+
+# Attributes every LogRecord has; anything else on a record came in through ``extra``
+_RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "event", "trace_id", "span_id"}
+
+TEXT_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+
+def mask_phone_numbers(text: str) -> str:
+    """Keep the last four digits of anything that looks like a phone number."""
+    return _PHONE_NUMBER.sub(lambda match: "*" * (len(match.group()) - 4) + match.group()[-4:], text)
+
+
+def redact(value, max_length: int, key: Optional[str] = None):
+    """Copy of a log payload with sensitive fields masked and long strings cut."""
+    if isinstance(value, dict):
+        return {k: redact(v, max_length, k) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [redact(v, max_length) for v in value]
+    if key in REDACTED_KEYS and value is not None:
+        if isinstance(value, str) and _PHONE_NUMBER.fullmatch(value):
+            return mask_phone_numbers(value)
+        return "[REDACTED]"
+    if isinstance(value, str):
+        value = mask_phone_numbers(value)
+        if len(value) > max_length:
+            return value[:max_length] + f"...[{len(value) - max_length} more]"
+    return value
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per record: timestamp, level, logger, message, the
+    ``event`` name, trace ids and any ``extra`` fields, redacted.
+
+    Runs on the listener thread, so building the message and serializing
+    the payload stay off the event loop.
+    """
+
+    def __init__(self, max_field_length: int = 512):
+        super().__init__()
+        self.max_field_length = max_field_length
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": redact(record.getMessage(), self.max_field_length),
+        }
+        for field in ("event", "trace_id", "span_id"):
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith("_"):
+                entry[key] = redact(value, self.max_field_length, key)
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """The plain format used so far, with phone numbers masked in the message."""
+
+    def __init__(self):
+        super().__init__(TEXT_FORMAT)
+
+    def formatMessage(self, record: logging.LogRecord) -> str:
+        record.message = mask_phone_numbers(record.message)
+        return super().formatMessage(record)
+
+
+def parse_sample_rates(spec: str) -> Dict[str, float]:
+    """Parse ``LOG_SAMPLE_RATES``, e.g. ``"graph.sent=0.01,message.text=0.1"``."""
+    rates = {}
+    for item in spec.split(","):
+        event, _, rate = item.partition("=")
+        if event.strip() and rate.strip():
+            rates[event.strip()] = max(0.0, min(1.0, float(rate)))
+    return rates
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keep only a fraction of the records for high-volume events.
+
+    Records are matched on their ``event`` field; records without one, and
+    anything at WARNING or above, are always kept.
+    """
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates = rates
+        self.dropped = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self.rates.get(getattr(record, "event", None))
+        if rate is None or random.random() < rate:
+            return True
+        self.dropped += 1
+        return False
+
+
+class ContextQueueHandler(logging.handlers.QueueHandler):
+    """
+    Hand records to the listener thread without formatting them.
+
+    The default ``prepare`` formats the message on the calling thread;
+    here only the trace context, which lives in a context variable and is
+    gone by the time the listener runs, is captured. Records are dropped
+    (and counted) rather than blocking when the queue is full.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        context = tracer.current_context()
+        if context is not None:
+            record.trace_id = context.trace_id
+            record.span_id = context.span_id
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_output: Optional[logging.Handler] = None
+_queue_handler: Optional[ContextQueueHandler] = None
+_sampling_filter: Optional[SamplingFilter] = None
+
+
+def configure_logging():
+    """
+    Route all logging through a queue to a background writer thread.
+
+    LOG_FORMAT selects ``json`` or ``text`` output on stderr, LOG_LEVEL the
+    root level, LOG_SAMPLE_RATES per-event sampling, LOG_MAX_FIELD_LENGTH
+    where JSON fields are truncated and LOG_QUEUE_SIZE how many records may
+    wait for the writer. Calling it again is a no-op.
+    """
+    global _listener, _output, _queue_handler, _sampling_filter
+    if _listener is not None:
+        return
+
+    if os.getenv("LOG_FORMAT", "text").strip().lower() == "json":
+        formatter = JsonFormatter(int(os.getenv("LOG_MAX_FIELD_LENGTH", "512")))
+    else:
+        formatter = TextFormatter()
+    _output = logging.StreamHandler(sys.stderr)
+    _output.setFormatter(formatter)
+
+    _queue_handler = ContextQueueHandler(queue.Queue(maxsize=int(os.getenv("LOG_QUEUE_SIZE", "10000"))))
+    _sampling_filter = SamplingFilter(parse_sample_rates(os.getenv("LOG_SAMPLE_RATES", "")))
+    # Filtered before enqueueing, so sampled-out records cost nothing downstream
+    _queue_handler.addFilter(_sampling_filter)
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_queue_handler)
+    root.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+
+    _listener = logging.handlers.QueueListener(_queue_handler.queue, _output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging():
+    """Write out queued records and stop the writer thread; later records are written directly."""
+    global _listener
+    if _listener is None:
+        return
+    _listener.stop()
+    _listener = None
+    root = logging.getLogger()
+    root.removeHandler(_queue_handler)
+    root.addHandler(_output)
+
+
+def logging_stats() -> Dict:
+    return {
+        "queued": _queue_handler.queue.qsize() if _queue_handler else 0,
+        "dropped_full": _queue_handler.dropped if _queue_handler else 0,
+        "sampled_out": _sampling_filter.dropped if _sampling_filter else 0,
+    }
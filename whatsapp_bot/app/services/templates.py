@@ -0,0 +1,167 @@
+import json
+from typing import Dict, Iterable, List, Tuple
+
+from whatsapp_bot.app.services.cache import TTLCache
+
+# Stand-in for the recipient while a payload is serialized; it is swapped for
+# the real number on every render.
+_TO_PLACEHOLDER = "__recipient_placeholder__"
+_TO_TOKEN = json.dumps(_TO_PLACEHOLDER).encode("utf-8")
+
+SERVICE_MENU_SECTIONS = [
+    {
+        "title": "Product Services",
+        "rows": [
+            {
+                "id": "upload_product_images",
+                "title": "Upload Product Images",
+                "description": "Upload images for your AMD products"
+            },
+            {
+                "id": "request_new_product",
+                "title": "Request a New Product",
+                "description": "Request to add a new AMD product to your inventory"
+            }
+        ]
+    },
+    {
+        "title": "Support Services",
+        "rows": [
+            {
+                "id": "technical_support",
+                "title": "Technical Support",
+                "description": "Get technical assistance for AMD products"
+            },
+            {
+                "id": "order_status",
+                "title": "Order Status",
+                "description": "Check the status of your orders"
+            }
+        ]
+    }
+]
+
+
+def _serialize(payload: Dict) -> bytes:
+    # Same encoding httpx uses for ``json=`` bodies
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":"), allow_nan=False).encode("utf-8")
+
+
+def build_service_menu_payload(to: str, header_text: str) -> Dict:
+    """Interactive list message with the service menu."""
+    return {
+        "messaging_product": "whatsapp",
+        "recipient_type": "individual",
+        "to": to,
+        "type": "interactive",
+        "interactive": {
+            "type": "list",
+            "header": {
+                "type": "text",
+                "text": header_text
+            },
+            "body": {
+                "text": "Please select a service from the list below:"
+            },
+            "footer": {
+                "text": "AMD Partner Services"
+            },
+            "action": {
+                "button": "View Services",
+                "sections": SERVICE_MENU_SECTIONS
+            }
+        }
+    }
+
+
+def build_button_payload(to: str, message_text: str, buttons: Iterable[Dict]) -> Dict:
+    """Interactive reply-button message."""
+    formatted_buttons = []
+    for button in buttons:
+        formatted_buttons.append({
+            "type": "reply",
+            "reply": {
+                "id": button.get("id", ""),
+                "title": button.get("title", "")
+            }
+        })
+
+    return {
+        "messaging_product": "whatsapp",
+        "recipient_type": "individual",
+        "to": to,
+        "type": "interactive",
+        "interactive": {
+            "type": "button",
+            "body": {
+                "text": message_text
+            },
+            "action": {
+                "buttons": formatted_buttons
+            }
+        }
+    }
+
+
+class PayloadTemplate:
+    """
+    A message payload serialized once, with only the ``to`` field filled in per send.
+    """
+
+    __slots__ = ("name", "_prefix", "_suffix")
+
+    def __init__(self, name: str, payload: Dict):
+        if payload.get("to") != _TO_PLACEHOLDER:
+            raise ValueError("Template payloads must use the recipient placeholder for 'to'")
+
+        serialized = _serialize(payload)
+        if serialized.count(_TO_TOKEN) != 1:
+            raise ValueError(f"Template {name} must contain the recipient placeholder exactly once")
+
+        self.name = name
+        self._prefix, self._suffix = serialized.split(_TO_TOKEN)
+
+    def render(self, to: str) -> bytes:
+        return b"".join((self._prefix, json.dumps(to).encode("utf-8"), self._suffix))
+
+
+class TemplateRegistry:
+    """
+    Pre-serialized interactive payloads.
+
+    Service menus (one per header) and button sets are compiled on first
+    use and kept in a bounded cache, so the handful of payloads the bot
+    sends thousands of times a day are serialized only once.
+    """
+
+    def __init__(self, max_size: int = 512):
+        self._compiled = TTLCache(max_size=max_size, ttl=None)
+
+    def service_menu(self, header_text: str) -> PayloadTemplate:
+        key = ("service_menu", header_text)
+        template = self._compiled.get(key)
+        if template is None:
+            template = PayloadTemplate(
+                f"service_menu:{header_text}",
+                build_service_menu_payload(_TO_PLACEHOLDER, header_text)
+            )
+            self._compiled.set(key, template)
+        return template
+
+    def buttons(self, message_text: str, buttons: List[Dict]) -> PayloadTemplate:
+        button_key: Tuple = tuple((button.get("id", ""), button.get("title", "")) for button in buttons)
+        key = ("buttons", message_text, button_key)
+        template = self._compiled.get(key)
+        if template is None:
+            template = PayloadTemplate(
+                f"buttons:{message_text}",
+                build_button_payload(_TO_PLACEHOLDER, message_text, buttons)
+            )
+            self._compiled.set(key, template)
+        return template
+
+    def stats(self) -> Dict:
+        return self._compiled.stats()
+
+
+template_registry = TemplateRegistry()
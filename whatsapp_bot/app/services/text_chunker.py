@@ -0,0 +1,77 @@
+import re
+from typing import List, Optional
+
+# WhatsApp Cloud API limit for a text message body
+WHATSAPP_TEXT_LIMIT = 4096
+
+_SENTENCE_END = re.compile(r"[.!?](?=\s)")
+
+
+class StreamChunker:
+    """
+    Splits streamed model output into WhatsApp-sized messages.
+
+    The first message goes out at the first sentence boundary so the partner
+    sees something quickly. Later messages are cut at paragraph breaks once
+    they reach ``min_length``, or at the last sentence (then word) boundary
+    before ``max_length`` when a paragraph runs too long.
+    """
+
+    def __init__(self, max_length: int = WHATSAPP_TEXT_LIMIT, min_length: int = 300):
+        self.max_length = max_length
+        self.min_length = min_length
+        self._buffer = ""
+        self._emitted = 0
+
+    def feed(self, text: str) -> List[str]:
+        """Add streamed text and return the messages that are ready to send."""
+        self._buffer += text
+        chunks = []
+        while True:
+            chunk = self._next_chunk()
+            if chunk is None:
+                return chunks
+            chunks.append(chunk)
+
+    def flush(self) -> List[str]:
+        """Return whatever is left once the stream has ended."""
+        chunks = []
+        while len(self._buffer) > self.max_length:
+            chunks.append(self._take(self._cut_point(self._buffer[:self.max_length])))
+        rest = self._buffer.strip()
+        self._buffer = ""
+        if rest:
+            chunks.append(rest)
+            self._emitted += 1
+        return chunks
+
+    def _take(self, end: int) -> str:
+        chunk, self._buffer = self._buffer[:end].strip(), self._buffer[end:]
+        self._emitted += 1
+        return chunk
+
+    def _cut_point(self, window: str) -> int:
+        sentences = [match.end() for match in _SENTENCE_END.finditer(window)]
+        if sentences:
+            return sentences[-1]
+        space = window.rfind(" ")
+        return space if space > 0 else len(window)
+
+    def _next_chunk(self) -> Optional[str]:
+        buffer = self._buffer
+        if not buffer.strip():
+            return None
+
+        if not self._emitted:
+            first_sentence = _SENTENCE_END.search(buffer)
+            if first_sentence and first_sentence.end() <= self.max_length:
+                return self._take(first_sentence.end())
+
+        paragraph = buffer.find("\n\n", self.min_length)
+        if paragraph != -1 and paragraph <= self.max_length:
+            return self._take(paragraph)
+
+        if len(buffer) > self.max_length:
+            return self._take(self._cut_point(buffer[:self.max_length]))
+
+        return None
@@ -0,0 +1,314 @@
+import os
+import contextvars
+import importlib
+import json
+import logging
+import random
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_TRACEPARENT = re.compile(r"^([0-9a-f]{2})-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+_INVALID_TRACE_ID = "0" * 32
+_INVALID_SPAN_ID = "0" * 16
+
+
+class SpanContext:
+    """The part of a span that crosses process boundaries (W3C trace context)."""
+
+    __slots__ = ("trace_id", "span_id", "sampled", "remote")
+
+    def __init__(self, trace_id: str, span_id: str, sampled: bool, remote: bool = False):
+        self.trace_id = trace_id
+        self.span_id = span_id
+        self.sampled = sampled
+        self.remote = remote
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+
+def parse_traceparent(header: Optional[str]) -> Optional[SpanContext]:
+    """Parse a ``traceparent`` header; invalid or unsupported values are ignored."""
+    if not header:
+        return None
+    match = _TRACEPARENT.match(header.strip().lower())
+    if not match:
+        return None
+    version, trace_id, span_id, flags = match.groups()
+    if version == "ff" or trace_id == _INVALID_TRACE_ID or span_id == _INVALID_SPAN_ID:
+        return None
+    return SpanContext(trace_id, span_id, sampled=bool(int(flags, 16) & 0x01), remote=True)
+
+
+class Span:
+    """
+    A timed operation within a trace.
+
+    Spans that were not sampled still carry ids, so the trace context keeps
+    propagating, but record nothing and are never exported.
+    """
+
+    __slots__ = ("tracer", "name", "context", "parent_id", "start_ns", "end_ns", "attributes", "events", "status", "error")
+
+    def __init__(self, tracer: "Tracer", name: str, context: SpanContext, parent_id: Optional[str], attributes: Optional[Dict]):
+        self.tracer = tracer
+        self.name = name
+        self.context = context
+        self.parent_id = parent_id
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes = dict(attributes) if attributes and context.sampled else {}
+        self.events: List[Dict] = []
+        self.status = "UNSET"
+        self.error: Optional[str] = None
+
+    @property
+    def recording(self) -> bool:
+        return self.context.sampled and self.end_ns is None
+
+    def set_attribute(self, key: str, value: Any):
+        if self.recording:
+            self.attributes[key] = value
+
+    def add_event(self, name: str, **attributes):
+        if self.recording:
+            self.events.append({"name": name, "time_ns": time.time_ns(), "attributes": attributes})
+
+    def record_exception(self, exc: BaseException):
+        if self.recording:
+            self.status = "ERROR"
+            self.error = f"{type(exc).__name__}: {exc}"
+
+    def end(self):
+        if self.end_ns is not None:
+            return
+        self.end_ns = time.time_ns()
+        if self.context.sampled:
+            if self.status == "UNSET":
+                self.status = "OK"
+            self.tracer._on_end(self)
+
+    def to_dict(self) -> Dict:
+        return {
+            "name": self.name,
+            "trace_id": self.context.trace_id,
+            "span_id": self.context.span_id,
+            "parent_id": self.parent_id,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": (self.end_ns - self.start_ns) / 1e6 if self.end_ns else None,
+            "status": self.status,
+            "error": self.error,
+            "attributes": self.attributes,
+            "events": self.events,
+        }
+
+
+class SpanExporter:
+    """Receives finished, sampled spans in batches."""
+
+    def export(self, spans: List[Span]):
+        raise NotImplementedError
+
+    def shutdown(self):
+        pass
+
+
+class ConsoleSpanExporter(SpanExporter):
+    """One JSON object per span on stdout."""
+
+    def export(self, spans: List[Span]):
+        sys.stdout.write("".join(json.dumps(span.to_dict(), default=str) + "\n" for span in spans))
+        sys.stdout.flush()
+
+
+class FileSpanExporter(SpanExporter):
+    """Appends spans as JSON lines to a local file, for offline inspection."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "a", encoding="utf-8")
+
+    def export(self, spans: List[Span]):
+        self._file.write("".join(json.dumps(span.to_dict(), default=str) + "\n" for span in spans))
+        self._file.flush()
+
+    def shutdown(self):
+        self._file.close()
+
+
+class TraceIdRatioSampler:
+    """
+    Samples a fixed fraction of traces, decided once per trace from its id.
+
+    Child spans, including spans continuing a remote parent, follow their
+    parent's decision, so a trace is either complete or absent.
+    """
+
+    def __init__(self, ratio: float):
+        self.ratio = max(0.0, min(1.0, ratio))
+        self._bound = int(self.ratio * (1 << 64))
+
+    def should_sample(self, trace_id: str, parent: Optional[SpanContext]) -> bool:
+        if parent is not None:
+            return parent.sampled
+        return int(trace_id[16:], 16) < self._bound
+
+
+_current: contextvars.ContextVar[Optional[SpanContext]] = contextvars.ContextVar("current_span", default=None)
+
+
+class Tracer:
+    """
+    Creates spans and hands the sampled ones to an exporter.
+
+    The current span lives in a context variable, so children attach to the
+    right parent across ``await`` points and in tasks that copy the context.
+    Finished spans are buffered and exported ``batch_size`` at a time, and
+    the rest are exported on ``flush``. With no exporter configured, tracing
+    is disabled: every span is unsampled and ``timed`` skips spans entirely.
+    """
+
+    def __init__(self, exporter: Optional[SpanExporter] = None, sampler: Optional[TraceIdRatioSampler] = None, batch_size: int = 64):
+        self.exporter = exporter
+        self.sampler = sampler or TraceIdRatioSampler(1.0)
+        self.batch_size = batch_size
+        self._buffer: List[Span] = []
+        self._lock = threading.Lock()
+        self.exported = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.exporter is not None
+
+    def current_context(self) -> Optional[SpanContext]:
+        return _current.get()
+
+    def inject(self, headers: Optional[Dict] = None) -> Optional[Dict]:
+        """
+        Copy of ``headers`` carrying the current span as ``traceparent``, so
+        the callee can continue the trace. Outside a trace ``headers`` is
+        returned as is, and a ``traceparent`` set by the caller is kept.
+        """
+        context = _current.get()
+        if context is None:
+            return headers
+        headers = dict(headers or {})
+        if not any(key.lower() == "traceparent" for key in headers):
+            headers["traceparent"] = context.traceparent
+        return headers
+
+    def start_span(self, name: str, attributes: Optional[Dict] = None, parent: Optional[SpanContext] = None) -> Span:
+        """Start a span without making it current; the caller must ``end`` it."""
+        parent = parent if parent is not None else _current.get()
+        if parent is not None:
+            trace_id = parent.trace_id
+        else:
+            trace_id = f"{random.getrandbits(128):032x}"
+        sampled = self.enabled and self.sampler.should_sample(trace_id, parent)
+        context = SpanContext(trace_id, f"{random.getrandbits(64):016x}", sampled)
+        return Span(self, name, context, parent.span_id if parent else None, attributes)
+
+    def activate(self, span: Span) -> contextvars.Token:
+        """Make ``span`` the parent of spans started in this context until ``deactivate``."""
+        return _current.set(span.context)
+
+    def deactivate(self, token: contextvars.Token):
+        _current.reset(token)
+
+    @contextmanager
+    def span(self, name: str, attributes: Optional[Dict] = None, parent: Optional[SpanContext] = None):
+        """Start a span, make it current for the block and end it afterwards."""
+        span = self.start_span(name, attributes, parent)
+        token = self.activate(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.record_exception(e)
+            raise
+        finally:
+            self.deactivate(token)
+            span.end()
+
+    @contextmanager
+    def use_context(self, context: Optional[SpanContext]):
+        """Continue a trace from an extracted context (e.g. an inbound ``traceparent``)."""
+        if context is None:
+            yield
+            return
+        token = _current.set(context)
+        try:
+            yield
+        finally:
+            _current.reset(token)
+
+    def _on_end(self, span: Span):
+        with self._lock:
+            self._buffer.append(span)
+            if len(self._buffer) < self.batch_size:
+                return
+            batch, self._buffer = self._buffer, []
+        self._export(batch)
+
+    def _export(self, batch: List[Span]):
+        try:
+            self.exporter.export(batch)
+            self.exported += len(batch)
+        except Exception as e:
+            logger.error("Failed to export %s spans: %s", len(batch), e)
+
+    def flush(self):
+        with self._lock:
+            batch, self._buffer = self._buffer, []
+        if batch and self.exporter is not None:
+            self._export(batch)
+
+    def shutdown(self):
+        self.flush()
+        if self.exporter is not None:
+            self.exporter.shutdown()
+
+    def stats(self) -> Dict:
+        return {
+            "enabled": self.enabled,
+            "sample_ratio": self.sampler.ratio,
+            "buffered": len(self._buffer),
+            "exported": self.exported,
+        }
+
+
+def _load_exporter(name: str) -> Optional[SpanExporter]:
+    if name in ("", "none"):
+        return None
+    if name == "console":
+        return ConsoleSpanExporter()
+    if name == "file":
+        return FileSpanExporter(os.getenv("TRACE_FILE", "traces.jsonl"))
+    # Any other exporter is given as "package.module:factory"
+    module_name, _, attribute = name.partition(":")
+    return getattr(importlib.import_module(module_name), attribute or "exporter")()
+
+
+def create_tracer() -> Tracer:
+    """Build the tracer configured by TRACE_EXPORTER (none, console, file or module:factory) and TRACE_SAMPLE_RATIO."""
+    name = os.getenv("TRACE_EXPORTER", "none").strip()
+    try:
+        exporter = _load_exporter(name)
+    except Exception as e:
+        logger.error("Could not load trace exporter %r, tracing disabled: %s", name, e)
+        exporter = None
+    return Tracer(
+        exporter=exporter,
+        sampler=TraceIdRatioSampler(float(os.getenv("TRACE_SAMPLE_RATIO", "1.0"))),
+        batch_size=int(os.getenv("TRACE_BATCH_SIZE", "64")),
+    )
+
+
+tracer = create_tracer()
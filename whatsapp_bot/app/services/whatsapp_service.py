@@ -3,7 +3,12 @@ import httpx
 import logging
 import base64
 import json
-from firebase_admin import credentials, initialize_app, firestore
+from typing import Dict
+from whatsapp_bot.app.services.http_client import GRAPH_API_BASE_URL, MEDIA_TIMEOUT, get_http_client
+from whatsapp_bot.app.services.media_pipeline import reported_size
+from whatsapp_bot.app.services.send_scheduler import PRIORITY_INTERACTIVE, outbound_scheduler
+from whatsapp_bot.app.services.templates import template_registry
+from whatsapp_bot.app.services.metrics import timed
 
 logger = logging.getLogger(__name__)
 
@@ -18,12 +23,21 @@ logger = logging.getLogger(__name__)
 #     raise ValueError("Firebase credentials not found.")
 
 
-async def send_whatsapp_message(to: str, message: str):
+def _log_sent(message_kind: str, data: Dict):
+    # One per outbound message: DEBUG with the message id only, not the response payload
+    if logger.isEnabledFor(logging.DEBUG):
+        message_id = ((data.get("messages") or [{}])[0]).get("id")
+        logger.debug(
+            "Sent %s message %s", message_kind, message_id,
+            extra={"event": "graph.sent", "message_kind": message_kind, "message_id": message_id}
+        )
+
+async def send_whatsapp_message(to: str, message: str, priority: int = PRIORITY_INTERACTIVE):
     """Send message to WhatsApp"""
     phone_number_id = os.getenv("WHATSAPP_PHONE_NUMBER_ID")
     api_key = os.getenv("WHATSAPP_API_KEY")
 
-    url = f"https://graph.facebook.com/v17.0/{phone_number_id}/messages"
+    url = f"{GRAPH_API_BASE_URL}/{phone_number_id}/messages"
 
     headers = {
         "Authorization": f"Bearer {api_key}",
@@ -38,109 +52,71 @@ async def send_whatsapp_message(to: str, message: str):
     }
 
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(url, json=data, headers=headers)
+        with timed("graph_send", message_kind="text") as stage:
+            response = await outbound_scheduler.send(
+                url, headers, sender_id=phone_number_id, recipient=to, json=data, priority=priority
+            )
+            stage.set_attribute("status_code", response.status_code)
             response.raise_for_status()
-            logger.info(f"WhatsApp API response: {response.json()}")
-            return response.json()
+        data = response.json()
+        _log_sent("text", data)
+        return data
 
     except httpx.HTTPStatusError as e:
-        logger.error(f"WhatsApp API error: {e.response.status_code} - {e.response.text}")
+        logger.error(
+            "WhatsApp API error: %s", e.response.status_code,
+            extra={"event": "graph.error", "message_kind": "text", "status_code": e.response.status_code, "response": e.response.text}
+        )
         return {"status": "error", "message": "WhatsApp API request failed"}
 
     except Exception as e:
-        logger.error(f"Unexpected error sending WhatsApp message: {e}")
+        logger.error("Unexpected error sending WhatsApp message: %s", e, extra={"event": "graph.error", "message_kind": "text"})
         return {"status": "error", "message": "Unexpected error"}
 
 
-async def send_service_menu(to: str, header_text: str = "Available Services"):
+async def send_service_menu(to: str, header_text: str = "Available Services", priority: int = PRIORITY_INTERACTIVE):
     """Send an interactive list message with service options"""
     phone_number_id = os.getenv("WHATSAPP_PHONE_NUMBER_ID")
     api_key = os.getenv("WHATSAPP_API_KEY")
 
-    url = f"https://graph.facebook.com/v17.0/{phone_number_id}/messages"
+    url = f"{GRAPH_API_BASE_URL}/{phone_number_id}/messages"
 
     headers = {
         "Authorization": f"Bearer {api_key}",
         "Content-Type": "application/json"
     }
 
-    data = {
-        "messaging_product": "whatsapp",
-        "recipient_type": "individual",
-        "to": to,
-        "type": "interactive",
-        "interactive": {
-            "type": "list",
-            "header": {
-                "type": "text",
-                "text": header_text
-            },
-            "body": {
-                "text": "Please select a service from the list below:"
-            },
-            "footer": {
-                "text": "AMD Partner Services"
-            },
-            "action": {
-                "button": "View Services",
-                "sections": [
-                    {
-                        "title": "Product Services",
-                        "rows": [
-                            {
-                                "id": "upload_product_images",
-                                "title": "Upload Product Images",
-                                "description": "Upload images for your AMD products"
-                            },
-                            {
-                                "id": "request_new_product",
-                                "title": "Request a New Product",
-                                "description": "Request to add a new AMD product to your inventory"
-                            }
-                        ]
-                    },
-                    {
-                        "title": "Support Services",
-                        "rows": [
-                            {
-                                "id": "technical_support",
-                                "title": "Technical Support",
-                                "description": "Get technical assistance for AMD products"
-                            },
-                            {
-                                "id": "order_status",
-                                "title": "Order Status",
-                                "description": "Check the status of your orders"
-                            }
-                        ]
-                    }
-                ]
-            }
-        }
-    }
+    # Pre-serialized payload; only the recipient is filled in
+    payload = template_registry.service_menu(header_text).render(to)
 
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(url, json=data, headers=headers)
+        with timed("graph_send", message_kind="service_menu") as stage:
+            response = await outbound_scheduler.send(
+                url, headers, sender_id=phone_number_id, recipient=to, content=payload, priority=priority
+            )
+            stage.set_attribute("status_code", response.status_code)
             response.raise_for_status()
-            logger.info(f"WhatsApp API response for service menu: {response.json()}")
-            return response.json()
+        data = response.json()
+        _log_sent("service_menu", data)
+        return data
 
     except httpx.HTTPStatusError as e:
-        logger.error(f"WhatsApp API error sending service menu: {e.response.status_code} - {e.response.text}")
+        logger.error(
+            "WhatsApp API error sending service menu: %s", e.response.status_code,
+            extra={"event": "graph.error", "message_kind": "service_menu", "status_code": e.response.status_code, "response": e.response.text}
+        )
         return {"status": "error", "message": "WhatsApp API request failed"}
 
     except Exception as e:
-        logger.error(f"Unexpected error sending service menu: {e}")
+        logger.error("Unexpected error sending service menu: %s", e, extra={"event": "graph.error", "message_kind": "service_menu"})
         return {"status": "error", "message": "Unexpected error"}
 
 
-async def send_whatsapp_media_message(to: str, media_id: str):
+async def send_whatsapp_media_message(to: str, media_id: str, priority: int = PRIORITY_INTERACTIVE):
     """Send media message to WhatsApp."""
     phone_number_id = os.getenv("WHATSAPP_PHONE_NUMBER_ID")
     api_key = os.getenv("WHATSAPP_API_KEY")
-    url = f"https://graph.facebook.com/v17.0/{phone_number_id}/messages"
+    url = f"{GRAPH_API_BASE_URL}/{phone_number_id}/messages"
 
     headers = {
         "Authorization": f"Bearer {api_key}",
@@ -154,63 +130,89 @@ async def send_whatsapp_media_message(to: str, media_id: str):
         "image": {"id": media_id}
     }
 
-    async with httpx.AsyncClient() as client:
-        response = await client.post(url, json=data, headers=headers)
+    with timed("graph_send", message_kind="image") as stage:
+        response = await outbound_scheduler.send(
+            url, headers, sender_id=phone_number_id, recipient=to, json=data, priority=priority
+        )
+        stage.set_attribute("status_code", response.status_code)
         response.raise_for_status()
-        return response.json()
+    return response.json()
 
-async def send_button_message(to: str, message_text: str, buttons: list):
+async def send_button_message(to: str, message_text: str, buttons: list, priority: int = PRIORITY_INTERACTIVE):
     """Send an interactive button message"""
     phone_number_id = os.getenv("WHATSAPP_PHONE_NUMBER_ID")
     api_key = os.getenv("WHATSAPP_API_KEY")
 
-    url = f"https://graph.facebook.com/v17.0/{phone_number_id}/messages"
+    url = f"{GRAPH_API_BASE_URL}/{phone_number_id}/messages"
 
     headers = {
         "Authorization": f"Bearer {api_key}",
         "Content-Type": "application/json"
     }
 
-    # Format buttons for WhatsApp API
-    formatted_buttons = []
-    for button in buttons:
-        formatted_buttons.append({
-            "type": "reply",
-            "reply": {
-                "id": button.get("id", ""),
-                "title": button.get("title", "")
-            }
-        })
+    # Pre-serialized payload, compiled once per distinct text and button set
+    payload = template_registry.buttons(message_text, buttons).render(to)
+
+    try:
+        with timed("graph_send", message_kind="buttons") as stage:
+            response = await outbound_scheduler.send(
+                url, headers, sender_id=phone_number_id, recipient=to, content=payload, priority=priority
+            )
+            stage.set_attribute("status_code", response.status_code)
+            response.raise_for_status()
+        data = response.json()
+        _log_sent("buttons", data)
+        return data
+
+    except httpx.HTTPStatusError as e:
+        logger.error(
+            "WhatsApp API error sending button message: %s", e.response.status_code,
+            extra={"event": "graph.error", "message_kind": "buttons", "status_code": e.response.status_code, "response": e.response.text}
+        )
+        return {"status": "error", "message": "WhatsApp API request failed"}
+
+    except Exception as e:
+        logger.error("Unexpected error sending button message: %s", e, extra={"event": "graph.error", "message_kind": "buttons"})
+        return {"status": "error", "message": "Unexpected error"}
+
+async def mark_as_read(to: str, message_id: str, typing_indicator: bool = True):
+    """Mark an inbound message as read and, optionally, show the typing indicator to the sender"""
+    phone_number_id = os.getenv("WHATSAPP_PHONE_NUMBER_ID")
+    api_key = os.getenv("WHATSAPP_API_KEY")
+
+    url = f"{GRAPH_API_BASE_URL}/{phone_number_id}/messages"
+
+    headers = {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json"
+    }
 
     data = {
         "messaging_product": "whatsapp",
-        "recipient_type": "individual",
-        "to": to,
-        "type": "interactive",
-        "interactive": {
-            "type": "button",
-            "body": {
-                "text": message_text
-            },
-            "action": {
-                "buttons": formatted_buttons
-            }
-        }
+        "status": "read",
+        "message_id": message_id
     }
+    if typing_indicator:
+        data["typing_indicator"] = {"type": "text"}
 
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(url, json=data, headers=headers)
+        with timed("graph_send", message_kind="read_receipt") as stage:
+            response = await outbound_scheduler.send(
+                url, headers, sender_id=phone_number_id, recipient=to, json=data, priority=PRIORITY_INTERACTIVE
+            )
+            stage.set_attribute("status_code", response.status_code)
             response.raise_for_status()
-            logger.info(f"WhatsApp API response for button message: {response.json()}")
-            return response.json()
+        return response.json()
 
     except httpx.HTTPStatusError as e:
-        logger.error(f"WhatsApp API error sending button message: {e.response.status_code} - {e.response.text}")
+        logger.error(
+            "WhatsApp API error marking message as read: %s", e.response.status_code,
+            extra={"event": "graph.error", "message_kind": "read_receipt", "status_code": e.response.status_code, "response": e.response.text}
+        )
         return {"status": "error", "message": "WhatsApp API request failed"}
 
     except Exception as e:
-        logger.error(f"Unexpected error sending button message: {e}")
+        logger.error("Unexpected error marking message as read: %s", e, extra={"event": "graph.error", "message_kind": "read_receipt"})
         return {"status": "error", "message": "Unexpected error"}
 
 async def get_media_url(media_id: str):
@@ -234,50 +236,57 @@ async def get_media_url(media_id: str):
                 "message": "Missing WhatsApp API configuration"
             }
 
-        url = f"https://graph.facebook.com/v17.0/{media_id}"
+        url = f"{GRAPH_API_BASE_URL}/{media_id}"
 
         headers = {
             "Authorization": f"Bearer {api_key}",
             "Content-Type": "application/json"
         }
 
-        logger.info(f"Requesting media URL for media_id: {media_id}")
-        async with httpx.AsyncClient(timeout=60.0) as client:  # Increase timeout
-            response = await client.get(url, headers=headers)
+        logger.debug("Requesting media URL for media_id %s", media_id)
+        client = get_http_client()
+        with timed("media_url"):
+            response = await client.get(url, headers=headers, timeout=MEDIA_TIMEOUT)
             response.raise_for_status()
 
-            media_data = response.json()
-            logger.info(f"Media data received: {media_data}")
-
-            media_url = media_data.get("url")
-            mime_type = media_data.get("mime_type", "image/jpeg")
-            file_size = media_data.get("file_size", 0)
+        media_data = response.json()
+        logger.debug("Media data received", extra={"event": "graph.media", "response": media_data})
 
-            if not media_url:
-                logger.error(f"Media URL not found in response: {media_data}")
-                return {
-                    "status": "error",
-                    "message": "Media URL not found in response"
-                }
+        media_url = media_data.get("url")
+        mime_type = media_data.get("mime_type", "image/jpeg")
+        # Sent as a number, but a string or a missing size must not fail the integrity check
+        file_size = reported_size(media_data.get("file_size"))
+        sha256 = media_data.get("sha256")
 
-            # Return the URL and additional metadata
+        if not media_url:
+            logger.error("Media URL not found in response", extra={"event": "graph.media_missing", "payload": media_data})
             return {
-                "status": "success",
-                "url": media_url,
-                "mime_type": mime_type,
-                "file_size": file_size,
-                "media_id": media_id
+                "status": "error",
+                "message": "Media URL not found in response"
             }
 
+        # Return the URL and additional metadata
+        return {
+            "status": "success",
+            "url": media_url,
+            "mime_type": mime_type,
+            "file_size": file_size,
+            "sha256": sha256,
+            "media_id": media_id
+        }
+
     except httpx.HTTPStatusError as e:
-        logger.error(f"WhatsApp API error getting media: {e.response.status_code} - {e.response.text}")
+        logger.error(
+            "WhatsApp API error getting media: %s", e.response.status_code,
+            extra={"event": "graph.error", "message_kind": "media", "status_code": e.response.status_code, "response": e.response.text}
+        )
         return {
             "status": "error",
             "message": f"WhatsApp API request failed: {e.response.status_code}"
         }
 
     except Exception as e:
-        logger.error(f"Unexpected error getting media URL: {e}")
+        logger.error("Unexpected error getting media URL: %s", e, extra={"event": "graph.error", "message_kind": "media"})
         return {
             "status": "error",
             "message": f"Unexpected error: {str(e)}"
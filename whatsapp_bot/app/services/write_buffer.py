@@ -0,0 +1,188 @@
+import os
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+from whatsapp_bot.app.services.executor import run_blocking
+from whatsapp_bot.app.services.metrics import timed
+
+logger = logging.getLogger(__name__)
+
+# Firestore rejects batches with more than 500 writes
+MAX_BATCH_WRITES = 500
+
+# (document reference, data, merge)
+Write = Tuple[Any, Dict, bool]
+
+
+class _Group:
+    __slots__ = ("writes", "future")
+
+    def __init__(self, writes: List[Write], future: asyncio.Future):
+        self.writes = writes
+        self.future = future
+
+
+class WriteBehindBuffer:
+    """
+    Collects Firestore writes and commits them together in ``WriteBatch``es.
+
+    ``submit`` queues a group of writes and returns a future that resolves
+    once the batch holding them is committed; callers that need durability
+    await it, the others just move on. A group is never split, so its writes
+    land atomically. A batch is committed when ``max_writes`` writes are
+    waiting or ``window`` seconds after the oldest one arrived, with up to
+    ``concurrency`` commits in flight. At most ``max_pending`` writes are
+    buffered; beyond that ``submit`` waits for room, so a slow Firestore
+    slows callers down instead of growing memory.
+    """
+
+    def __init__(
+        self,
+        client: Callable[[], Awaitable[Any]],
+        max_writes: Optional[int] = None,
+        window: Optional[float] = None,
+        max_pending: Optional[int] = None,
+        concurrency: Optional[int] = None,
+    ):
+        self.client = client
+        self.max_writes = min(MAX_BATCH_WRITES, max_writes or int(os.getenv("FIRESTORE_BATCH_SIZE", str(MAX_BATCH_WRITES))))
+        self.window = window if window is not None else float(os.getenv("FIRESTORE_BATCH_WINDOW", "0.05"))
+        self.max_pending = max_pending or int(os.getenv("FIRESTORE_WRITE_QUEUE", "5000"))
+        self.concurrency = concurrency or int(os.getenv("FIRESTORE_BATCH_CONCURRENCY", "4"))
+
+        self._groups: Deque[_Group] = deque()
+        self._queued_writes = 0
+        self._oldest: Optional[float] = None
+        self._room: Optional[asyncio.Condition] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._commits: Optional[asyncio.Semaphore] = None
+        self._in_flight: set = set()
+        self._flusher: Optional[asyncio.Task] = None
+        # Writes queued or being committed; bounded by max_pending
+        self._pending = 0
+
+        self.batches = 0
+        self.committed = 0
+        self.failed = 0
+
+    def _start(self):
+        if self._flusher is None or self._flusher.done():
+            self._room = asyncio.Condition()
+            self._wakeup = asyncio.Event()
+            self._commits = asyncio.Semaphore(self.concurrency)
+            self._flusher = asyncio.create_task(self._run())
+
+    async def submit(self, *writes: Write) -> asyncio.Future:
+        """Queue writes that must be committed together; the returned future resolves on commit."""
+        if not writes:
+            raise ValueError("Nothing to write")
+        if len(writes) > self.max_writes:
+            raise ValueError(f"A write group is limited to {self.max_writes} writes")
+        self._start()
+
+        async with self._room:
+            await self._room.wait_for(lambda: self._pending + len(writes) <= self.max_pending)
+            self._pending += len(writes)
+
+        future = asyncio.get_running_loop().create_future()
+        self._groups.append(_Group(list(writes), future))
+        self._queued_writes += len(writes)
+        if self._oldest is None:
+            self._oldest = time.monotonic()
+        self._wakeup.set()
+        return future
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            while self._groups:
+                if self._queued_writes < self.max_writes:
+                    delay = self._oldest + self.window - time.monotonic()
+                    if delay > 0:
+                        try:
+                            await asyncio.wait_for(self._wakeup.wait(), delay)
+                            self._wakeup.clear()
+                            continue
+                        except asyncio.TimeoutError:
+                            pass
+                await self._commits.acquire()
+                task = asyncio.create_task(self._commit(self._take_batch()))
+                self._in_flight.add(task)
+                task.add_done_callback(self._in_flight.discard)
+
+    def _take_batch(self) -> List[_Group]:
+        groups = []
+        size = 0
+        while self._groups and size + len(self._groups[0].writes) <= self.max_writes:
+            group = self._groups.popleft()
+            groups.append(group)
+            size += len(group.writes)
+        self._queued_writes -= size
+        self._oldest = time.monotonic() if self._groups else None
+        return groups
+
+    async def _commit(self, groups: List[_Group]):
+        writes = sum(len(group.writes) for group in groups)
+        try:
+            db = await self.client()
+            batch = db.batch()
+            for group in groups:
+                for reference, data, merge in group.writes:
+                    batch.set(reference, data, merge=merge)
+            with timed("firestore_batch", writes=writes):
+                await run_blocking(batch.commit)
+        except Exception as e:
+            self.failed += writes
+            logger.error("Failed to commit a batch of %s Firestore writes: %s", writes, e)
+            for group in groups:
+                if not group.future.done():
+                    group.future.set_exception(e)
+                    # Mark the exception as retrieved for callers that did not wait
+                    group.future.exception()
+        else:
+            self.batches += 1
+            self.committed += writes
+            for group in groups:
+                if not group.future.done():
+                    group.future.set_result(None)
+        finally:
+            self._commits.release()
+            async with self._room:
+                self._pending -= writes
+                self._room.notify_all()
+
+    async def flush(self):
+        """Commit everything queued so far and wait for it."""
+        if self._flusher is None:
+            return
+        futures = [group.future for group in self._groups]
+        # Skip the window for what is already queued
+        self._oldest = time.monotonic() - self.window
+        self._wakeup.set()
+        await asyncio.gather(*futures, *self._in_flight, return_exceptions=True)
+
+    async def close(self, timeout: float = 30.0):
+        """Flush and stop; used on shutdown."""
+        if self._flusher is None:
+            return
+        try:
+            await asyncio.wait_for(self.flush(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Firestore write buffer did not flush within %ss, %s writes dropped", timeout, self._queued_writes)
+        self._flusher.cancel()
+        await asyncio.gather(self._flusher, return_exceptions=True)
+        self._flusher = None
+
+    def stats(self) -> Dict:
+        return {
+            "queued": self._queued_writes,
+            "pending": self._pending,
+            "in_flight_batches": len(self._in_flight),
+            "batches": self.batches,
+            "committed": self.committed,
+            "failed": self.failed,
+        }